@@ -1,5 +1,31 @@
-import numpy as np
+import functools
 import itertools
+import numpy as np
+
+
+@functools.lru_cache(maxsize=16)
+def get_monomial_bases(im_shape, order, dtype=np.float64):
+    """
+    Compute powers 0 to order of the row and column coordinates of an image.
+    The polynomial surface is separable in rows and columns, so the bases
+    are all that is needed to evaluate it. Well crops in a plate mostly
+    share a shape, so bases are cached for the most recent shapes.
+    Returned arrays are read only since they are shared between calls.
+
+    :param tuple im_shape: Shape of image (height, width)
+    :param int order: Order of polynomial
+    :param type dtype: Data type of bases
+    :return np.array row_basis: Row coordinate powers (height, order + 1)
+    :return np.array col_basis: Column coordinate powers (width, order + 1)
+    """
+    powers = np.arange(order + 1)
+    row_basis = np.arange(im_shape[0], dtype=np.float64)[:, np.newaxis] ** powers
+    col_basis = np.arange(im_shape[1], dtype=np.float64)[:, np.newaxis] ** powers
+    row_basis = row_basis.astype(dtype)
+    col_basis = col_basis.astype(dtype)
+    row_basis.flags.writeable = False
+    col_basis.flags.writeable = False
+    return row_basis, col_basis
 
 
 class BackgroundEstimator2D:
@@ -8,13 +34,16 @@ class BackgroundEstimator2D:
     def __init__(self,
                  block_size=128,
                  order=2,
-                 normalize=True):
+                 normalize=True,
+                 dtype=np.float64):
         """
         Background images are estimated once per channel for 2D data
         :param int block_size: Size of blocks image will be divided into
         :param int order: Order of polynomial (default 2)
         :param bool normalize: Normalize surface by dividing by its mean
             for background correction (default True)
+        :param type dtype: Data type of background surface. Use np.float32
+            to halve memory use (default np.float64)
         """
 
         if block_size is None:
@@ -22,6 +51,7 @@ class BackgroundEstimator2D:
         self.block_size = block_size
         self.order = order
         self.normalize = normalize
+        self.dtype = np.dtype(dtype).type
 
     def sample_block_medians(self, im):
         """Subdivide a 2D image in smaller blocks of size block_size and
@@ -40,19 +70,27 @@ class BackgroundEstimator2D:
 
         nbr_blocks_x = im_shape[0] // self.block_size
         nbr_blocks_y = im_shape[1] // self.block_size
-        sample_coords = np.zeros((nbr_blocks_x * nbr_blocks_y, 2),
-                                 dtype=np.float64)
-        sample_values = np.zeros((nbr_blocks_x * nbr_blocks_y, ),
-                                 dtype=np.float64)
-        for x in range(nbr_blocks_x):
-            for y in range(nbr_blocks_y):
-                idx = y * nbr_blocks_x + x
-                sample_coords[idx, :] = [x * self.block_size + (self.block_size - 1) / 2,
-                                         y * self.block_size + (self.block_size - 1) / 2]
-                sample_values[idx] = np.median(
-                    im[x * self.block_size:(x + 1) * self.block_size,
-                       y * self.block_size:(y + 1) * self.block_size]
-                )
+        # Block center coordinates, ordered with x varying fastest
+        block_centers_x = np.arange(nbr_blocks_x) * self.block_size + \
+            (self.block_size - 1) / 2
+        block_centers_y = np.arange(nbr_blocks_y) * self.block_size + \
+            (self.block_size - 1) / 2
+        centers_x, centers_y = np.meshgrid(block_centers_x, block_centers_y)
+        sample_coords = np.stack(
+            [centers_x.ravel(), centers_y.ravel()],
+            axis=1,
+        ).astype(np.float64)
+        # View complete blocks as (blocks y, blocks x, pixels per block)
+        # so all block medians are computed in one call
+        im_blocks = im[:nbr_blocks_x * self.block_size,
+                       :nbr_blocks_y * self.block_size]
+        im_blocks = im_blocks.reshape(
+            nbr_blocks_x,
+            self.block_size,
+            nbr_blocks_y,
+            self.block_size,
+        ).transpose(2, 0, 1, 3).reshape(nbr_blocks_y, nbr_blocks_x, -1)
+        sample_values = np.median(im_blocks, axis=2).ravel().astype(np.float64)
         return sample_coords, sample_values
 
     def fit_polynomial_surface_2d(self,
@@ -83,19 +121,77 @@ class BackgroundEstimator2D:
             variable_matrix[:, idx] = sample_coords[:, 0] ** n * sample_coords[:, 1] ** m
         # Least squares fit of the points to the polynomial
         coeffs, _, _, _ = np.linalg.lstsq(variable_matrix, sample_values, rcond=-1)
-        # Create a grid of image (x, y) coordinates
-        x_mesh, y_mesh = np.meshgrid(np.linspace(0, im_shape[1] - 1, im_shape[1]),
-                                     np.linspace(0, im_shape[0] - 1, im_shape[0]))
-        # Reconstruct the surface from the coefficients
-        poly_surface = np.zeros(im_shape, np.float)
+        # Arrange coefficients so that coeff_matrix[n, m] multiplies
+        # row ** n * col ** m
+        coeff_matrix = np.zeros((self.order + 1, self.order + 1), self.dtype)
         order_pairs = list(itertools.product(orders, orders))
         # sum of orders of x,y <= order of the polynomial
         variable_iterator = itertools.filterfalse(lambda x: sum(x) > self.order, order_pairs)
         for coeff, (m, n) in zip(coeffs, variable_iterator):
-            poly_surface += coeff * x_mesh ** m * y_mesh ** n
+            coeff_matrix[n, m] = coeff
+        # Evaluate the separable surface as row basis * coeffs * col basis
+        row_basis, col_basis = get_monomial_bases(
+            tuple(im_shape),
+            self.order,
+            self.dtype,
+        )
+        poly_surface = np.dot(np.dot(row_basis, coeff_matrix), col_basis.T)
 
         return poly_surface
 
+    def fit_plate_background(self, sample_coords, well_sample_values, im_shape):
+        """
+        Fit a background model shared by all wells on a plate, assuming
+        illumination is stable across the plate. Block medians are combined
+        across images using their median before the surface fit, which
+        suppresses spots and debris present in only some of the wells.
+
+        :param np.array sample_coords: 2D sample coords (nbr of points, 2)
+        :param list well_sample_values: Block median values for each image
+            (nbr points,) sampled at the same coordinates
+        :param tuple im_shape: Shape of the images (height, width)
+        :return np.array plate_background: Background model of shape im_shape
+        """
+        sample_values = np.median(np.stack(well_sample_values), axis=0)
+        plate_background = self.fit_polynomial_surface_2d(
+            sample_coords=sample_coords,
+            sample_values=sample_values,
+            im_shape=im_shape,
+        )
+        return plate_background
+
+    def get_background_from_model(self, im, background_model):
+        """
+        Estimate the background of an image from a plate background model,
+        cropped to the same region as the image. Only a gain and an offset
+        are fit to the block medians of the image, so no surface fit is
+        needed per well.
+
+        :param np.array im: 2D grayscale image
+        :param np.array background_model: Background model of same shape as im
+        :return np.array background: Background image
+        """
+        assert im.shape == background_model.shape, \
+            "Background model shape {} doesn't match image shape {}".format(
+                background_model.shape,
+                im.shape,
+            )
+        _, im_values = self.sample_block_medians(im=im)
+        _, model_values = self.sample_block_medians(im=background_model)
+        variable_matrix = np.stack(
+            [model_values, np.ones_like(model_values)],
+            axis=1,
+        )
+        (gain, offset), _, _, _ = np.linalg.lstsq(
+            variable_matrix,
+            im_values,
+            rcond=-1,
+        )
+        background = gain * background_model.astype(self.dtype) + offset
+        if self.normalize:
+            background /= np.mean(background)
+        return background
+
     def get_background(self, im):
         """
         Combine sampling and polynomial surface fit for background estimation.
@@ -12,6 +12,23 @@ WORKFLOW = None
 METADATA_FILE = None
 DEBUG = None
 LOAD_REPORT = None
+# Random seed for particle filter registration, fix for reproducible runs
+RANDOM_SEED = None
+# Format of spot metrics files written per well, 'csv' or 'parquet'
+WELL_STATS_FORMAT = 'csv'
+# Export spot metrics of all wells to stats_per_well.xlsx at end of run
+WELL_STATS_XLSX = True
+# Formats plate reports are written in, 'xlsx' for one workbook per
+# measurement, 'csv', 'parquet' or 'hdf5' for one long format table
+REPORT_FORMATS = ['xlsx', 'csv']
+# Profile run with cProfile and dump stats to run path
+PROFILE = False
+# Watch input directory and process wells as their images appear
+WATCH = False
+# Well names a watched run waits for, all wells of a 96 well plate if None
+EXPECTED_WELLS = None
+# Seconds after the last new well image before a watched run is finalized
+WATCH_TIMEOUT = 600
 
 # === constants parsed from metadata ===
 #   the constants below are all dictionaries
@@ -28,7 +45,14 @@ params = {
     'pixel_size_scienion': 0.0049,
     'pixel_size_octopi': 0.00185,
     'pixel_size': None,
-    'nbr_outliers': 1
+    'nbr_outliers': 1,
+    'adaptive_particles': False,
+    'plate_prior': False,
+    'refine_registration': False,
+    'spot_downsample': 1,
+    'well_downsample': 1,
+    'plate_background': False,
+    'background_image': None,
 }
 
 # a map between Image Name : well (row, col)
@@ -79,6 +103,15 @@ SPOT_DIST_PIX = int()
 SPOT_DIST_UM = int()
 STDS = [100, 100, 2, .01]  # x, y, angle, scale
 NBR_PARTICLES = 4000
+# Initial number of particles if registration is adaptive
+NBR_PARTICLES_MIN = 500
+# Adaptive registration adds particles if the translations of the best
+# fitting fraction of particles spread more than this many spot distances
+REG_TOP_FRACTION = .1
+REG_AMBIGUITY_SPREAD = .25
+# Particle stds and number when seeded with transforms of registered wells
+PRIOR_STDS = [25, 25, 1, .005]
+NBR_PARTICLES_PRIOR = 500
 REG_DIST_THRESH = 100
 MEAN_POINT = (0, 0)
 SCALE_MEAN = 1.
@@ -89,8 +122,25 @@ MIN_NBR_SPOTS = 5
 # Minimum detected spot percentage of spot ROI area
 SPOT_MIN_PERCENT_AREA = .1
 
+# Seconds between scans of a watched input directory
+WATCH_POLL_INTERVAL = 2.
+# Seconds an image's size and modification time must be unchanged
+# before it's considered completely written
+WATCH_STABLE_TIME = 2.
+
 # constants for saving
 RUN_PATH = ''
+# Directory in run path with spot metrics files, one per well
+WELL_STATS_DIR = 'stats_per_well'
+# Long format plate report name, extension depends on format
+PLATE_REPORT_NAME = 'plate_report'
+# Background model shared by all wells, if fit per plate
+PLATE_BACKGROUND_NAME = 'plate_background.npy'
+PLATE_BACKGROUND_PATH = None
+# Time per processing stage, per well and for the whole run
+STAGE_TIMES_NAME = 'stage_times.json'
+# cProfile stats of the run, if profiling
+PROFILE_NAME = 'pysero.prof'
 
 # Logger
 LOG_NAME = 'pysero.log'
@@ -4,14 +4,14 @@ import itertools
 import math
 import pandas as pd
 from types import SimpleNamespace
-from scipy import spatial
+from scipy import ndimage, spatial
 
 from skimage.transform import hough_circle, hough_circle_peaks
 from skimage.feature import canny
 from skimage.morphology import binary_closing, binary_dilation, selem, disk, binary_opening
 from skimage import measure
 
-from .img_processing import thresh_and_binarize
+from .img_processing import create_otsu_mask, thresh_and_binarize
 from array_analyzer.transform.point_registration import icp
 
 """
@@ -122,6 +122,166 @@ def find_well_border(image, segmethod='bimodal', detmethod='region'):
     return [cy, cx], radii, well_mask
 
 
+def find_well_border_fast(image, downsample=8, well_prior=None, nbr_angles=360):
+    """
+    Fast alternative to find_well_border with detmethod 'region'.
+    The well is segmented with Otsu thresholding on a downsampled image,
+    then its center and radius are refined by fitting a circle to the well
+    edge sampled along rays in a narrow full resolution annulus. Only the
+    annulus is read at full resolution after downsampling, so memory mapped
+    images are mostly read once.
+    If the geometry of a previous well is given as prior, the annulus is
+    placed around it and the segmentation is skipped, unless the fit fails.
+
+    :param np.array image: Raw 2D image, not inverted
+    :param int downsample: Downsampling factor for well segmentation
+    :param tuple well_prior: Well center [row, col] and radius as returned
+        for a previous well on the plate
+    :param int nbr_angles: Number of rays the well edge is sampled along
+    :return list well_center: Well center [row, col]
+    :return int radii: Half side of square inscribed in the well, as in
+        find_well_border
+    :return np.array well_mask: Boolean mask of the fitted well circle
+    """
+    assert downsample >= 1, "Downsampling factor must be at least 1"
+    # Annulus half width in full resolution pixels
+    half_width = max(10, 4 * downsample)
+    well_circle = None
+    if well_prior is not None:
+        prior_center, prior_radi = well_prior
+        prior_circle = (prior_center[0], prior_center[1], prior_radi * np.sqrt(2))
+        try:
+            well_circle = refine_well_circle(
+                image,
+                prior_circle,
+                half_width,
+                nbr_angles,
+            )
+            # Fits running into the annulus edge don't match the prior
+            if np.max(np.abs(np.subtract(well_circle, prior_circle))) > half_width:
+                well_circle = None
+        except IndexError:
+            well_circle = None
+    if well_circle is None:
+        im_small = cv.resize(
+            image,
+            (image.shape[1] // downsample, image.shape[0] // downsample),
+            interpolation=cv.INTER_AREA,
+        )
+        well_mask = create_otsu_mask(im_small).astype(np.uint8)
+        # Now remove small objects, as with the 10 pixel disk at full size
+        str_elem_size = max(1, int(np.round(10 / downsample)))
+        str_elem = cv.getStructuringElement(
+            cv.MORPH_ELLIPSE,
+            (2 * str_elem_size + 1, 2 * str_elem_size + 1),
+        )
+        well_mask = cv.morphologyEx(well_mask, cv.MORPH_OPEN, str_elem)
+        _, _, stats, _ = cv.connectedComponentsWithStats(well_mask)
+        # Take the largest foreground component as the well
+        areas = stats[1:, cv.CC_STAT_AREA]
+        if areas.size == 0 or areas.max() * downsample ** 2 <= 10 ** 5:
+            raise IndexError("No well found in downsampled image")
+        # Use bounding box since dark spots inside the well aren't segmented
+        col, row, width, height = stats[np.argmax(areas) + 1, :4]
+        cy = (row + height / 2) * downsample - .5
+        cx = (col + width / 2) * downsample - .5
+        radius = (width + height) / 4 * downsample
+        well_circle = refine_well_circle(
+            image,
+            (cy, cx, radius),
+            half_width,
+            nbr_angles,
+        )
+    cy, cx, radius = well_circle
+    well_mask = np.zeros(image.shape[:2], np.uint8)
+    cv.circle(
+        well_mask,
+        (int(np.round(cx)), int(np.round(cy))),
+        int(np.round(radius)),
+        1,
+        -1,
+    )
+    radii = int(radius / np.sqrt(2))
+    return [cy, cx], radii, well_mask.astype(bool)
+
+
+def refine_well_circle(image, well_circle, half_width, nbr_angles=360):
+    """
+    Refine well center and radius by locating the well edge, where intensity
+    drops the most, along rays through an annulus around an approximate well
+    circle, and fitting a circle to the edge points. The fit is rejected if
+    less than half of the rays have an edge on the fitted circle.
+
+    :param np.array image: Raw 2D image, not inverted
+    :param tuple well_circle: Approximate well center row, column and radius
+    :param int half_width: Half width of annulus in pixels
+    :param int nbr_angles: Number of rays
+    :return tuple well_circle: Refined well center row, column and radius
+    """
+    cy, cx, radius = well_circle
+    angles = np.linspace(0, 2 * np.pi, nbr_angles, endpoint=False)
+    ray_radii = radius + np.arange(-half_width, half_width + 1)
+    rows = cy + np.outer(np.sin(angles), ray_radii)
+    cols = cx + np.outer(np.cos(angles), ray_radii)
+    # Only use rays that are fully inside the image
+    valid_rays = np.all(
+        (rows >= 0) & (rows <= image.shape[0] - 1) &
+        (cols >= 0) & (cols <= image.shape[1] - 1),
+        axis=1,
+    )
+    profiles = ndimage.map_coordinates(
+        image,
+        [rows[valid_rays], cols[valid_rays]],
+        output=np.float32,
+        order=1,
+    )
+    if profiles.shape[0] < nbr_angles // 4:
+        raise IndexError("Well annulus is outside image")
+    profiles = ndimage.gaussian_filter1d(profiles, sigma=1.5, axis=1)
+    profile_diffs = np.diff(profiles, axis=1)
+    edge_idxs = np.argmin(profile_diffs, axis=1)
+    # Discard rays without a clear edge, e.g. at dirt on the well border
+    edge_contrast = -profile_diffs[np.arange(edge_idxs.size), edge_idxs]
+    strong_edges = edge_contrast > .5 * np.median(edge_contrast)
+    edge_radii = ray_radii[edge_idxs] + .5
+    edge_coords = np.stack([
+        cy + np.sin(angles[valid_rays]) * edge_radii,
+        cx + np.cos(angles[valid_rays]) * edge_radii,
+    ], axis=1)[strong_edges]
+    if edge_coords.shape[0] < nbr_angles // 4:
+        raise IndexError("Couldn't find well edge in annulus")
+    well_circle = fit_circle(edge_coords)
+    residuals = np.abs(
+        np.linalg.norm(edge_coords - well_circle[:2], axis=1) - well_circle[2],
+    )
+    if np.sum(residuals < 2) < profiles.shape[0] / 2:
+        raise IndexError("Well edge in annulus isn't circular")
+    return well_circle
+
+
+def fit_circle(coords, nbr_iterations=2):
+    """
+    Least squares circle fit, repeated after removing outliers that are
+    more than three (robust) standard deviations from the circle.
+
+    :param np.array coords: Point coordinates (row, col), shape (N, 2)
+    :param int nbr_iterations: Number of fits
+    :return tuple circle: Center row, column and radius
+    """
+    inliers = np.ones(coords.shape[0], dtype=bool)
+    for _ in range(nbr_iterations):
+        rows = coords[inliers, 0]
+        cols = coords[inliers, 1]
+        a_mat = np.stack([2 * rows, 2 * cols, np.ones_like(rows)], axis=1)
+        solution = np.linalg.lstsq(a_mat, rows ** 2 + cols ** 2, rcond=None)[0]
+        cy, cx = solution[:2]
+        radius = np.sqrt(solution[2] + cy ** 2 + cx ** 2)
+        residuals = np.abs(np.linalg.norm(coords - [cy, cx], axis=1) - radius)
+        residual_std = max(1., 1.4826 * np.median(residuals[inliers]))
+        inliers = residuals < 3 * residual_std
+    return cy, cx, radius
+
+
 def clean_spot_binary(arr, kx=10, ky=10):
     return binary_closing(arr, selem=np.ones((kx, ky)))
 
@@ -324,7 +484,7 @@ def find_fiducials_markers(props_,
 
     source = np.array([grid_x, grid_y]).T
     target = np.array([spots_x, spots_y]).T
-    t_matrix = icp(source, target)
+    t_matrix, _ = icp(source, target)
 
     grid_estimate = cv.transform(np.expand_dims(source, 0), t_matrix[:2])
 
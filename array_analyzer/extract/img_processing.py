@@ -1,4 +1,5 @@
 import cv2 as cv
+import functools
 import numpy as np
 
 from skimage.measure import label
@@ -8,6 +9,12 @@ from skimage.filters import threshold_otsu, threshold_minimum
 from scipy.ndimage import binary_fill_holes
 from skimage.segmentation import clear_border
 
+# Smallest and largest LoG filter size applied as separable filters.
+# OpenCV filters smaller kernels directly and larger ones in the Fourier
+# domain faster than with two separable passes (see test_filter_log
+# benchmarks), sizes in between come from downsampled spot detection
+SEPARABLE_LOG_SIZES = (13, 19)
+
 
 def get_unimodal_threshold(input_image):
     """Determines optimal unimodal threshold
@@ -224,10 +231,153 @@ def thresh_and_binarize(image,
     return spots
 
 
+@functools.lru_cache(maxsize=8)
+def get_disk_kernel(disk_size):
+    """
+    Disk structuring element as uint8 OpenCV kernel. Kernels are cached
+    since spots in a plate are segmented with the same disk size.
+    The returned kernel is read only since it's shared between calls.
+
+    :param int disk_size: Disk radius
+    :return np.array kernel: uint8 disk kernel (2 * disk_size + 1 square)
+    """
+    kernel = disk(disk_size).astype(np.uint8)
+    kernel.flags.writeable = False
+    return kernel
+
+
+class SpotSegmenter:
+    """
+    Segments spot ROIs like thresh_and_binarize with method 'bright_spots',
+    using OpenCV uint8 morphology and connected components instead of
+    skimage and scipy. Buffers are allocated once per ROI shape and reused,
+    since all spots in a well are segmented with the same ROI size.
+    Masks are identical to those of thresh_and_binarize.
+    """
+
+    def __init__(self, disk_size=10, thr_percent=95, invert=True, get_lcc=False):
+        """
+        :param int disk_size: Structuring element disk size
+        :param int thr_percent: Thresholding percentile
+        :param bool invert: Invert ROIs if spots are dark
+        :param bool get_lcc: Returns only the largest connected component
+        """
+        self.disk_size = disk_size
+        self.thr_percent = thr_percent
+        self.invert = invert
+        self.get_lcc = get_lcc
+        self.str_elem = get_disk_kernel(disk_size)
+        # uint8 buffers and label buffer for each ROI shape
+        self.buffers = {}
+
+    def _get_buffers(self, roi_shape):
+        """
+        Get buffers for ROI shape, allocated the first time a shape is used.
+
+        :param tuple roi_shape: ROI shape (height, width)
+        :return np.array spots: uint8 buffers (3 x roi_shape)
+        :return np.array padded: uint8 buffer padded by one pixel
+        :return np.array labels: int32 label buffer of roi_shape
+        """
+        if roi_shape not in self.buffers:
+            self.buffers[roi_shape] = (
+                np.empty((3,) + roi_shape, dtype=np.uint8),
+                np.empty((roi_shape[0] + 2, roi_shape[1] + 2), dtype=np.uint8),
+                np.empty(roi_shape, dtype=np.int32),
+            )
+        return self.buffers[roi_shape]
+
+    def fill_holes(self, spots, reach, background):
+        """
+        Fill holes in place, the same way as binary_fill_holes with the disk
+        as structure: background is propagated from outside the ROI with
+        the disk, so holes with walls thinner than the disk aren't filled.
+
+        :param np.array spots: uint8 binary ROI, holes are filled in place
+        :param np.array reach: uint8 buffer of ROI shape
+        :param np.array background: uint8 buffer of ROI shape
+        """
+        np.equal(spots, 0, out=background, casting='unsafe')
+        reach[:] = 0
+        nbr_reached = -1
+        while cv.countNonZero(reach) != nbr_reached:
+            nbr_reached = cv.countNonZero(reach)
+            cv.dilate(
+                reach,
+                self.str_elem,
+                dst=reach,
+                borderType=cv.BORDER_CONSTANT,
+                borderValue=1,
+            )
+            cv.bitwise_and(reach, background, dst=reach)
+        np.subtract(1, reach, out=spots)
+
+    def segment(self, roi, out=None):
+        """
+        Threshold ROI at percentile, remove small objects by opening, fill
+        holes and remove components touching the ROI border.
+
+        :param np.array roi: 2D grayscale ROI
+        :param np.array out: Optional bool array of ROI shape for the mask
+        :return np.array spots: Boolean spot mask
+        """
+        buffers, padded, labels = self._get_buffers(roi.shape)
+        spots, opened, background = buffers
+        roi_ = roi
+        if self.invert:
+            roi_ = u.invert(roi)
+        np.greater(roi_, np.percentile(roi_, self.thr_percent), out=spots, casting='unsafe')
+        cv.morphologyEx(spots, cv.MORPH_OPEN, self.str_elem, dst=opened)
+        # Check for holes by flooding background from outside the ROI
+        padded[:] = 0
+        padded[1:-1, 1:-1] = opened
+        cv.floodFill(padded, None, (0, 0), 1, flags=4)
+        if cv.countNonZero(padded) < padded.size:
+            self.fill_holes(opened, spots, background)
+        nbr_labels, labels, stats, _ = cv.connectedComponentsWithStats(
+            opened,
+            labels=labels,
+            connectivity=8,
+            ltype=cv.CV_32S,
+        )
+        # Clear components touching ROI border
+        left, top, width, height, areas = stats.T
+        keep_labels = (left > 0) & (top > 0) & \
+                      (left + width < roi.shape[1]) & (top + height < roi.shape[0])
+        keep_labels[0] = False
+        if self.get_lcc and keep_labels.any():
+            areas = np.where(keep_labels, areas, 0)
+            lcc_labels = np.flatnonzero(areas == areas.max())
+            # Resolve ties by first pixel in raster order, like skimage labels
+            lcc_label = min(lcc_labels, key=lambda lcc: np.argmax(labels == lcc))
+            keep_labels[:] = False
+            keep_labels[lcc_label] = True
+        if out is None:
+            out = np.empty(roi.shape, dtype=bool)
+        np.take(keep_labels, labels, out=out)
+        return out
+
+    def segment_batch(self, rois):
+        """
+        Segment a stack of same size ROIs, reusing buffers.
+
+        :param np.array rois: Stack of 2D grayscale ROIs (nbr ROIs, h, w)
+        :return np.array spots: Stack of boolean spot masks
+        """
+        spots = np.empty(rois.shape, dtype=bool)
+        for idx in range(rois.shape[0]):
+            self.segment(rois[idx], out=spots[idx])
+        return spots
+
+
 class SpotDetector:
     """
     Detects spots in well image using a Laplacian of Gaussian filter
-    followed by blob detection
+    followed by blob detection.
+    Spots can be detected coarse to fine: blobs are detected in a
+    downsampled image, which is enough for registration, and spot centers
+    are then refined at full resolution in small windows around the
+    registered grid.
     """
 
     def __init__(self,
@@ -237,8 +387,11 @@ class SpotDetector:
                  min_circularity=.1,
                  min_convexity=.5,
                  min_dist_between_blobs=10,
-                 min_repeatability=2):
+                 min_repeatability=2,
+                 downsample=1):
         """
+        :param dict imaging_params: Imaging and array parameters, must contain
+            spot_width, pixel_size, rows and columns
         :param int min_thresh: Minimum threshold
         :param int max_thresh: Maximum threshold
         :param float min_circularity: Minimum circularity of spots
@@ -247,22 +400,36 @@ class SpotDetector:
             spots for them to be called as different spots
         :param int min_repeatability: minimal number of times the same spot has to be
             detected at different thresholds
+        :param int downsample: Factor by which images are downsampled before
+            detecting spots. Spot size and distance are scaled accordingly
+            (default 1, full resolution)
         """
-
+        assert downsample >= 1, \
+            "Downsampling factor must be >= 1, not {}".format(downsample)
+        self.downsample = int(downsample)
         self.min_thresh = min_thresh
         self.max_thresh = max_thresh
-        self.min_dist_between_blobs = min_dist_between_blobs
+        self.min_dist_between_blobs = min_dist_between_blobs / self.downsample
         self.min_repeatability = min_repeatability
         self.min_circularity = min_circularity
         self.min_convexity = min_convexity
-        self.sigma_gauss = int(np.round(imaging_params['spot_width'] /
-                                imaging_params['pixel_size'] / 4))
+        # Spot radius in full resolution pixels
+        self.spot_radius = imaging_params['spot_width'] / imaging_params['pixel_size'] / 2
+        self.sigma_gauss = max(1, int(np.round(self.spot_radius / 2 / self.downsample)))
         self.min_area = 4 * self.sigma_gauss ** 2
         self.max_area = 50 * self.min_area
         self.nbr_expected_spots = imaging_params['rows'] * imaging_params['columns']
 
         self.blob_detector = self._make_blob_detector()
         self.log_filter = self._make_log_filter()
+        self.log_filter_float32 = self.log_filter.astype(np.float32)
+        self.log_kernels = self._make_separable_log_kernels()
+        # Scratch buffers reused for images of the same shape
+        self.scratch_shape = None
+        self.scratch_float = None
+        self.scratch_uint8 = None
+        # Normalized filtered image of the last detection, spots are bright
+        self.response_im = None
 
     def _make_blob_detector(self):
         # Set spot detection parameters
@@ -306,6 +473,66 @@ class SpotDetector:
         log_filter = log_filter / sum(sum(log_filter))
         return log_filter
 
+    def _make_separable_log_kernels(self):
+        """
+        Split the LoG filter into a sum of two separable filters,
+        (r^2 - s) g(r) g(c) + g(r) (c^2 - s) g(c) with s = sigma_sq / 2,
+        so it can be applied with 1D convolutions. The kernels are scaled
+        like the 2D filter, so their outer products sum to log_filter.
+
+        :return list log_kernels: (row kernel, col kernel) float32 pairs
+        """
+        n = np.ceil(self.sigma_gauss * 6)
+        coords = np.arange(-n // 2, n // 2 + 1)
+        sigma_sq = 2 * self.sigma_gauss ** 2
+        gauss = np.exp(-(coords ** 2 / sigma_sq))
+        laplace = (coords ** 2 - sigma_sq / 2) * gauss
+        scale = 1 / (np.pi * sigma_sq * self.sigma_gauss ** 2)
+        # Sum of 2D filter is the sum of the outer products
+        filter_sum = 2 * scale * laplace.sum() * gauss.sum()
+        scale = np.sqrt(np.abs(scale / filter_sum))
+        sign = np.sign(filter_sum)
+        log_kernels = [
+            (sign * scale * laplace, scale * gauss),
+            (sign * scale * gauss, scale * laplace),
+        ]
+        return [(row_kernel.astype(np.float32), col_kernel.astype(np.float32))
+                for row_kernel, col_kernel in log_kernels]
+
+    def _get_scratch(self, im_shape):
+        """
+        Get float32 and uint8 scratch buffers of image shape, allocated
+        only when the image shape changes.
+
+        :param tuple im_shape: Image shape
+        :return np.array scratch_float: float32 buffers (2 x im_shape)
+        :return np.array scratch_uint8: uint8 buffer of im_shape
+        """
+        if self.scratch_shape != im_shape:
+            self.scratch_shape = im_shape
+            self.scratch_float = np.empty((2,) + im_shape, dtype=np.float32)
+            self.scratch_uint8 = np.empty(im_shape, dtype=np.uint8)
+        return self.scratch_float, self.scratch_uint8
+
+    def filter_log(self, im, dst):
+        """
+        Filter float32 image with the LoG filter. Filters with sizes in
+        SEPARABLE_LOG_SIZES are applied as two separable filters, others
+        in 2D.
+
+        :param np.array im: float32 image, may be overwritten
+        :param np.array dst: float32 array of image shape for the result
+        :return np.array dst: Filtered image
+        """
+        min_size, max_size = SEPARABLE_LOG_SIZES
+        if not min_size <= self.log_filter.shape[0] <= max_size:
+            return cv.filter2D(im, -1, self.log_filter_float32, dst=dst)
+        (row_kernel, col_kernel), (row_kernel2, col_kernel2) = self.log_kernels
+        cv.sepFilter2D(im, -1, kernelX=col_kernel, kernelY=row_kernel, dst=dst)
+        cv.sepFilter2D(im, -1, kernelX=col_kernel2, kernelY=row_kernel2, dst=im)
+        dst += im
+        return dst
+
     def get_spot_coords(self,
                         im,
                         margin=0,
@@ -317,6 +544,10 @@ class SpotDetector:
         Use OpenCVs simple blob detector (thresholdings and grouping by properties)
         to detect all dark spots in the image. First filter with a Laplacian of
         Gaussian with sigma matching spots to enhance spots in image.
+        Filtering and normalization are done in place in float32 scratch
+        buffers that are reused for images of the same shape.
+        If the detector downsamples, spots are detected in the downsampled
+        image and their coordinates are scaled back to full resolution.
 
         :param np.array im: uint8 mage containing spots
         :param int margin: Pixel margin around image edged where spots should be
@@ -327,29 +558,92 @@ class SpotDetector:
         :return np.array spot_coords: row, col coordinates of spot centroids
             (nbr spots x 2)
         """
+        im_shape = im.shape
+        if self.downsample > 1:
+            im = cv.resize(
+                np.ascontiguousarray(im),
+                (im_shape[1] // self.downsample, im_shape[0] // self.downsample),
+                interpolation=cv.INTER_AREA,
+            )
+        scratch_float, im_uint8 = self._get_scratch(im.shape)
+        im_norm, im_filtered = scratch_float
         # First invert image to detect peaks
-        im_norm = (max_intensity - im) / max_intensity
+        np.subtract(max_intensity, im, out=im_norm, dtype=np.float32)
+        im_norm *= 1 / max_intensity
         # Filter with Laplacian of Gaussian
-        im_norm = cv.filter2D(im_norm, -1, self.log_filter)
-        # Normalize
-        im_norm = im_norm / im_norm.std() * im_std
-        im_norm = im_norm - im_norm.mean() + im_mean
-        im_norm[im_norm < 0] = 0
-        im_norm[im_norm > 255] = 255
-        im_norm = im_norm.astype(np.uint8)
+        self.filter_log(im_norm, dst=im_filtered)
+        # Normalize to fixed mean and std
+        scale = im_std / im_filtered.std(dtype=np.float64)
+        offset = im_mean - im_filtered.mean(dtype=np.float64) * scale
+        im_filtered *= scale
+        im_filtered += offset
+        np.clip(im_filtered, 0, 255, out=im_filtered)
+        np.copyto(im_uint8, im_filtered, casting='unsafe')
+        self.response_im = im_uint8
 
         # Detect peaks in filtered image
-        keypoints = self.blob_detector.detect(im_norm)
-
-        spot_coords = np.zeros((len(keypoints), 2))
-        # Remove outliers and convert to np.array
-        row_max, col_max = im.shape
-        idx = 0
-        for keypoint in range(len(keypoints)):
-            pt = keypoints[keypoint].pt
-            if margin < pt[0] < row_max - margin and margin < pt[1] < col_max - margin:
-                spot_coords[idx, 0] = pt[1]
-                spot_coords[idx, 1] = pt[0]
-                idx += 1
-        spot_coords = spot_coords[:idx, :]
-        return spot_coords
+        keypoints = self.blob_detector.detect(im_uint8)
+        if len(keypoints) == 0:
+            return np.zeros((0, 2))
+        # Keypoints are (x, y), convert to (row, col)
+        spot_coords = cv.KeyPoint_convert(keypoints)[:, ::-1].astype(np.float64)
+        if self.downsample > 1:
+            # Pixel centers of downsampled image in full resolution
+            spot_coords = (spot_coords + .5) * self.downsample - .5
+        # Remove spots within margin of image border
+        row_max, col_max = im_shape
+        is_inside = (spot_coords[:, 0] > margin) & \
+                    (spot_coords[:, 0] < row_max - margin) & \
+                    (spot_coords[:, 1] > margin) & \
+                    (spot_coords[:, 1] < col_max - margin)
+        return spot_coords[is_inside]
+
+    def refine_spot_coords(self, im, coords, max_intensity=255):
+        """
+        Refine approximate spot centers, e.g. registered grid coordinates
+        after coarse detection, at full resolution. Only windows of 1.5 spot
+        diameters around each coordinate are read. The center is the
+        centroid of the inverted window intensities above the window median,
+        since spots are dark and cover less than half of the window.
+        Grid positions without a spot would give the centroid of noise, so
+        refined centers where the filtered image of the preceding
+        get_spot_coords call on the same image is below the detector's
+        minimum threshold are dropped.
+
+        :param np.array im: Image containing dark spots
+        :param np.array coords: Approximate spot centers (nbr spots x 2)
+        :param int max_intensity: Maximum image intensity (default uint8)
+        :return np.array spot_coords: Refined row, col coordinates of spots
+            with windows inside the image, some contrast and a detector
+            response above threshold (nbr spots x 2)
+        """
+        response_shape = (im.shape[0] // self.downsample, im.shape[1] // self.downsample)
+        assert self.response_im is not None and \
+            self.response_im.shape == response_shape, \
+            "Spots must be detected in image before refining them"
+        half_width = int(np.ceil(1.5 * self.spot_radius))
+        offsets = np.arange(-half_width, half_width + 1)
+        centers = np.rint(coords).astype(np.int64)
+        is_inside = np.all(
+            (centers - half_width >= 0) & (centers + half_width < im.shape),
+            axis=1,
+        )
+        centers = centers[is_inside]
+        windows = im[centers[:, 0, np.newaxis, np.newaxis] + offsets[:, np.newaxis],
+                     centers[:, 1, np.newaxis, np.newaxis] + offsets]
+        # Invert windows so spots are bright, and remove background
+        weights = max_intensity - windows.astype(np.float32)
+        weights -= np.median(weights, axis=(1, 2), keepdims=True)
+        np.maximum(weights, 0, out=weights)
+        total_weights = weights.sum(axis=(1, 2))
+        has_spot = total_weights > 0
+        row_offsets = weights.sum(axis=2) @ offsets
+        col_offsets = weights.sum(axis=1) @ offsets
+        spot_coords = np.stack([row_offsets, col_offsets], axis=1)[has_spot]
+        spot_coords = spot_coords / total_weights[has_spot, np.newaxis]
+        spot_coords = centers[has_spot] + spot_coords
+        # Look up detector response at refined centers
+        response_coords = np.rint((spot_coords + .5) / self.downsample - .5).astype(np.int64)
+        response_coords = np.clip(response_coords, 0, np.array(response_shape) - 1)
+        response = self.response_im[response_coords[:, 0], response_coords[:, 1]]
+        return spot_coords[response >= self.min_thresh]
@@ -132,6 +132,27 @@ class MetaData:
             constants.params['pixel_size'] = float(self.params['pixel_size'])
         if 'nbr_outliers' in self.params:
             constants.params['nbr_outliers'] = int(self.params['nbr_outliers'])
+        if 'adaptive_particles' in self.params:
+            constants.params['adaptive_particles'] = \
+                int(self.params['adaptive_particles']) == 1
+        if 'plate_prior' in self.params:
+            constants.params['plate_prior'] = \
+                int(self.params['plate_prior']) == 1
+        if 'refine_registration' in self.params:
+            constants.params['refine_registration'] = \
+                int(self.params['refine_registration']) == 1
+        if 'spot_downsample' in self.params:
+            constants.params['spot_downsample'] = \
+                int(self.params['spot_downsample'])
+        if 'well_downsample' in self.params:
+            constants.params['well_downsample'] = \
+                int(self.params['well_downsample'])
+        if 'plate_background' in self.params:
+            constants.params['plate_background'] = \
+                int(self.params['plate_background']) == 1
+        if 'background_image' in self.params:
+            constants.params['background_image'] = \
+                str(self.params['background_image'])
 
     def _create_spot_id_array(self):
         """
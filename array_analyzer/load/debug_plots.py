@@ -23,7 +23,7 @@ def save_all_wells(region_props_array, spot_ids_, output_folder, well_name):
                 )
 
 
-def save_composite_spots(spot_props,
+def save_composite_spots(spot_table,
                          output_name,
                          image,
                          from_source=False):
@@ -32,37 +32,33 @@ def save_composite_spots(spot_props,
     if from_source, the whole spot ROI is plotted, otherwise the
     spot intensities inside the spot masks are plotted.
 
-    :param np.ndarray spot_props: Grid of props describing
-        each segmented spot from image
+    :param SpotTable spot_table: Table of spot properties, with ROIs
+        for each segmented spot from image if not from_source
     :param str output_name: Path plus well name, no extension
         well name of format "A1, A2 ... C2, C3"
     :param np.ndarray image:
         image representing original image data with all spots
     :param from_source: bool
         True : images are extracted from source array
-        False : images are pulled from regionprops.intensity_image
+        False : images are pulled from spot table ROIs
     """
     bbox_image = np.mean(image) * np.ones(image.shape)
 
     # Loop through grid of all spots
-    for row in range(spot_props.shape[0]):
-        for col in range(spot_props.shape[1]):
-            # Get properties for individual spot
-            spot_prop = spot_props[row, col]
-            spot_dict = spot_prop.spot_dict
-            if spot_prop is not None:
-                min_row = spot_dict['bbox_row_min']
-                min_col = spot_dict['bbox_col_min']
-                max_row = spot_dict['bbox_row_max']
-                max_col = spot_dict['bbox_col_max']
-                if not from_source:
-                    # Plot only intensities inside mask
-                    bbox_mask = bbox_image[min_row:max_row, min_col:max_col]
-                    bbox_mask[spot_prop.mask > 0] = spot_prop.image[spot_prop.mask > 0]
-                else:
-                    # Plot all intensities within bounding box
-                    bbox_image[min_row:max_row, min_col:max_col] = \
-                        image[min_row:max_row, min_col:max_col]
+    for idx in range(len(spot_table)):
+        min_row = spot_table['bbox_row_min'][idx]
+        min_col = spot_table['bbox_col_min'][idx]
+        max_row = spot_table['bbox_row_max'][idx]
+        max_col = spot_table['bbox_col_max'][idx]
+        if not from_source:
+            # Plot only intensities inside mask
+            spot_image, _, spot_mask = spot_table.get_roi(idx)
+            bbox_mask = bbox_image[min_row:max_row, min_col:max_col]
+            bbox_mask[spot_mask] = spot_image[spot_mask]
+        else:
+            # Plot all intensities within bounding box
+            bbox_image[min_row:max_row, min_col:max_col] = \
+                image[min_row:max_row, min_col:max_col]
 
     write_name = output_name + "_composite_spots_prop.png"
     if from_source:
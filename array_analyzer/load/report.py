@@ -1,5 +1,4 @@
 import collections
-from copy import deepcopy
 import logging
 import numpy as np
 import os
@@ -7,6 +6,81 @@ import pandas as pd
 
 import array_analyzer.extract.constants as constants
 
+# Plates are represented with alphabetical rows and numerical columns
+PLATE_ROWS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+PLATE_COLS = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
+# File extensions of long format plate reports
+LONG_REPORT_EXTENSIONS = collections.OrderedDict([
+    ('parquet', 'parquet'),
+    ('hdf5', 'h5'),
+    ('csv', 'csv'),
+])
+# Columns of long format plate reports, one row per well and antigen
+LONG_REPORT_COLS = ['well_id',
+                    'antigen',
+                    'grid_row',
+                    'grid_col',
+                    'OD',
+                    'intensity',
+                    'background']
+
+
+def get_long_report_path(report_dir, file_format):
+    """
+    :param str report_dir: Directory of report
+    :param str file_format: 'csv', 'parquet' or 'hdf5'
+    :return str report_path: Path to long format plate report
+    """
+    return os.path.join(
+        report_dir,
+        '.'.join([constants.PLATE_REPORT_NAME, LONG_REPORT_EXTENSIONS[file_format]]),
+    )
+
+
+def find_long_report(report_dir):
+    """
+    Find long format plate report in directory, in order of format
+    preference: parquet, hdf5, csv.
+
+    :param str report_dir: Directory of report
+    :return str report_path: Path to plate report, None if there's none
+    """
+    for file_format in LONG_REPORT_EXTENSIONS:
+        report_path = get_long_report_path(report_dir, file_format)
+        if os.path.isfile(report_path):
+            return report_path
+    return None
+
+
+def write_long_report(report_df, report_path):
+    """
+    Write long format plate report, format given by file extension.
+    Parquet requires pyarrow or fastparquet, HDF5 requires PyTables.
+
+    :param pd.DataFrame report_df: Long format plate report
+    :param str report_path: Path to report
+    """
+    if report_path.endswith('.parquet'):
+        report_df.to_parquet(report_path, index=False)
+    elif report_path.endswith('.h5'):
+        report_df.to_hdf(report_path, key='plate_report', mode='w', format='table')
+    else:
+        report_df.to_csv(report_path, index=False)
+
+
+def read_long_report(report_path):
+    """
+    Read long format plate report, format given by file extension.
+
+    :param str report_path: Path to report
+    :return pd.DataFrame report_df: Long format plate report
+    """
+    if report_path.endswith('.parquet'):
+        return pd.read_parquet(report_path)
+    elif report_path.endswith('.h5'):
+        return pd.read_hdf(report_path, key='plate_report')
+    return pd.read_csv(report_path, float_precision='round_trip')
+
 
 class ReportWriter:
     """
@@ -16,6 +90,9 @@ class ReportWriter:
     Each sheet is a dataframe corresponding to all wells in a plate.
     Plates are traditionally represented with numerical columns and
     alphabetical rows.
+    Reports are stored as arrays of shape (nbr antigens, plate rows,
+    plate cols) for OD, intensity and background. Dataframes are only
+    created when reports are accessed or written.
     """
     def __init__(self):
         """
@@ -42,9 +119,12 @@ class ReportWriter:
             self.antigen_df = self.antigen_df.append(idx_row, ignore_index=True)
 
         self.antigen_names = list(self.antigen_df['antigen'].values)
-        self.report_int = None
-        self.report_bg = None
-        self.report_od = None
+        # Grid positions of antigens, in antigen order
+        self.antigen_rows = self.antigen_df['grid_row'].to_numpy(dtype=np.int64)
+        self.antigen_cols = self.antigen_df['grid_col'].to_numpy(dtype=np.int64)
+        self.od_array = None
+        self.int_array = None
+        self.bg_array = None
         # Report paths
         self.od_path = os.path.join(constants.RUN_PATH, 'median_ODs.xlsx')
         self.int_path = os.path.join(constants.RUN_PATH, 'median_intensities.xlsx')
@@ -58,30 +138,79 @@ class ReportWriter:
         """
         return self.antigen_df
 
-    def create_new_reports(self):
+    def array_to_report(self, report_array):
         """
-        Creates three new reports with sheets corresponding to antigen names.
+        Convert report array to dict of plate dataframes.
+
+        :param np.array report_array: Report values (nbr antigens x plate
+            rows x plate cols)
+        :return collections.OrderedDict report: Plate dataframe for each
+            antigen name
         """
-        # Dataframe for a whole plate
-        rows = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-        cols = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
-        plate_df = pd.DataFrame(None, index=rows, columns=cols)
+        if report_array is None:
+            return None
+        report = collections.OrderedDict()
+        for antigen_idx, antigen_name in enumerate(self.antigen_names):
+            report[antigen_name] = pd.DataFrame(
+                report_array[antigen_idx],
+                index=PLATE_ROWS,
+                columns=PLATE_COLS,
+            )
+        return report
 
-        report_dict = collections.OrderedDict()
-        for sheet_name in self.antigen_names:
-            # Add empty plate dataframe to antigen
-            report_dict[sheet_name] = plate_df.copy()
+    def report_to_array(self, report):
+        """
+        Convert dict of plate dataframes to report array.
+
+        :param dict report: Plate dataframe for each antigen name
+        :return np.array report_array: Report values (nbr antigens x plate
+            rows x plate cols)
+        """
+        report_array = np.full(
+            (len(self.antigen_names), len(PLATE_ROWS), len(PLATE_COLS)),
+            np.nan,
+        )
+        for antigen_idx, antigen_name in enumerate(self.antigen_names):
+            plate_df = report[antigen_name]
+            plate_df.columns = plate_df.columns.map(str)
+            plate_df = plate_df.reindex(index=PLATE_ROWS, columns=PLATE_COLS)
+            report_array[antigen_idx] = plate_df.to_numpy(dtype=np.float64)
+        return report_array
 
-        self.report_int = deepcopy(report_dict)
-        self.report_bg = deepcopy(report_dict)
-        self.report_od = deepcopy(report_dict)
+    @property
+    def report_od(self):
+        return self.array_to_report(self.od_array)
+
+    @property
+    def report_int(self):
+        return self.array_to_report(self.int_array)
+
+    @property
+    def report_bg(self):
+        return self.array_to_report(self.bg_array)
+
+    def create_new_reports(self):
+        """
+        Creates three new reports with values for each antigen in each well.
+        """
+        report_shape = (len(self.antigen_names), len(PLATE_ROWS), len(PLATE_COLS))
+        self.od_array = np.full(report_shape, np.nan)
+        self.int_array = np.full(report_shape, np.nan)
+        self.bg_array = np.full(report_shape, np.nan)
 
     def load_existing_reports(self):
         """
         If doing a rerun, load existing reports and make sure the sheet names
         (keys) match the ones from the current run.
         Rerun wells will be added to existing reports and rewritten.
+        Workbooks are loaded if all three exist, otherwise the long format
+        plate report.
         """
+        xlsx_paths = [self.od_path, self.int_path, self.bg_path]
+        long_path = find_long_report(constants.RUN_PATH)
+        if long_path is not None and not all(map(os.path.isfile, xlsx_paths)):
+            self.load_long_report(long_path)
+            return
         assert os.path.isfile(self.od_path), \
             "OD report doesn't exist: {}".format(self.od_path)
         assert os.path.isfile(self.int_path), \
@@ -92,19 +221,46 @@ class ReportWriter:
         ordered_dict = pd.read_excel(self.od_path, sheet_name=None, index_col=0)
         assert list(ordered_dict) == self.antigen_names, \
             "Existing report keys don't match current keys"
-        self.report_od = ordered_dict
+        self.od_array = self.report_to_array(ordered_dict)
         self.logger.debug('Loaded existing OD report')
         ordered_dict = pd.read_excel(self.int_path, sheet_name=None, index_col=0)
         assert list(ordered_dict) == self.antigen_names, \
             "Existing report keys don't match current keys"
-        self.report_int = ordered_dict
+        self.int_array = self.report_to_array(ordered_dict)
         self.logger.debug('Loaded existing intensity report')
         ordered_dict = pd.read_excel(self.bg_path, sheet_name=None, index_col=0)
         assert list(ordered_dict) == self.antigen_names, \
             "Existing report keys don't match current keys"
-        self.report_bg = ordered_dict
+        self.bg_array = self.report_to_array(ordered_dict)
         self.logger.debug('Loaded existing background report')
 
+    def load_long_report(self, report_path):
+        """
+        Load existing long format plate report into report arrays and make
+        sure its antigens match the ones from the current run.
+
+        :param str report_path: Path to long format plate report
+        """
+        report_df = read_long_report(report_path)
+        antigen_idxs = pd.Series(
+            np.arange(len(self.antigen_names)),
+            index=pd.MultiIndex.from_arrays([self.antigen_rows, self.antigen_cols]),
+        )
+        report_positions = pd.MultiIndex.from_arrays(
+            [report_df['grid_row'], report_df['grid_col']],
+        )
+        assert report_positions.isin(antigen_idxs.index).all(), \
+            "Existing report antigens don't match current antigens"
+        antigen_idxs = antigen_idxs[report_positions].to_numpy()
+        plate_rows = report_df['well_id'].str[0].map(PLATE_ROWS.index).to_numpy()
+        plate_cols = report_df['well_id'].str[1:].map(PLATE_COLS.index).to_numpy()
+        self.create_new_reports()
+        for report_array, col_name in zip(
+                [self.od_array, self.int_array, self.bg_array],
+                ['OD', 'intensity', 'background']):
+            report_array[antigen_idxs, plate_rows, plate_cols] = report_df[col_name]
+        self.logger.debug('Loaded existing plate report {}'.format(report_path))
+
     def assign_well_to_plate(self, well_name, spots_df):
         """
         Takes intensity, background and OD values for a well and
@@ -113,41 +269,105 @@ class ReportWriter:
         :param str well_name: Well name (e.g. 'B12')
         :param pd.DataFrame spots_df: Metrics for all spots in a well
         """
-        plate_row = well_name[0]
-        plate_col = well_name[1:]
-        for idx, antigen_row in self.antigen_df.iterrows():
-            spots_row = spots_df.loc[
-                (spots_df['grid_row'] == antigen_row['grid_row']) &
-                (spots_df['grid_col'] == antigen_row['grid_col']),
-            ]
-            self.report_int[antigen_row['antigen']].at[plate_row, plate_col] = \
-                spots_row['intensity_median'].values[0]
-            self.report_bg[antigen_row['antigen']].at[plate_row, plate_col] = \
-                spots_row['bg_median'].values[0]
-            self.report_od[antigen_row['antigen']].at[plate_row, plate_col] = \
-                spots_row['od_norm'].values[0]
+        plate_row = PLATE_ROWS.index(well_name[0])
+        plate_col = PLATE_COLS.index(well_name[1:])
+        # Scatter spot values to the grid, then gather antigens by grid position
+        grid_rows = spots_df['grid_row'].to_numpy(dtype=np.int64)
+        grid_cols = spots_df['grid_col'].to_numpy(dtype=np.int64)
+        grid_shape = (
+            max(grid_rows.max(initial=-1), self.antigen_rows.max(initial=-1)) + 1,
+            max(grid_cols.max(initial=-1), self.antigen_cols.max(initial=-1)) + 1,
+        )
+        grid_values = np.full((3,) + grid_shape, np.nan)
+        grid_values[:, grid_rows, grid_cols] = spots_df[
+            ['intensity_median', 'bg_median', 'od_norm']
+        ].to_numpy(dtype=np.float64).T
+        antigen_values = grid_values[:, self.antigen_rows, self.antigen_cols]
+        self.int_array[:, plate_row, plate_col] = antigen_values[0]
+        self.bg_array[:, plate_row, plate_col] = antigen_values[1]
+        self.od_array[:, plate_row, plate_col] = antigen_values[2]
         self.logger.debug("Assigned well {} to plate reports".format(well_name))
 
-    def write_reports(self):
+    def get_long_report(self):
+        """
+        Long format plate report with one row per well and antigen, for
+        wells that have been assigned to the plate. Rows are ordered by
+        antigen, then by plate column and row.
+
+        :return pd.DataFrame report_df: Well, antigen name, antigen grid
+            row and col, OD, intensity and background
+        """
+        # Wells that have been assigned values
+        is_assigned = ~np.all(
+            np.isnan(self.od_array) & np.isnan(self.int_array) & np.isnan(self.bg_array),
+            axis=0,
+        )
+        plate_cols, plate_rows = np.nonzero(is_assigned.T)
+        nbr_wells = plate_rows.size
+        well_ids = [PLATE_ROWS[r] + PLATE_COLS[c] for r, c in zip(plate_rows, plate_cols)]
+        antigens = constants.ANTIGEN_ARRAY[self.antigen_rows, self.antigen_cols]
+        report_df = pd.DataFrame({
+            'well_id': np.tile(well_ids, len(self.antigen_names)),
+            'antigen': np.repeat(antigens, nbr_wells),
+            'grid_row': np.repeat(self.antigen_rows, nbr_wells),
+            'grid_col': np.repeat(self.antigen_cols, nbr_wells),
+            'OD': self.od_array[:, plate_rows, plate_cols].ravel(),
+            'intensity': self.int_array[:, plate_rows, plate_cols].ravel(),
+            'background': self.bg_array[:, plate_rows, plate_cols].ravel(),
+        }, columns=LONG_REPORT_COLS)
+        return report_df
+
+    def write_reports(self, report_formats=None):
+        """
+        After all wells are run, write plate reports in each format.
+        Long format reports in other formats are removed, so a stale report
+        from a previous run in the same directory is never read.
+
+        :param list report_formats: Report formats, 'xlsx' for OD, intensity
+            and background workbooks with a sheet per antigen, and 'csv',
+            'parquet' or 'hdf5' for one long format plate report.
+            If None, use formats set in constants
+        """
+        if report_formats is None:
+            report_formats = constants.REPORT_FORMATS
+        for report_format in report_formats:
+            if report_format == 'xlsx':
+                self.write_xlsx_reports()
+            else:
+                assert report_format in LONG_REPORT_EXTENSIONS, \
+                    "Unknown report format: {}".format(report_format)
+                report_path = get_long_report_path(constants.RUN_PATH, report_format)
+                write_long_report(self.get_long_report(), report_path)
+                self.logger.debug("Wrote plate report {}".format(report_path))
+        for file_format in LONG_REPORT_EXTENSIONS:
+            report_path = get_long_report_path(constants.RUN_PATH, file_format)
+            if file_format not in report_formats and os.path.isfile(report_path):
+                os.remove(report_path)
+                self.logger.debug("Removed stale plate report {}".format(report_path))
+
+    def write_xlsx_reports(self):
         """
-        After all wells are run, write plate based reports for OD,
-        intensity, and background.
+        Write plate based reports for OD, intensity, and background, with
+        a sheet per antigen.
         """
         # Write OD report
+        report_od = self.report_od
         with pd.ExcelWriter(self.od_path) as writer:
             for antigen_name in self.antigen_names:
-                sheet_df = self.report_od[antigen_name]
+                sheet_df = report_od[antigen_name]
                 sheet_df.to_excel(writer, sheet_name=antigen_name)
         self.logger.debug("Wrote OD plate report")
         # Write intensity report
+        report_int = self.report_int
         with pd.ExcelWriter(self.int_path) as writer:
             for antigen_name in self.antigen_names:
-                sheet_df = self.report_int[antigen_name]
+                sheet_df = report_int[antigen_name]
                 sheet_df.to_excel(writer, sheet_name=antigen_name)
         self.logger.debug("Wrote intensity plate report")
         # Write background report
+        report_bg = self.report_bg
         with pd.ExcelWriter(self.bg_path) as writer:
             for antigen_name in self.antigen_names:
-                sheet_df = self.report_bg[antigen_name]
+                sheet_df = report_bg[antigen_name]
                 sheet_df.to_excel(writer, sheet_name=antigen_name)
         self.logger.debug("Wrote background plate report")
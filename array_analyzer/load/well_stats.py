@@ -0,0 +1,136 @@
+import logging
+import natsort
+import os
+import pandas as pd
+
+import array_analyzer.extract.constants as constants
+
+
+class WellStatsWriter:
+    """
+    Class for streaming spot metrics per well to disk.
+    Each well's spot table is written to its own file in the stats_per_well
+    directory as soon as the well is processed, so wells processed before
+    a crash are kept. Files are first written to a temporary path and then
+    renamed, so a file is either complete or absent.
+    The stats_per_well.xlsx workbook, with one sheet per well, can be
+    exported from the per well files at the end of a run.
+    """
+    def __init__(self, file_format=None):
+        """
+        :param str file_format: Format of per well files, 'csv' or 'parquet'.
+            Parquet requires pyarrow or fastparquet. If None, use format
+            set in constants
+        """
+        self.logger = logging.getLogger(constants.LOG_NAME)
+        if file_format is None:
+            file_format = constants.WELL_STATS_FORMAT
+        assert file_format in {'csv', 'parquet'}, \
+            "Well stats format must be csv or parquet, not {}".format(file_format)
+        self.file_format = file_format
+        self.stats_dir = os.path.join(constants.RUN_PATH, constants.WELL_STATS_DIR)
+        os.makedirs(self.stats_dir, exist_ok=True)
+        self.xlsx_path = os.path.join(constants.RUN_PATH, 'stats_per_well.xlsx')
+
+    def get_path(self, name):
+        """
+        :param str name: Well name or 'antigens'
+        :return str path: Path to file
+        """
+        return os.path.join(self.stats_dir, '.'.join([name, self.file_format]))
+
+    def write_df(self, name, df):
+        """
+        Write dataframe to file, replacing any existing file with the same name.
+
+        :param str name: Well name or 'antigens'
+        :param pd.DataFrame df: Dataframe to write
+        """
+        path = self.get_path(name)
+        temp_path = path + '.tmp'
+        if self.file_format == 'csv':
+            df.to_csv(temp_path, index=False)
+        else:
+            df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    def read_df(self, name):
+        """
+        :param str name: Well name or 'antigens'
+        :return pd.DataFrame df: Dataframe read from file
+        """
+        path = self.get_path(name)
+        if self.file_format == 'csv':
+            return pd.read_csv(path, float_precision='round_trip')
+        return pd.read_parquet(path)
+
+    def write_antigens(self, antigen_df):
+        """
+        :param pd.DataFrame antigen_df: Antigen names and grid rows, cols
+        """
+        self.write_df('antigens', antigen_df)
+
+    def write_well(self, well_name, spots_df):
+        """
+        :param str well_name: Well name (e.g. 'B12')
+        :param pd.DataFrame spots_df: Metrics for all spots in the well grid
+        """
+        self.write_df(well_name, spots_df)
+
+    def get_well_names(self):
+        """
+        :return list well_names: Natsorted names of wells written to disk
+        """
+        well_names = []
+        extension = '.' + self.file_format
+        for file_name in os.listdir(self.stats_dir):
+            name, ext = os.path.splitext(file_name)
+            if ext == extension and name != 'antigens':
+                well_names.append(name)
+        return natsort.natsorted(well_names)
+
+    def remove_wells(self, well_names):
+        """
+        Remove files of wells, e.g. before rerunning them so that wells
+        that fail in the rerun don't keep their old metrics.
+
+        :param list well_names: Well names
+        """
+        for well_name in well_names:
+            path = self.get_path(well_name)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def import_xlsx(self, xlsx_path=None):
+        """
+        Write well sheets of an existing stats_per_well.xlsx workbook to
+        per well files, for rerunning wells of runs that only have the
+        workbook. Existing per well files are not overwritten.
+
+        :param str xlsx_path: Path to workbook. If None, use run path workbook
+        """
+        if xlsx_path is None:
+            xlsx_path = self.xlsx_path
+        if not os.path.isfile(xlsx_path):
+            return
+        written_wells = set(self.get_well_names())
+        sheets = pd.read_excel(xlsx_path, sheet_name=None, index_col=0)
+        for sheet_name, sheet_df in sheets.items():
+            if sheet_name == 'antigens' or sheet_name in written_wells:
+                continue
+            self.write_well(sheet_name, sheet_df.reset_index(drop=True))
+
+    def export_xlsx(self):
+        """
+        Export antigens and all written wells to stats_per_well.xlsx,
+        one sheet per well in natsorted order.
+        """
+        well_names = self.get_well_names()
+        with pd.ExcelWriter(self.xlsx_path) as xlsx_writer:
+            self.read_df('antigens').to_excel(xlsx_writer, sheet_name='antigens')
+            for well_name in well_names:
+                self.read_df(well_name).to_excel(xlsx_writer, sheet_name=well_name)
+        self.logger.info("Exported {} wells to {}".format(
+            len(well_names),
+            self.xlsx_path,
+        ))
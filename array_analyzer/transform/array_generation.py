@@ -1,11 +1,8 @@
-import itertools
 import numpy as np
-import pandas as pd
 
 import array_analyzer.extract.constants as constants
 import array_analyzer.extract.img_processing as img_processing
-import array_analyzer.extract.txt_parser as txt_parser
-import array_analyzer.utils.spot_regionprop as regionprop
+import array_analyzer.utils.spot_table as spot_tab
 
 
 def build_centroid_binary_blocks(cent_list, image_, params_, return_type='region'):
@@ -59,7 +56,44 @@ def build_centroid_binary_blocks(cent_list, image_, params_, return_type='region
         return target
 
 
-def get_spot_intensity(coords, im, background, search_range=2):
+def get_crop_bboxes(coords, im_shape, height, width):
+    """
+    Compute bounding boxes for crops centered at each coordinate, same as
+    img_processing.crop_image_at_center for each coordinate.
+
+    :param np.array coords: Center (row, col) coordinates (nbr points x 2)
+    :param tuple im_shape: Image shape
+    :param int height: Height of crops
+    :param int width: Width of crops
+    :return np.array bboxes: Bounding boxes (nbr points x 4), one row
+        per crop with [row min, col min, row max, col max]
+    """
+    bboxes = np.stack([
+        np.maximum(coords[:, 0] - height / 2, 0),
+        np.maximum(coords[:, 1] - width / 2, 0),
+        np.minimum(coords[:, 0] + height / 2, im_shape[0]),
+        np.minimum(coords[:, 1] + width / 2, im_shape[1]),
+    ], axis=1)
+    return np.rint(bboxes).astype(np.int32)
+
+
+def crop_stack(im, bboxes, height, width):
+    """
+    Stack crops of the same size from an image using fancy indexing.
+
+    :param np.array im: 2D image
+    :param np.array bboxes: Bounding boxes with row and col min in the
+        first two columns (nbr crops x 4)
+    :param int height: Height of crops
+    :param int width: Width of crops
+    :return np.array crops: Stack of crops (nbr crops x height x width)
+    """
+    rows = bboxes[:, 0, np.newaxis] + np.arange(height)
+    cols = bboxes[:, 1, np.newaxis] + np.arange(width)
+    return im[rows[:, :, np.newaxis], cols[:, np.newaxis, :]]
+
+
+def get_spot_intensity(coords, im, background, search_range=2, store_rois=False):
     """
     Extract signal and background intensity at each spot given the spot coordinate
     with the following steps:
@@ -67,6 +101,8 @@ def get_spot_intensity(coords, im, background, search_range=2):
     2. Segment 1 single spot from each image
     3. Get median intensity, background and OD within the spot mask
     4. If segmentation in 2. returns no mask, use a circular mask with average spot size as the spot mask and do 3.
+    ROIs of full size are cropped, segmented and measured together as
+    stacks. ROIs truncated by the image border are processed one by one.
 
     :param coords: list or tuple
         [row, col] coordinates of spots
@@ -76,89 +112,191 @@ def get_spot_intensity(coords, im, background, search_range=2):
         background image without spots
     :param float search_range: Factor of bounding box size in which to search for
         spots. E.g. 2 searches 2 * 2 * bbox width * bbox height
+    :param bool store_rois: Pack spot ROIs into the spot table, e.g. for
+        debug plots (default False)
     :return pd.DataFrame spots_df: Dataframe containing metrics for
         all spots in the grid
-    :return np.array spot_props: A SpotRegionprop object with ROIs for
-        each spot in the grid
+    :return SpotTable spot_table: Columnar table of spot metrics, with ROIs
+        for each spot in the grid if store_rois
     """
     # values in mm
     spot_width = constants.params['spot_width']
     pix_size = constants.params['pixel_size']
     n_rows = constants.params['rows']
     n_cols = constants.params['columns']
+    nbr_spots = n_rows * n_cols
+    coords = np.asarray(coords, dtype=np.float64)[:nbr_spots]
     # make spot size always odd
     spot_size = 2 * int(0.3 * spot_width / pix_size) + 1
     bbox_width = bbox_height = spot_size
     # Strel disk size for spot segmentation
     disk_size = int(np.rint(spot_size / 2.5))
+    # Segmenter reusing buffers for all spots in the well
+    spot_segmenter = img_processing.SpotSegmenter(
+        disk_size=disk_size,
+        thr_percent=75,
+        get_lcc=True,
+    )
+    # make bounding boxes larger to account for interpolation errors
+    spot_height_lg = int(np.round(search_range * bbox_height))
+    spot_width_lg = int(np.round(search_range * bbox_width))
 
-    # Array of SpotRegionprop objects to hold ROIs
-    spot_props = txt_parser.create_array(n_rows, n_cols, dtype=object)
-    # Dataframe to hold spot metrics for the well
-    spots_df = pd.DataFrame(columns=constants.SPOT_DF_COLS)
-    row_col_iter = itertools.product(np.arange(n_rows), np.arange(n_cols))
-    for count, (row_idx, col_idx) in enumerate(row_col_iter):
-        coord = coords[count, :]
-        # make bounding boxes larger to account for interpolation errors
-        spot_height = int(np.round(search_range * bbox_height))
-        spot_width = int(np.round(search_range * bbox_width))
-        # Create large bounding box around spot and segment
-        im_spot_lg, bbox_lg = img_processing.crop_image_at_center(
-            im=im,
-            center=coord,
-            height=spot_height,
-            width=spot_width,
-        )
-        mask_spot = img_processing.thresh_and_binarize(
-            image=im_spot_lg,
-            method='bright_spots',
-            disk_size=disk_size,
-            thr_percent=75,
-            get_lcc=True,
-        )
-        # Create spot and background instance
-        spot_prop = regionprop.SpotRegionprop(
-            row_idx=row_idx,
-            col_idx=col_idx,
-            label=count,
+    spot_table = spot_tab.SpotTable(n_rows, n_cols)
+    # Spot ROIs for debug plots
+    rois = [None] * nbr_spots
+
+    # Large ROIs that aren't truncated by the image border are stacked
+    bboxes_lg = get_crop_bboxes(coords, im.shape, spot_height_lg, spot_width_lg)
+    is_full = (bboxes_lg[:, 2] - bboxes_lg[:, 0] == spot_height_lg) & \
+              (bboxes_lg[:, 3] - bboxes_lg[:, 1] == spot_width_lg)
+    full_idxs = np.flatnonzero(is_full)
+    masks_full = np.zeros((0, spot_height_lg, spot_width_lg), dtype=bool)
+    if full_idxs.size > 0:
+        ims_full = crop_stack(im, bboxes_lg[full_idxs], spot_height_lg, spot_width_lg)
+        masks_full = spot_segmenter.segment_batch(ims_full)
+    # Mask spot should cover a certain percentage of ROI
+    has_mask = np.zeros(nbr_spots, dtype=bool)
+    has_mask[full_idxs] = masks_full.mean(axis=(1, 2)) > constants.SPOT_MIN_PERCENT_AREA
+    mask_idxs = np.flatnonzero(has_mask)
+    if mask_idxs.size > 0:
+        mask_rois = spot_table.generate_props_from_mask(
+            idxs=mask_idxs,
+            ims=ims_full[has_mask[full_idxs]],
+            backgrounds=crop_stack(
+                background,
+                bboxes_lg[mask_idxs],
+                spot_height_lg,
+                spot_width_lg,
+            ),
+            masks=masks_full[has_mask[full_idxs]],
+            bboxes=bboxes_lg[mask_idxs],
         )
+        for idx, roi in zip(mask_idxs, mask_rois):
+            rois[idx] = roi
 
-        # Mask spot should cover a certain percentage of ROI
-        if np.mean(mask_spot) > constants.SPOT_MIN_PERCENT_AREA:
-            # Mask detected
-            bg_spot_lg, _ = img_processing.crop_image_at_center(
-                im=background,
-                center=coord,
-                height=spot_height,
-                width=spot_width,
-            )
-            spot_prop.generate_props_from_mask(
-                image=im_spot_lg,
-                background=bg_spot_lg,
-                mask=mask_spot,
-                bbox=bbox_lg,
-            )
-        else:
-            # Crop around assumed spot size
-            im_spot, bbox = img_processing.crop_image_at_center(
-                im,
-                coord,
-                bbox_height,
-                bbox_width,
-            )
-            bg_spot, _ = img_processing.crop_image_at_center(
+    # Segmented spots without a mask use a disk of assumed spot size
+    bboxes_sm = get_crop_bboxes(coords, im.shape, bbox_height, bbox_width)
+    is_full_sm = (bboxes_sm[:, 2] - bboxes_sm[:, 0] == bbox_height) & \
+                 (bboxes_sm[:, 3] - bboxes_sm[:, 1] == bbox_width)
+    disk_idxs = np.flatnonzero(is_full & ~has_mask & is_full_sm)
+    if disk_idxs.size > 0:
+        disk_rois = spot_table.generate_props_from_disk(
+            idxs=disk_idxs,
+            ims=crop_stack(im, bboxes_sm[disk_idxs], bbox_height, bbox_width),
+            backgrounds=crop_stack(
                 background,
-                coord,
+                bboxes_sm[disk_idxs],
                 bbox_height,
                 bbox_width,
+            ),
+            bboxes=bboxes_sm[disk_idxs],
+            centroids=coords[disk_idxs],
+        )
+        for idx, roi in zip(disk_idxs, disk_rois):
+            rois[idx] = roi
+
+    # ROIs truncated by the image border
+    for idx in range(nbr_spots):
+        if rois[idx] is None:
+            rois[idx] = get_single_spot_props(
+                spot_table=spot_table,
+                idx=idx,
+                coord=coords[idx],
+                im=im,
+                background=background,
+                spot_size=spot_size,
+                disk_size=disk_size,
+                search_range=search_range,
+                spot_segmenter=spot_segmenter,
             )
-            spot_prop.generate_props_from_disk(
-                image=im_spot,
-                background=bg_spot,
-                bbox=bbox,
-                centroid=coord,
-            )
-        spots_df = spots_df.append(spot_prop.spot_dict, ignore_index=True)
-        spot_props[row_idx, col_idx] = spot_prop
 
-    return spots_df, spot_props
+    if store_rois:
+        spot_table.pack_rois(rois)
+    return spot_table.to_dataframe(), spot_table
+
+
+def get_single_spot_props(spot_table,
+                          idx,
+                          coord,
+                          im,
+                          background,
+                          spot_size,
+                          disk_size,
+                          search_range=2,
+                          spot_segmenter=None):
+    """
+    Segment a single spot and assign its properties to the spot table.
+
+    :param SpotTable spot_table: Spot table properties are assigned to
+    :param int idx: Spot index
+    :param np.array coord: [row, col] coordinate of spot
+    :param np.array im: Intensity image of the spots
+    :param np.array background: Background image without spots
+    :param int spot_size: Assumed spot size in pixels
+    :param int disk_size: Strel disk size for spot segmentation
+    :param float search_range: Factor of spot size in which to search for spot
+    :param SpotSegmenter spot_segmenter: Segmenter to reuse for spots in a well,
+        created for disk size if None
+    :return tuple roi: (image, background, mask) of spot
+    """
+    spot_height = int(np.round(search_range * spot_size))
+    spot_width = int(np.round(search_range * spot_size))
+    # Create large bounding box around spot and segment
+    im_spot_lg, bbox_lg = img_processing.crop_image_at_center(
+        im=im,
+        center=coord,
+        height=spot_height,
+        width=spot_width,
+    )
+    if spot_segmenter is None:
+        spot_segmenter = img_processing.SpotSegmenter(
+            disk_size=disk_size,
+            thr_percent=75,
+            get_lcc=True,
+        )
+    mask_spot = spot_segmenter.segment(im_spot_lg)
+    # Mask spot should cover a certain percentage of ROI
+    if np.mean(mask_spot) > constants.SPOT_MIN_PERCENT_AREA:
+        # Mask detected
+        bg_spot_lg, _ = img_processing.crop_image_at_center(
+            im=background,
+            center=coord,
+            height=spot_height,
+            width=spot_width,
+        )
+        rois = spot_table.generate_props_from_mask(
+            idxs=[idx],
+            ims=im_spot_lg[np.newaxis, ...],
+            backgrounds=bg_spot_lg[np.newaxis, ...],
+            masks=mask_spot[np.newaxis, ...],
+            bboxes=np.array([bbox_lg]),
+        )
+    else:
+        # Crop around assumed spot size
+        im_spot, bbox = img_processing.crop_image_at_center(
+            im,
+            coord,
+            spot_size,
+            spot_size,
+        )
+        bg_spot, _ = img_processing.crop_image_at_center(
+            background,
+            coord,
+            spot_size,
+            spot_size,
+        )
+        # Crop disk the same way if the spot is truncated by the border
+        disk_start = np.rint(np.asarray(coord) - spot_size / 2).astype(np.int32)
+        disk_mask = spot_tab.make_mask(spot_size)[
+            bbox[0] - disk_start[0]:bbox[2] - disk_start[0],
+            bbox[1] - disk_start[1]:bbox[3] - disk_start[1],
+        ]
+        rois = spot_table.generate_props_from_disk(
+            idxs=[idx],
+            ims=im_spot[np.newaxis, ...],
+            backgrounds=bg_spot[np.newaxis, ...],
+            bboxes=np.array([bbox]),
+            centroids=np.array([coord]),
+            mask=disk_mask,
+        )
+    return rois[0]
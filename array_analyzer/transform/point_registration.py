@@ -1,67 +1,125 @@
 import cv2 as cv
 import logging
 import numpy as np
+from scipy import spatial
 
 import array_analyzer.extract.constants as constants
 
 
-def icp(source, target, max_iterate=50, matrix_diff=1.):
+def fit_similarity_transform(source, target):
     """
-    Iterative closest point. Expects x, y coordinates of source and target in
-    an array with shape: nbr of points x 2
-
-    :param np.array source: Source spot coordinates
-    :param np.array target: Target spot coordinates
-    :param int max_iterate: Maximum number of registration iterations
-    :param float matrix_diff: Sum of absolute differences between transformation
-        matrices after one iteration
+    Closed form least squares fit of a similarity transform (translation,
+    rotation and uniform scale) mapping source coordinates to target
+    coordinates. The matrix has the same form as
+    ParticleFilter.get_translation_matrix.
+
+    :param np.array source: Source coordinates (nbr points x 2)
+    :param np.array target: Corresponding target coordinates (nbr points x 2)
+    :return np.array t_matrix: 2D transformation matrix (2 x 3)
+    """
+    assert source.shape == target.shape, \
+        "Source and target must have the same shape"
+    assert source.shape[0] >= 2, \
+        "At least two point pairs are needed to fit a similarity transform"
+    nbr_points = source.shape[0]
+    # Each point pair gives two linear equations in a, b, t0 and t1
+    variable_matrix = np.zeros((2 * nbr_points, 4))
+    variable_matrix[:nbr_points, 0] = source[:, 0]
+    variable_matrix[:nbr_points, 1] = source[:, 1]
+    variable_matrix[:nbr_points, 2] = 1
+    variable_matrix[nbr_points:, 0] = source[:, 1]
+    variable_matrix[nbr_points:, 1] = -source[:, 0]
+    variable_matrix[nbr_points:, 3] = 1
+    target_values = np.concatenate([target[:, 0], target[:, 1]])
+    coeffs, _, _, _ = np.linalg.lstsq(variable_matrix, target_values, rcond=-1)
+    a, b, t0, t1 = coeffs
+    t_matrix = np.array([[a, b, t0],
+                         [-b, a, t1]])
+    return t_matrix
+
+
+def transform_coords(coords, t_matrix):
+    """
+    Apply a 2D transformation matrix to coordinates, same as cv.transform.
+
+    :param np.array coords: Coordinates (nbr points x 2)
+    :param np.array t_matrix: 2D transformation matrix (2 x 3)
+    :return np.array trans_coords: Transformed coordinates (nbr points x 2)
+    """
+    return np.dot(coords, t_matrix[:, :2].T) + t_matrix[:, 2]
+
+
+def match_nearest(source, target_tree, t_matrix, outlier_factor=2.):
+    """
+    Match transformed source coordinates to their nearest target coordinates.
+    Matches with a distance larger than outlier_factor times the median
+    distance are outliers.
+
+    :param np.array source: Source coordinates (nbr points x 2)
+    :param scipy.spatial.cKDTree target_tree: Tree of target coordinates
+    :param np.array t_matrix: 2D transformation matrix (2 x 3)
+    :param float outlier_factor: Outlier distance in multiples of median
+    :return float residual: RMS distance of inlier matches
+    :return np.array target_idxs: Index of nearest target for each source point
+    :return np.array inliers: Boolean inlier mask for source points
+    """
+    dist, target_idxs = target_tree.query(transform_coords(source, t_matrix), k=1)
+    # Don't reject points within a pixel of their targets
+    inliers = dist <= outlier_factor * max(np.median(dist), 1.)
+    residual = np.sqrt(np.mean(dist[inliers] ** 2))
+    return residual, target_idxs, inliers
+
+
+def icp(source, target, t_matrix=None, max_iter=10, outlier_factor=2.):
+    """
+    Iterative closest point. Each iteration matches source points to their
+    nearest target points and fits a similarity transform in closed form to
+    the inlier pairs, until the matches don't change. Iterations are only
+    kept if they lower the residual.
+
+    :param np.array source: Source coordinates (nbr points x 2)
+    :param np.array target: Target coordinates (nbr points x 2)
+    :param np.array t_matrix: Initial 2D transformation matrix (2 x 3).
+        If None, start from identity
+    :param int max_iter: Maximum number of iterations
+    :param float outlier_factor: Outlier distance in multiples of median
     :return np.array t_matrix: 2D transformation matrix (2 x 3)
+    :return float residual: RMS distance between transformed source points
+        and their matched target points
     """
-    src = source.copy().astype(np.float32)
-    dst = target.copy().astype(np.float32)
-
-    src = np.expand_dims(src, 0)
-    dst = np.expand_dims(dst, 0)
-
-    # Initialize kNN module
-    knn = cv.ml.KNearest_create()
-    labels = np.array(range(dst.shape[1])).astype(np.float32)
-    knn.train(dst[0], cv.ml.ROW_SAMPLE, labels)
-    # Initialize transformation matrix
-    t_matrix = np.eye(3)
-    t_temp = np.eye(3)
-    t_old = t_matrix
-
-    # Iterate while matrix difference > threshold
-    for i in range(max_iterate):
-
-        # Find closest points
-        ret, results, neighbors, dist = knn.findNearest(src[0], 1)
-        # Outlier removal
-        idxs = np.squeeze(neighbors.astype(np.uint8))
-        dist_max = 2 * np.median(dist)
-        normal_idxs = np.where(dist < dist_max)[0]
-        idxs = idxs[normal_idxs]
-        # Find rigid transform
-        t_iter = cv.estimateRigidTransform(
-            src[0, normal_idxs, :],
-            dst[0, idxs, :],
-            fullAffine=False,
+    if t_matrix is None:
+        t_matrix = np.eye(3)[:2]
+    target_tree = spatial.cKDTree(target)
+    residual, target_idxs, inliers = match_nearest(
+        source,
+        target_tree,
+        t_matrix,
+        outlier_factor,
+    )
+    for i in range(max_iter):
+        if np.sum(inliers) < 3:
+            break
+        t_matrix_iter = fit_similarity_transform(
+            source[inliers],
+            target[target_idxs[inliers]],
+        )
+        residual_iter, target_idxs_iter, inliers_iter = match_nearest(
+            source,
+            target_tree,
+            t_matrix_iter,
+            outlier_factor,
         )
-        if t_iter is None:
-            print("ICP optimization failed.")
-            return None
-        t_temp[:2] = t_iter
-        src = cv.transform(src, t_iter)
-        t_matrix = np.dot(t_temp, t_matrix)
-        # Estimate diff
-        t_diff = sum(sum(abs(t_matrix[:2] - t_old[:2])))
-        t_old = t_matrix
-
-        if t_diff < matrix_diff:
+        if residual_iter >= residual:
             break
-
-    return t_matrix[:2]
+        t_matrix = t_matrix_iter
+        residual = residual_iter
+        # Stop when matches no longer change
+        if np.array_equal(target_idxs_iter, target_idxs) and \
+                np.array_equal(inliers_iter, inliers):
+            break
+        target_idxs = target_idxs_iter
+        inliers = inliers_iter
+    return t_matrix, residual
 
 
 class ParticleFilter:
@@ -69,7 +127,12 @@ class ParticleFilter:
     Framework for registering grid points to spot coordinates using a
     particle filter approach.
     """
-    def __init__(self, spot_coords, im_shape, fiducials_idx, random_seed=None):
+    def __init__(self,
+                 spot_coords,
+                 im_shape,
+                 fiducials_idx,
+                 random_seed=None,
+                 particle_prior=None):
         """
         Initialize by creating grid coordinates and particles.
 
@@ -78,6 +141,10 @@ class ParticleFilter:
         :param list fiducials_idx: Indices of grid coordinates which are considered
             fiducials
         :param int random_seed: Optional random seed for deterministic runs
+        :param np.array particle_prior: Optional mean particle (x, y, angle, scale),
+            e.g. the transform of wells already registered on the same plate.
+            If given, NBR_PARTICLES_PRIOR particles are created around it
+            using the narrower PRIOR_STDS
         """
         self.logger = logging.getLogger(constants.LOG_NAME)
         self.im_shape = im_shape
@@ -91,12 +158,22 @@ class ParticleFilter:
         self.registered_coords = None
         self.registration_ok = True
         self.registered_dist = None
-        self.standard_devs = np.array(constants.STDS)
-        self.nbr_particles = constants.NBR_PARTICLES
+        self.nbr_iterations = None
+        self.converged_particles = None
+        self.particle = None
         self.t_matrix = None
-        self.mean_point = constants.MEAN_POINT
-        self.scale_mean = constants.SCALE_MEAN
-        self.angle_mean = constants.ANGLE_MEAN
+        if particle_prior is None:
+            self.standard_devs = np.array(constants.STDS)
+            self.nbr_particles = constants.NBR_PARTICLES
+            self.mean_point = constants.MEAN_POINT
+            self.angle_mean = constants.ANGLE_MEAN
+            self.scale_mean = constants.SCALE_MEAN
+        else:
+            self.standard_devs = np.array(constants.PRIOR_STDS)
+            self.nbr_particles = constants.NBR_PARTICLES_PRIOR
+            self.mean_point = tuple(particle_prior[:2])
+            self.angle_mean = particle_prior[2]
+            self.scale_mean = particle_prior[3]
         self.particles = self.create_gaussian_particles()
 
     def create_reference_grid(self):
@@ -130,28 +207,29 @@ class ParticleFilter:
         grid_coords = np.vstack([grid_rows.T, grid_cols.T]).T
         return grid_coords
 
-    def create_gaussian_particles(self):
+    def create_gaussian_particles(self, nbr_particles=None):
         """
         Create particles from parameters x, y, scale and angle given mean and std.
         A particle is considered one set of parameters for a 2D translation matrix.
         Standard deviations of parameters x, y, angle and scale are predetermined
         and set in constants
 
-        :param tuple mean_point: Mean offset in x and y
-        :param float scale_mean: Mean scale of translation
-        :param float angle_mean: Mean angle of translation estimation
+        :param int nbr_particles: Number of particles to create. If None,
+            create self.nbr_particles particles
 
         :return np.array particles: Set of particle coordinates (nbr particles x 4)
         """
-        particles = np.empty((self.nbr_particles, 4))
+        if nbr_particles is None:
+            nbr_particles = self.nbr_particles
+        particles = np.empty((nbr_particles, 4))
         particles[:, 0] = self.mean_point[0] +\
-                          (np.random.randn(self.nbr_particles) * self.standard_devs[0])
+                          (np.random.randn(nbr_particles) * self.standard_devs[0])
         particles[:, 1] = self.mean_point[1] +\
-                          (np.random.randn(self.nbr_particles) * self.standard_devs[1])
+                          (np.random.randn(nbr_particles) * self.standard_devs[1])
         particles[:, 2] = self.angle_mean +\
-                          (np.random.randn(self.nbr_particles) * self.standard_devs[2])
+                          (np.random.randn(nbr_particles) * self.standard_devs[2])
         particles[:, 3] = self.scale_mean +\
-                          (np.random.randn(self.nbr_particles) * self.standard_devs[3])
+                          (np.random.randn(nbr_particles) * self.standard_devs[3])
         return particles
 
     @staticmethod
@@ -168,11 +246,57 @@ class ParticleFilter:
                             [-b, a, particle[1]]])
         return t_matrix
 
+    def transform_fiducials(self, particles):
+        """
+        Transform fiducial coordinates with the translation matrices of all
+        particles at once. Equivalent to applying get_translation_matrix
+        and cv.transform for each particle.
+
+        :param np.array particles: Set of particles (nbr particles x 4)
+        :return np.array trans_coords: Transformed fiducial coordinates
+            (nbr particles x nbr fiducials x 2)
+        """
+        angles = particles[:, 2] * np.pi / 180
+        a = (particles[:, 3] * np.cos(angles))[:, np.newaxis]
+        b = (particles[:, 3] * np.sin(angles))[:, np.newaxis]
+        fiducial_rows = self.fiducial_coords[:, 0][np.newaxis, :]
+        fiducial_cols = self.fiducial_coords[:, 1][np.newaxis, :]
+        trans_coords = np.empty(
+            (particles.shape[0], self.fiducial_coords.shape[0], 2),
+        )
+        trans_coords[..., 0] = a * fiducial_rows + b * fiducial_cols + \
+            particles[:, 0][:, np.newaxis]
+        trans_coords[..., 1] = a * fiducial_cols - b * fiducial_rows + \
+            particles[:, 1][:, np.newaxis]
+        return trans_coords
+
+    @staticmethod
+    def get_particle_spread(particles, dists):
+        """
+        Measure how ambiguous a fit is by the spread of the translations of
+        the best fitting REG_TOP_FRACTION of particles, in spot distances.
+        Converged unambiguous fits have a spread of a few percent, while
+        grids fitting equally well when shifted by a spot have a spread of
+        about half a spot distance or more.
+
+        :param np.array particles: Set of particles (nbr particles x 4)
+        :param np.array dists: Sum of squared distances for each particle
+        :return float spread: Largest standard deviation of the x and y
+            translations of the best particles, divided by spot distance
+        """
+        nbr_top = max(2, int(constants.REG_TOP_FRACTION * particles.shape[0]))
+        top_particles = particles[np.argsort(dists)[:nbr_top], :]
+        spread = np.max(np.std(top_particles[:, :2], axis=0))
+        return spread / constants.SPOT_DIST_PIX
+
     def particle_filter(self,
                         max_iter=100,
                         stop_criteria=.1,
                         iter_decrease=.8,
-                        nbr_outliers=0):
+                        nbr_outliers=0,
+                        adaptive=False,
+                        reuse_particles=False,
+                        reuse_std_scale=.1):
         """
         Particle filtering to determine best grid location.
         Start with a number of randomly placed particles. Compute distances
@@ -188,78 +312,170 @@ class ParticleFilter:
             down permutations
         :param int nbr_outliers: If registration hasn't converged, remove worst fitted
             spots when running particle filter
+        :param bool adaptive: Start with NBR_PARTICLES_MIN particles. If the
+            best fitting particles are spread out when the filter converges,
+            i.e. different translations fit about equally well (see
+            get_particle_spread), the fit is ambiguous. The number of
+            particles is then doubled (up to nbr_particles) by resampling
+            the converged particles and distorting them with reuse_std_scale
+            times the standard deviations, and iterations continue
+        :param bool reuse_particles: Start from the converged particles of the
+            previous run instead of the initial particles, e.g. when
+            repeating registration with outlier removal
+        :param float reuse_std_scale: Fraction of standard deviations used to
+            distort reused particles
         """
-        # Use kNN module to petrain spot coords
-        dst = self.spot_coords.copy().astype(np.float32)
-        knn = cv.ml.KNearest_create()
-        labels = np.array(range(dst.shape[0])).astype(np.float32)
-        knn.train(dst, cv.ml.ROW_SAMPLE, labels)
+        # Build kd-tree of spot coords once, query all particles at once
+        spot_tree = spatial.cKDTree(self.spot_coords)
+        nbr_spots = self.spot_coords.shape[0]
         # Make sure we don't have too many outliers
         if nbr_outliers > 0:
-            if len(labels) < nbr_outliers + 5 or self.fiducial_coords.shape[0] < nbr_outliers + 5:
+            if nbr_spots < nbr_outliers + 5 or self.fiducial_coords.shape[0] < nbr_outliers + 5:
                 nbr_outliers = 1
         self.logger.debug(
             "Particle filter, number of outliers: {}".format(nbr_outliers),
         )
-        dists = np.zeros(self.nbr_particles)
-        temp_stds = self.standard_devs.copy()
-        temp_particles = self.particles.copy()
+        nbr_fit = self.fiducial_coords.shape[0] - nbr_outliers
+        init_stds = self.standard_devs.copy()
+        if reuse_particles and self.converged_particles is not None:
+            temp_particles = self.converged_particles.copy()
+            init_stds = init_stds * reuse_std_scale
+        elif adaptive:
+            # Initial particles are independent, any subset is a smaller set
+            temp_particles = self.particles[:constants.NBR_PARTICLES_MIN].copy()
+        else:
+            temp_particles = self.particles.copy()
+        nbr_particles = temp_particles.shape[0]
+        temp_stds = init_stds.copy()
 
         # Iterate until min dist doesn't change
         min_dist_old = 10 ** 6
+        # Iterations since standard deviations were last reset
+        decrease_iter = 0
         for i in range(max_iter):
 
-            for p in range(self.nbr_particles):
-                particle = temp_particles[p]
-                # Generate transformation matrix
-                t_matrix = self.get_translation_matrix(particle)
-                trans_coords = cv.transform(np.array([self.fiducial_coords]), t_matrix)
-                trans_coords = trans_coords[0].astype(np.float32)
-                # Find nearest spots
-                ret, results, neighbors, dist = knn.findNearest(trans_coords, 1)
-                if nbr_outliers > 0:
-                    # Remove worst fitted spots
-                    dist = np.sort(dist, axis=0)
-                    dist = dist[:-nbr_outliers]
-
-                dists[p] = sum(dist)
+            trans_coords = self.transform_fiducials(temp_particles)
+            # Find nearest spots, distances are squared like OpenCV's kNN
+            dist, _ = spot_tree.query(trans_coords.reshape(-1, 2), k=1)
+            dist = dist.reshape(nbr_particles, -1) ** 2
+            if nbr_outliers > 0:
+                # Remove worst fitted spots
+                dist = np.sort(dist, axis=1)
+                dist = dist[:, :-nbr_outliers]
+            dists = np.sum(dist, axis=1)
 
             min_dist = np.min(dists)
             self.logger.debug("Iteration: {} min dist: {}".format(i, min_dist))
-            # See if min dist is not decreasing anymore
-            if abs(min_dist_old - min_dist) < stop_criteria:
-                break
-            min_dist_old = min_dist
-
             # Low distance should correspond to high probability
             weights = 1 / dists
             # Make weights sum to 1
             weights = weights / sum(weights)
+            # See if min dist is not decreasing anymore
+            if abs(min_dist_old - min_dist) < stop_criteria:
+                # Add particles if the best fits disagree on the grid position
+                if adaptive and nbr_particles < self.nbr_particles and \
+                        i < max_iter - 1:
+                    spread = self.get_particle_spread(temp_particles, dists)
+                    if spread > constants.REG_AMBIGUITY_SPREAD:
+                        nbr_new = min(nbr_particles, self.nbr_particles - nbr_particles)
+                        idxs = np.random.choice(nbr_particles, nbr_new, p=weights)
+                        new_particles = temp_particles[idxs, :] + \
+                            np.random.randn(nbr_new, 4) * \
+                            self.standard_devs * reuse_std_scale
+                        temp_particles = np.vstack([temp_particles, new_particles])
+                        nbr_particles = temp_particles.shape[0]
+                        self.logger.debug(
+                            "Ambiguous fit (spread {:.2f}), increasing number "
+                            "of particles to: {}".format(spread, nbr_particles),
+                        )
+                        min_dist_old = 10 ** 6
+                        continue
+                break
+            min_dist_old = min_dist
 
             # Importance sampling
-            idxs = np.random.choice(self.nbr_particles, self.nbr_particles, p=weights)
+            idxs = np.random.choice(nbr_particles, nbr_particles, p=weights)
             temp_particles = temp_particles[idxs, :]
 
             # Reduce standard deviations a little every iteration
-            temp_stds = temp_stds * iter_decrease ** i
+            temp_stds = temp_stds * iter_decrease ** decrease_iter
+            decrease_iter += 1
             # Distort particles
             for c in range(4):
-                distort = np.random.randn(self.nbr_particles)
+                distort = np.random.randn(nbr_particles)
                 temp_particles[:, c] = temp_particles[:, c] + distort * temp_stds[c]
 
+        self.nbr_iterations = i + 1
+        self.converged_particles = temp_particles
         # Get best particle in terms of nearest to spots
-        particle = temp_particles[dists == dists.min(), :][0]
+        self.particle = temp_particles[dists == dists.min(), :][0]
 
         # Generate transformation matrix
-        self.t_matrix = self.get_translation_matrix(particle)
-        self.registered_dist = min_dist / (self.fiducial_coords.shape[0] - nbr_outliers)
+        self.t_matrix = self.get_translation_matrix(self.particle)
+        self.registered_dist = min_dist / nbr_fit
         self.logger.info("Particle filter min dist: {}".format(self.registered_dist))
+        self.logger.info("Particle filter iterations: {}, particles: {}".format(
+            self.nbr_iterations,
+            nbr_particles,
+        ))
         if self.registered_dist > constants.REG_DIST_THRESH:
             self.registration_ok = False
         else:
             self.registration_ok = True
         self.logger.info("Is registration ok: {}".format(self.registration_ok))
 
+    def compute_residual(self, t_matrix=None, outlier_factor=2.):
+        """
+        Compute root mean square distance in pixels between transformed
+        fiducials and their nearest spots. Fiducials with a distance larger
+        than outlier_factor times the median distance are ignored.
+
+        :param np.array t_matrix: 2D transformation matrix (2 x 3). If None,
+            use current transformation matrix
+        :param float outlier_factor: Outlier distance in multiples of median
+        :return float residual: RMS distance of inlier fiducials
+        :return np.array spot_idxs: Index of nearest spot for each fiducial
+        :return np.array inliers: Boolean inlier mask for fiducials
+        """
+        if t_matrix is None:
+            t_matrix = self.t_matrix
+        assert t_matrix is not None, \
+            "Transformation matrix not computed"
+        return match_nearest(
+            self.fiducial_coords,
+            spatial.cKDTree(self.spot_coords),
+            t_matrix,
+            outlier_factor,
+        )
+
+    def refine_registration(self, max_iter=10, outlier_factor=2.):
+        """
+        Refine the particle filter transform with iterative closest point
+        (see icp), matching fiducials to spots.
+
+        :param int max_iter: Maximum number of iterations
+        :param float outlier_factor: Outlier distance in multiples of median
+        :return float residual: RMS distance in pixels between refined
+            fiducials and matched spots
+        """
+        t_matrix, residual = icp(
+            source=self.fiducial_coords,
+            target=self.spot_coords,
+            t_matrix=self.t_matrix,
+            max_iter=max_iter,
+            outlier_factor=outlier_factor,
+        )
+        self.t_matrix = t_matrix
+        # Update particle to match transformation matrix
+        self.particle = np.array([
+            t_matrix[0, 2],
+            t_matrix[1, 2],
+            np.arctan2(t_matrix[0, 1], t_matrix[0, 0]) * 180 / np.pi,
+            np.sqrt(t_matrix[0, 0] ** 2 + t_matrix[0, 1] ** 2),
+        ])
+        self.logger.info("Refined registration residual: {}".format(residual))
+        return residual
+
     def compute_registered_coords(self):
         """
         Given initial grid coordinates and transformation matrix, compute
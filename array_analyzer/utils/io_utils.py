@@ -1,6 +1,7 @@
 import cv2 as cv
 from datetime import datetime
 import glob
+import importlib.util
 import logging
 import natsort
 import numpy as np
@@ -24,12 +25,24 @@ def read_to_grey(path_, wellimage_):
     return im, os.path.basename(image_path)
 
 
-def read_gray_im(im_path):
+def read_gray_im(im_path, mmap=False):
     """
     Read image from full path to file location.
+    Uncompressed grayscale TIFFs can be memory mapped (requires tifffile),
+    so that pixels are only read from disk when they're accessed, e.g. when
+    the well is cropped. Other images are fully decoded.
+    Note that full resolution well segmentation (find_well_border) accesses
+    every pixel, so mapping only saves memory if the well is located with
+    find_well_border_fast, i.e. if well_downsample > 1.
+
     :param str im_path: Path to image
-    :return np.array im: Grayscale image
+    :param bool mmap: Memory map image if possible
+    :return np.array im: Grayscale image (read only np.memmap if mapped)
     """
+    if mmap and im_path.lower().endswith(('.tif', '.tiff')):
+        im = memmap_tif(im_path)
+        if im is not None:
+            return im
     try:
         im = cv.imread(im_path, cv.IMREAD_GRAYSCALE | cv.IMREAD_ANYDEPTH)
     except IOError as e:
@@ -39,6 +52,38 @@ def read_gray_im(im_path):
     return im
 
 
+def memmap_tif(im_path):
+    """
+    Memory map an uncompressed, single channel integer TIFF.
+
+    :param str im_path: Path to TIFF
+    :return np.memmap im: Read only memory mapped image, None if tifffile
+        isn't installed or the image can't be mapped
+    """
+    if importlib.util.find_spec('tifffile') is None:
+        return None
+    import tifffile
+    try:
+        im = tifffile.memmap(im_path, mode='r')
+    except ValueError:
+        # Compressed or tiled image data can't be mapped
+        return None
+    if im.ndim != 2 or not np.issubdtype(im.dtype, np.integer):
+        return None
+    return im
+
+
+def materialize_roi(im):
+    """
+    Copy an image crop into memory, e.g. a crop of a memory mapped image,
+    so that the full image doesn't need to be kept around.
+
+    :param np.array im: Image or view of image
+    :return np.array im_roi: Contiguous in-memory copy of image
+    """
+    return np.array(im, copy=True)
+
+
 def get_max_intensity(im):
     """
     Gets image max intensity, assuming image dtype is an 8 or 16 bit
@@ -70,6 +115,25 @@ def get_image_paths(input_dir):
         with one image each
     :return dict well_images: Well name key, path to found image value
     """
+    well_images = find_well_images(input_dir)
+    # Check that wells are found, refer to docs if not
+    assert len(well_images) > 0,\
+        "No wells found, check documentation for naming conventions"\
+        "And conversion scripts 12to16bit.py and rename_only.py"
+
+    return well_images
+
+
+def find_well_images(input_dir):
+    """
+    Find well images currently in input directory, e.g. while it's still
+    being written to by the scanner.
+
+    :param str input_dir: Input directory, may contain images or subdirectories
+        with one image each
+    :return dict well_images: Well name key, path to found image value,
+        empty if no images are found
+    """
     extensions = ('.png', '.tif')
 
     image_names = []
@@ -105,11 +169,6 @@ def get_image_paths(input_dir):
             if re.match(r'[A-P][0-9]{1,2}',well_name):
                 well_images[well_name] = im_name
 
-    # Check that wells are found, refer to docs if not
-    assert len(well_images) > 0,\
-        "No wells found, check documentation for naming conventions"\
-        "And conversion scripts 12to16bit.py and rename_only.py"
-
     return well_images
 
 
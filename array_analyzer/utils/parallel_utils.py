@@ -0,0 +1,96 @@
+import concurrent.futures
+import cv2 as cv
+import logging
+import os
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.utils.io_utils as io_utils
+
+
+def get_constants_state():
+    """
+    Collect the values assigned in the constants namespace so they can be
+    sent to worker processes. Metadata parsing only populates constants in
+    the main process.
+
+    :return dict constants_state: Constant names and their values
+    """
+    constants_state = {}
+    for name, value in vars(constants).items():
+        if name.startswith('__'):
+            continue
+        constants_state[name] = value
+    return constants_state
+
+
+def init_worker(constants_state):
+    """
+    Initialize a worker process by setting the constants namespace to the
+    state of the main process and attaching the run log file.
+
+    :param dict constants_state: Constant names and their values
+    """
+    for name, value in constants_state.items():
+        setattr(constants, name, value)
+    # Parallelism is over wells, don't oversubscribe cores with OpenCV threads
+    cv.setNumThreads(1)
+    logger = logging.getLogger(constants.LOG_NAME)
+    # Forked workers inherit the log handler, spawned workers don't
+    if len(logger.handlers) == 0 and os.path.isdir(constants.RUN_PATH):
+        log_level = 20
+        if constants.DEBUG:
+            log_level = 10
+        io_utils.make_logger(
+            log_dir=constants.RUN_PATH,
+            logger_name=constants.LOG_NAME,
+            log_level=log_level,
+        )
+
+
+def make_executor(nbr_workers):
+    """
+    Create a pool of worker processes initialized with the current state of
+    the constants namespace, so workflows can start the pool once and feed
+    it all wells of a run. Constants set after the pool is created aren't
+    seen by workers.
+
+    :param int nbr_workers: Number of worker processes
+    :return ProcessPoolExecutor executor: Pool of initialized workers
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=nbr_workers,
+        initializer=init_worker,
+        initargs=(get_constants_state(),),
+    )
+
+
+def map_wells(well_fn, well_args, nbr_workers=1, executor=None):
+    """
+    Apply a well processing function to each set of arguments, either
+    serially or in a pool of worker processes. Results are yielded in the
+    same order as the arguments regardless of which well finishes first,
+    so plate reports are assembled in deterministic well order.
+
+    :param function well_fn: Picklable function processing one well
+    :param list well_args: List of argument tuples, one per well
+    :param int nbr_workers: Number of worker processes. If 1 (default),
+        wells are processed in the current process
+    :param ProcessPoolExecutor executor: Existing pool from make_executor
+        to submit wells to. If None, a pool is created for this call
+    :return generator: Result of well_fn for each well, in well_args order
+    """
+    if executor is not None:
+        futures = [executor.submit(well_fn, *args) for args in well_args]
+        for future in futures:
+            yield future.result()
+        return
+
+    if nbr_workers is None or nbr_workers <= 1 or len(well_args) <= 1:
+        for args in well_args:
+            yield well_fn(*args)
+        return
+
+    with make_executor(min(nbr_workers, len(well_args))) as executor:
+        futures = [executor.submit(well_fn, *args) for args in well_args]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+from skimage.morphology import disk
+
+import array_analyzer.extract.constants as constants
+
+# Columns holding integer values, all other spot columns are float
+INT_COLS = ['grid_row',
+            'grid_col',
+            'bbox_row_min',
+            'bbox_row_max',
+            'bbox_col_min',
+            'bbox_col_max']
+
+
+def make_mask(im_size):
+    """
+    Creates disk shaped mask the size of image.
+
+    :param int im_size: Image size (assume square shape)
+    :return np.array mask: Binary disk shaped mask
+    """
+    mask = disk(int(im_size / 2), dtype=np.uint8)
+    return mask
+
+
+def masked_stats(ims, masks):
+    """
+    Compute mean and median of each image in a stack inside its mask.
+
+    :param np.array ims: Stack of 2D images (nbr images x h x w)
+    :param np.array masks: Stack of binary masks, same shape as ims
+    :return np.array means: Mean of each image inside mask (nbr images)
+    :return np.array medians: Median of each image inside mask (nbr images)
+    """
+    masked_ims = np.where(masks > 0, ims, np.nan)
+    masked_ims = masked_ims.reshape(ims.shape[0], -1)
+    return np.nanmean(masked_ims, axis=1), np.nanmedian(masked_ims, axis=1)
+
+
+def mask_bboxes(masks):
+    """
+    Compute centroids and bounding boxes of the foreground in a stack of
+    binary masks, same as skimage regionprops for a single region.
+
+    :param np.array masks: Stack of binary masks (nbr masks x h x w),
+        each with a nonempty foreground
+    :return np.array centroids: Centroid (row, col) of masks (nbr masks x 2)
+    :return np.array bboxes: Bounding boxes [row min, col min, row max,
+        col max] of masks (nbr masks x 4)
+    """
+    masks = masks > 0
+    mask_rows = masks.any(axis=2)
+    mask_cols = masks.any(axis=1)
+    mask_area = masks.sum(axis=(1, 2))
+    centroids = np.stack([
+        (masks.sum(axis=2) * np.arange(masks.shape[1])).sum(axis=1) / mask_area,
+        (masks.sum(axis=1) * np.arange(masks.shape[2])).sum(axis=1) / mask_area,
+    ], axis=1)
+    bboxes = np.stack([
+        np.argmax(mask_rows, axis=1),
+        np.argmax(mask_cols, axis=1),
+        masks.shape[1] - np.argmax(mask_rows[:, ::-1], axis=1),
+        masks.shape[2] - np.argmax(mask_cols[:, ::-1], axis=1),
+    ], axis=1)
+    return centroids, bboxes
+
+
+class SpotTable:
+
+    def __init__(self, nbr_rows, nbr_cols):
+        """
+        Columnar table of spot properties for a grid of spots: centroid,
+        bounding box, mean and median intensity and background, and OD.
+        Each property is a NumPy array with one value per spot in row major
+        grid order. Spot ROIs (image, background and mask crops) can be
+        packed into flat buffers with offsets for debug plots.
+
+        :param int nbr_rows: Number of rows in spot grid
+        :param int nbr_cols: Number of columns in spot grid
+        """
+        self.nbr_rows = nbr_rows
+        self.nbr_cols = nbr_cols
+        self.nbr_spots = nbr_rows * nbr_cols
+        self.df_cols = constants.SPOT_DF_COLS
+        self.columns = {}
+        for col_name in self.df_cols:
+            if col_name in INT_COLS:
+                self.columns[col_name] = np.zeros(self.nbr_spots, np.int64)
+            else:
+                self.columns[col_name] = np.full(self.nbr_spots, np.nan)
+        self.columns['grid_row'], self.columns['grid_col'] = np.divmod(
+            np.arange(self.nbr_spots),
+            nbr_cols,
+        )
+        # Packed ROI buffers
+        self.roi_offsets = None
+        self.roi_shapes = None
+        self.roi_images = None
+        self.roi_backgrounds = None
+        self.roi_masks = None
+
+    def __len__(self):
+        return self.nbr_spots
+
+    def __getitem__(self, col_name):
+        return self.columns[col_name]
+
+    def set_bboxes(self, idxs, bboxes):
+        """
+        Assign bounding boxes to spots.
+
+        :param np.array idxs: Spot indices
+        :param np.array bboxes: Bounding boxes [row min, col min, row max,
+            col max] (nbr idxs x 4)
+        """
+        self.columns['bbox_row_min'][idxs] = bboxes[:, 0]
+        self.columns['bbox_col_min'][idxs] = bboxes[:, 1]
+        self.columns['bbox_row_max'][idxs] = bboxes[:, 2]
+        self.columns['bbox_col_max'][idxs] = bboxes[:, 3]
+
+    def compute_stats(self, idxs, ims, backgrounds, masks):
+        """
+        Compute mean and median values for images and backgrounds inside
+        masks, and the OD of the spots.
+        Optical density is affected by Beer-Lambert law
+        i.e. I = I0*e^-{c*thickness). I0/I = e^{c*thickness).
+
+        :param np.array idxs: Spot indices
+        :param np.array ims: Stack of spot images (nbr idxs x h x w)
+        :param np.array backgrounds: Stack of corresponding backgrounds
+        :param np.array masks: Stack of corresponding spot masks
+        """
+        intensity_mean, intensity_median = masked_stats(ims, masks)
+        bg_mean, bg_median = masked_stats(backgrounds, masks)
+        self.columns['intensity_mean'][idxs] = intensity_mean
+        self.columns['intensity_median'][idxs] = intensity_median
+        self.columns['bg_mean'][idxs] = bg_mean
+        self.columns['bg_median'][idxs] = bg_median
+        with np.errstate(divide='ignore', invalid='ignore'):
+            od_norm = np.log10(bg_median / intensity_median)
+        # TODO: What should be the default when intensity is zero?
+        od_norm[np.isinf(od_norm)] = 2.
+        self.columns['od_norm'][idxs] = od_norm
+
+    def generate_props_from_disk(self,
+                                 idxs,
+                                 ims,
+                                 backgrounds,
+                                 bboxes,
+                                 centroids,
+                                 mask=None):
+        """
+        Assign properties using a disk shaped mask.
+
+        :param np.array idxs: Spot indices
+        :param np.array ims: Stack of square spot images (nbr idxs x h x w)
+        :param np.array backgrounds: Stack of corresponding backgrounds
+        :param np.array bboxes: Bounding boxes of images (nbr idxs x 4)
+        :param np.array centroids: Center coordinates (nbr idxs x 2)
+        :param np.array mask: Disk shaped mask (h x w). If None, create a
+            disk the size of the images
+        :return list rois: (image, background, mask) for each spot
+        """
+        if mask is None:
+            mask = make_mask(ims.shape[1])
+        masks = np.broadcast_to(mask, ims.shape)
+        self.columns['centroid_row'][idxs] = centroids[:, 0]
+        self.columns['centroid_col'][idxs] = centroids[:, 1]
+        self.set_bboxes(idxs, bboxes)
+        self.compute_stats(idxs, ims, backgrounds, masks)
+        return [(ims[i], backgrounds[i], mask) for i in range(len(idxs))]
+
+    def generate_props_from_mask(self, idxs, ims, backgrounds, masks, bboxes):
+        """
+        Assign properties from the segmented spot mask in each image.
+        Centroids and bounding boxes are those of the masks, in the
+        coordinates of the full image.
+
+        :param np.array idxs: Spot indices
+        :param np.array ims: Stack of large spot ROI images (nbr idxs x h x w)
+        :param np.array backgrounds: Stack of corresponding backgrounds
+        :param np.array masks: Stack of corresponding binary spot masks
+        :param np.array bboxes: Bounding boxes of images (nbr idxs x 4)
+        :return list rois: (image, background, mask) cropped to the mask
+            bounding box for each spot
+        """
+        centroids, bboxes_mask = mask_bboxes(masks)
+        self.columns['centroid_row'][idxs] = bboxes[:, 0] + centroids[:, 0]
+        self.columns['centroid_col'][idxs] = bboxes[:, 1] + centroids[:, 1]
+        self.set_bboxes(idxs, bboxes[:, [0, 1, 0, 1]] + bboxes_mask)
+        self.compute_stats(idxs, ims, backgrounds, masks)
+        rois = []
+        for i, (min_row, min_col, max_row, max_col) in enumerate(bboxes_mask):
+            roi = np.s_[min_row:max_row, min_col:max_col]
+            rois.append((ims[i][roi], backgrounds[i][roi], masks[i][roi]))
+        return rois
+
+    def pack_rois(self, rois):
+        """
+        Pack spot ROIs into flat buffers, one for images, backgrounds and
+        masks each, with offsets and shapes per spot.
+
+        :param list rois: (image, background, mask) for each spot
+        """
+        self.roi_shapes = np.array([roi[0].shape for roi in rois], np.int64)
+        sizes = np.prod(self.roi_shapes, axis=1)
+        self.roi_offsets = np.zeros(self.nbr_spots + 1, np.int64)
+        self.roi_offsets[1:] = np.cumsum(sizes)
+        self.roi_images = np.concatenate([roi[0].ravel() for roi in rois])
+        self.roi_backgrounds = np.concatenate([roi[1].ravel() for roi in rois])
+        self.roi_masks = np.concatenate([roi[2].ravel() > 0 for roi in rois])
+
+    def get_roi(self, idx):
+        """
+        Get packed ROI of spot.
+
+        :param int idx: Spot index
+        :return np.array image: Spot image
+        :return np.array background: Spot background
+        :return np.array mask: Binary spot mask
+        """
+        assert self.roi_offsets is not None, "ROIs haven't been packed"
+        roi = slice(self.roi_offsets[idx], self.roi_offsets[idx + 1])
+        shape = tuple(self.roi_shapes[idx])
+        return (self.roi_images[roi].reshape(shape),
+                self.roi_backgrounds[roi].reshape(shape),
+                self.roi_masks[roi].reshape(shape))
+
+    def to_dataframe(self):
+        """
+        Create dataframe of spot properties.
+
+        :return pd.DataFrame spots_df: Properties for all spots in the grid
+        """
+        return pd.DataFrame(self.columns, columns=self.df_cols)
@@ -0,0 +1,105 @@
+import collections
+import contextlib
+import json
+import numpy as np
+import time
+
+
+class StageTimer:
+    """
+    Records wall clock times of named processing stages, e.g. for one well
+    or for a whole run. Extraction workflows time the stages 'read',
+    'well_border', 'spot_detection', 'registration', 'background',
+    'spot_intensity', 'report' and 'debug_plots'. Timers are picklable so
+    well timers can be returned from worker processes and merged into the
+    run timer.
+    """
+    def __init__(self, name=None):
+        """
+        :param str name: Name of what is timed, e.g. well name
+        """
+        self.name = name
+        # Stage names and their times in seconds, in order of first use
+        self.stage_times = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def time_stage(self, stage_name):
+        """
+        Context manager adding the time spent in its block to a stage.
+        Time is recorded even if the block raises an exception.
+
+        :param str stage_name: Stage name (e.g. 'registration')
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage_name, time.perf_counter() - start_time)
+
+    def add_time(self, stage_name, stage_time):
+        """
+        :param str stage_name: Stage name
+        :param float stage_time: Time in seconds
+        """
+        self.stage_times.setdefault(stage_name, []).append(stage_time)
+
+    def merge(self, timer):
+        """
+        Add all stage times of another timer to this one.
+
+        :param StageTimer timer: Timer, e.g. of a well
+        """
+        for stage_name, stage_times in timer.stage_times.items():
+            self.stage_times.setdefault(stage_name, []).extend(stage_times)
+
+    def get_total(self):
+        """
+        :return float total_time: Sum of all stage times in seconds
+        """
+        return float(sum(sum(times) for times in self.stage_times.values()))
+
+    def get_summary(self):
+        """
+        Aggregate times per stage.
+
+        :return dict summary: Stage names and their count, total, mean,
+            median (p50) and 95th percentile (p95) times in seconds
+        """
+        summary = collections.OrderedDict()
+        for stage_name, stage_times in self.stage_times.items():
+            summary[stage_name] = {
+                'count': len(stage_times),
+                'total': float(np.sum(stage_times)),
+                'mean': float(np.mean(stage_times)),
+                'p50': float(np.percentile(stage_times, 50)),
+                'p95': float(np.percentile(stage_times, 95)),
+            }
+        return summary
+
+
+def write_stage_times(stage_times_path, run_timer, well_timers, wall_time=None):
+    """
+    Write aggregated stage times of a run and of each well to json.
+    Run stage totals are summed over wells, so with several workers they
+    can exceed the wall time of the run.
+
+    :param str stage_times_path: Path to json file
+    :param StageTimer run_timer: Timer with times of all stages in the run
+    :param list well_timers: Timers of each well
+    :param float wall_time: Wall clock time of the run in seconds
+    """
+    stage_times = {
+        'run': {
+            'wall_time': wall_time,
+            'total': run_timer.get_total(),
+            'stages': run_timer.get_summary(),
+        },
+        'wells': collections.OrderedDict(),
+    }
+    for well_timer in well_timers:
+        stage_times['wells'][well_timer.name] = {
+            'total': well_timer.get_total(),
+            'stages': well_timer.get_summary(),
+        }
+    with open(stage_times_path, 'w') as json_file:
+        json.dump(stage_times, json_file, indent=2)
@@ -0,0 +1,136 @@
+import logging
+import os
+import time
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.utils.io_utils as io_utils
+
+
+def get_plate_wells():
+    """
+    :return list well_names: Names of all wells in a 96 well plate, row-wise
+    """
+    well_names = []
+    for row, cols in constants.WELL_OUTPUT_TEMPLATE.items():
+        well_names.extend(['{}{}'.format(row, col) for col in cols])
+    return well_names
+
+
+class WellImageWatcher:
+    """
+    Polls an input directory that is being written to, e.g. by a plate
+    scanner, and reports well images as soon as they're completely written.
+    An image is considered complete when its size and modification time
+    haven't changed for a given time. Polling is used rather than file
+    system events so it works on network mounts and any platform.
+    """
+
+    def __init__(self,
+                 input_dir,
+                 expected_wells=None,
+                 poll_interval=2.,
+                 stable_time=2.,
+                 timeout=600):
+        """
+        :param str input_dir: Input directory the well images appear in
+        :param list expected_wells: Well names to wait for. If None, all
+            wells of a 96 well plate
+        :param float poll_interval: Seconds between directory scans
+        :param float stable_time: Seconds an image must be unchanged
+            before it's reported
+        :param float timeout: Stop watching if no well image has been
+            reported, created or changed for this many seconds, not counting
+            the time batches are processed. None waits indefinitely
+        """
+        self.input_dir = input_dir
+        if expected_wells is None:
+            expected_wells = get_plate_wells()
+        self.expected_wells = set(expected_wells)
+        self.poll_interval = poll_interval
+        self.stable_time = stable_time
+        self.timeout = timeout
+        # Well names of images that have been reported
+        self.done_wells = set()
+        # (size, modification time, time first seen) of unreported images
+        self.pending_stats = {}
+        # Last time an unreported image appeared or changed
+        self.last_change_time = None
+        self.logger = logging.getLogger(constants.LOG_NAME)
+
+    def is_complete(self):
+        """
+        :return bool complete: All expected wells have been reported
+        """
+        return self.expected_wells.issubset(self.done_wells)
+
+    def poll(self):
+        """
+        Scan the input directory once and collect well images that have
+        been unchanged for stable_time. Wells that aren't expected are
+        ignored.
+
+        :return list well_args: (well name, image path) of wells that are
+            ready, in well order
+        """
+        well_images = io_utils.find_well_images(self.input_dir)
+        poll_time = time.time()
+        well_args = []
+        for well_name, im_path in well_images.items():
+            if well_name in self.done_wells or well_name not in self.expected_wells:
+                continue
+            try:
+                file_stat = os.stat(im_path)
+            except FileNotFoundError:
+                # Image was moved or renamed while scanning
+                continue
+            file_state = (file_stat.st_size, file_stat.st_mtime_ns)
+            if well_name not in self.pending_stats or \
+                    self.pending_stats[well_name][:2] != file_state:
+                self.pending_stats[well_name] = file_state + (poll_time,)
+                self.last_change_time = poll_time
+                if self.stable_time > 0:
+                    continue
+            if file_state[0] > 0 and \
+                    poll_time - self.pending_stats[well_name][2] >= self.stable_time:
+                well_args.append((well_name, im_path))
+                self.done_wells.add(well_name)
+                del self.pending_stats[well_name]
+        return well_args
+
+    def watch(self):
+        """
+        Poll the input directory until all expected wells have been
+        reported or no well image has been reported, created or changed
+        within the timeout. The timeout restarts when the caller is done
+        processing a batch, so slow processing doesn't count towards it.
+
+        :return generator: Lists of (well name, image path) tuples, one for
+            each scan that found new complete images
+        """
+        last_new_time = time.time()
+        while not self.is_complete():
+            well_args = self.poll()
+            if len(well_args) > 0:
+                last_new_time = time.time()
+                self.logger.info("New wells: {}, {}/{} done".format(
+                    [args[0] for args in well_args],
+                    len(self.done_wells),
+                    len(self.expected_wells),
+                ))
+                yield well_args
+                # Images may have been written while the batch was processed
+                last_new_time = time.time()
+                # Don't wait after processing, more images may have appeared
+                continue
+            if self.last_change_time is not None:
+                # Images still being written restart the timeout
+                last_new_time = max(last_new_time, self.last_change_time)
+            if self.timeout is not None and \
+                    time.time() - last_new_time > self.timeout:
+                missing_wells = sorted(self.expected_wells - self.done_wells)
+                self.logger.warning(
+                    "No new well images for {} s, finalizing without "
+                    "wells: {}".format(self.timeout, missing_wells),
+                )
+                return
+            time.sleep(self.poll_interval)
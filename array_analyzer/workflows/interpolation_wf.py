@@ -1,100 +1,154 @@
+import logging
 import time
 import os
 import numpy as np
-import pandas as pd
 import skimage.io as io
 
 import array_analyzer.extract.image_parser as image_parser
-import array_analyzer.extract.txt_parser as txt_parser
 import array_analyzer.extract.img_processing as img_processing
 import array_analyzer.load.debug_plots as debug_plots
 import array_analyzer.load.report as report
+import array_analyzer.load.well_stats as well_stats
 import array_analyzer.extract.constants as constants
 import array_analyzer.transform.array_generation as array_gen
 import array_analyzer.extract.background_estimator as background_estimator
 import array_analyzer.utils.io_utils as io_utils
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.utils.timing as timing
 from array_analyzer.extract.metadata import MetaData
 
 
-def interp(input_dir, output_dir):
+def interp(input_dir, output_dir, nbr_workers=1):
+    """
+    For each image in input directory, segment the brightest spots and
+    interpolate the spot grid from their centroids.
 
+    :param str input_dir: Input directory containing images and metadata
+    :param str output_dir: Directory where output is written to
+    :param int nbr_workers: Number of processes wells are distributed over.
+        Results are collected in well order (default 1, no multiprocessing)
+    """
+    start_time = time.time()
+    run_timer = timing.StageTimer('run')
     MetaData(input_dir, output_dir)
 
-    # Initialize background estimator
-    bg_estimator = background_estimator.BackgroundEstimator2D(
-        block_size=128,
-        order=2,
-        normalize=False,
-    )
     reporter = report.ReportWriter()
-    well_xlsx_path = os.path.join(
-        constants.RUN_PATH,
-        'stats_per_well.xlsx',
-    )
-    well_xlsx_writer = pd.ExcelWriter(well_xlsx_path)
-    antigen_df = reporter.get_antigen_df()
-    antigen_df.to_excel(well_xlsx_writer, sheet_name='antigens')
+    stats_writer = well_stats.WellStatsWriter()
+    stats_writer.write_antigens(reporter.get_antigen_df())
+    reporter.create_new_reports()
 
     # ================
-    # loop over images => good place for multiproc?  careful with columns in report
+    # loop over images, columns in report are assigned in well order
     # ================
     well_images = io_utils.get_image_paths(input_dir)
+    well_names = list(well_images)
+    well_results = parallel_utils.map_wells(
+        well_fn=interp_well,
+        well_args=list(well_images.items()),
+        nbr_workers=nbr_workers,
+    )
+    well_timers = []
+    for well_name, (spots_df, well_timer) in zip(well_names, well_results):
+        well_timers.append(well_timer)
+        with well_timer.time_stage('report'):
+            # Write metrics for each spot in grid in current well
+            stats_writer.write_well(well_name, spots_df)
+            # Assign well OD, intensity, and background stats to plate
+            reporter.assign_well_to_plate(well_name, spots_df)
+        run_timer.merge(well_timer)
 
-    for well_name, im_path in well_images.items():
-        start = time.time()
-        image = io_utils.read_gray_im(im_path)
+    # After running all wells, write plate reports
+    with run_timer.time_stage('report'):
+        reporter.write_reports()
+        if constants.WELL_STATS_XLSX:
+            stats_writer.export_xlsx()
+    timing.write_stage_times(
+        stage_times_path=os.path.join(constants.RUN_PATH, constants.STAGE_TIMES_NAME),
+        run_timer=run_timer,
+        well_timers=well_timers,
+        wall_time=time.time() - start_time,
+    )
 
-        spot_props_array = txt_parser.create_array(
-            constants.params['rows'],
-            constants.params['columns'],
-            dtype=object,
-        )
-        bgprops_array = txt_parser.create_array(
-            constants.params['rows'],
-            constants.params['columns'],
-            dtype=object,
-        )
 
-        # finding center of well and cropping
-        well_center, well_radi, well_mask = image_parser.find_well_border(image, detmethod='region', segmethod='otsu')
+def interp_well(well_name, im_path):
+    """
+    Extract spot metrics for a single well by cropping the well, segmenting
+    spots and interpolating the grid from spot centroids.
+    Debug images are written to the run directory if in debug mode.
+
+    :param str well_name: Well name (e.g. 'B12')
+    :param str im_path: Path to well image
+    :return pd.DataFrame spots_df: Metrics for all spots in the well grid
+    :return StageTimer well_timer: Times of processing stages in the well
+    """
+    logger = logging.getLogger(constants.LOG_NAME)
+    well_timer = timing.StageTimer(well_name)
+    # Initialize background estimator
+    bg_estimator = background_estimator.BackgroundEstimator2D(
+        block_size=128,
+        order=2,
+        normalize=False,
+        dtype=np.float32,
+    )
+    # Memory mapping only avoids reading the full image if well_downsample > 1
+    with well_timer.time_stage('read'):
+        image = io_utils.read_gray_im(im_path, mmap=True)
+
+    # finding center of well and cropping
+    with well_timer.time_stage('well_border'):
+        if constants.params['well_downsample'] > 1:
+            well_center, well_radi, well_mask = image_parser.find_well_border_fast(
+                image,
+                downsample=constants.params['well_downsample'],
+            )
+        else:
+            well_center, well_radi, well_mask = image_parser.find_well_border(image, detmethod='region', segmethod='otsu')
         im_crop, _ = img_processing.crop_image_at_center(
             image,
             well_center,
             2 * well_radi,
             2 * well_radi
         )
+        # Only keep the well in memory, not the full image
+        im_crop = io_utils.materialize_roi(im_crop)
+        del image
 
-        # find center of spots from crop
+    # find center of spots from crop
+    with well_timer.time_stage('spot_detection'):
         spot_mask = img_processing.thresh_and_binarize(im_crop, method='bright_spots')
         spot_props = image_parser.generate_props(spot_mask, intensity_image=im_crop)
 
-        # if debug:
+    # if debug:
 
+    with well_timer.time_stage('registration'):
         crop_coords = image_parser.grid_from_centroids(
             spot_props,
             constants.params['rows'],
             constants.params['columns']
         )
 
-        # convert to float64
-        im_crop = im_crop / np.iinfo(im_crop.dtype).max
+    # convert to float32
+    with well_timer.time_stage('background'):
+        max_intensity = np.iinfo(im_crop.dtype).max
+        im_crop = im_crop.astype(np.float32)
+        im_crop /= max_intensity
         background = bg_estimator.get_background(im_crop)
-        spots_df, spot_props = array_gen.get_spot_intensity(
+    with well_timer.time_stage('spot_intensity'):
+        spots_df, spot_table = array_gen.get_spot_intensity(
             coords=crop_coords,
             im=im_crop,
             background=background,
-            params=constants.params,
+            store_rois=constants.DEBUG,
         )
-        # Write metrics for each spot in grid in current well
-        spots_df.to_excel(well_xlsx_writer, sheet_name=well_name)
-        # Assign well OD, intensity, and background stats to plate
-        reporter.assign_well_to_plate(well_name, spots_df)
 
-        stop = time.time()
-        print(f"\ttime to process={stop-start}")
+    logger.info("Time to process {}: {:.3f} s".format(
+        well_name,
+        well_timer.get_total(),
+    ))
 
-        # SAVE FOR DEBUGGING
-        if constants.DEBUG:
+    # SAVE FOR DEBUGGING
+    if constants.DEBUG:
+        with well_timer.time_stage('debug_plots'):
             # Save spot and background intensities.
             output_name = os.path.join(constants.RUN_PATH, well_name)
 
@@ -116,7 +170,7 @@ def interp(input_dir, output_dir):
             debug_plots.plot_centroid_overlay(
                 im_crop,
                 constants.params,
-                spot_props,
+                spots_df,
                 output_name,
             )
             debug_plots.plot_od(
@@ -127,19 +181,15 @@ def interp(input_dir, output_dir):
             )
             # save a composite of all spots, where spots are from source or from region prop
             debug_plots.save_composite_spots(
-                spot_props,
+                spot_table,
                 output_name,
                 image=im_crop,
             )
             debug_plots.save_composite_spots(
-                spot_props,
+                spot_table,
                 output_name,
                 image=im_crop,
                 from_source=True,
             )
-            stop2 = time.time()
-            print(f"\ttime to save debug={stop2-stop}")
 
-    # After running all wells, write plate reports
-    well_xlsx_writer.close()
-    reporter.write_reports()
+    return spots_df, well_timer
@@ -1,3 +1,4 @@
+import concurrent.futures
 import cv2 as cv
 import logging
 import numpy as np
@@ -9,16 +10,23 @@ import array_analyzer.extract.background_estimator as background_estimator
 import array_analyzer.extract.image_parser as image_parser
 import array_analyzer.extract.img_processing as img_processing
 import array_analyzer.extract.metadata as metadata
-import array_analyzer.extract.txt_parser as txt_parser
 import array_analyzer.extract.constants as constants
 import array_analyzer.load.debug_plots as debug_plots
 import array_analyzer.load.report as report
+import array_analyzer.load.well_stats as well_stats
 import array_analyzer.transform.point_registration as registration
 import array_analyzer.transform.array_generation as array_gen
 import array_analyzer.utils.io_utils as io_utils
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.utils.timing as timing
+import array_analyzer.utils.watch_utils as watch_utils
 
+# Registration stats names for particle (x, y, angle, scale)
+PARTICLE_NAMES = ['x', 'y', 'angle', 'scale']
+WELL_NAMES = ['well_row', 'well_col', 'well_radius']
 
-def point_registration(input_dir, output_dir):
+
+def point_registration(input_dir, output_dir, nbr_workers=1, watch=False):
     """
     For each image in input directory, detect spots using particle filtering
     to register fiducial spots to blobs detected in the image.
@@ -26,50 +34,47 @@ def point_registration(input_dir, output_dir):
     :param str input_dir: Input directory containing images and an xml file
         with parameters
     :param str output_dir: Directory where output is written to
+    :param int nbr_workers: Number of processes wells are distributed over.
+        Results are collected in well order (default 1, no multiprocessing)
+    :param bool watch: Watch input directory while it's being written to
+        and process wells as soon as their images are complete. Plate
+        reports are updated after each batch of new wells, and the run is
+        finalized when all expected wells are done or the watch times out
     """
     logger = logging.getLogger(constants.LOG_NAME)
+    start_time = time.time()
+    run_timer = timing.StageTimer('run')
 
     metadata.MetaData(input_dir, output_dir)
-    nbr_outliers = constants.params['nbr_outliers']
 
     # Create reports instance for whole plate
     reporter = report.ReportWriter()
-    # Create writer for stats per well
-    well_xlsx_path = os.path.join(
-        constants.RUN_PATH,
-        'stats_per_well.xlsx',
-    )
-    well_xlsx_writer = pd.ExcelWriter(well_xlsx_path)
-    antigen_df = reporter.get_antigen_df()
-    antigen_df.to_excel(well_xlsx_writer, sheet_name='antigens')
+    # Create writer streaming stats per well to disk
+    stats_writer = well_stats.WellStatsWriter()
+    stats_writer.write_antigens(reporter.get_antigen_df())
 
-    # Initialize background estimator
-    bg_estimator = background_estimator.BackgroundEstimator2D(
-        block_size=128,
-        order=2,
-        normalize=False,
-    )
-
-    # Get grid rows and columns from params
-    nbr_grid_rows = constants.params['rows']
-    nbr_grid_cols = constants.params['columns']
-    fiducials_idx = constants.FIDUCIALS_IDX
-    # Create spot detector instance
-    spot_detector = img_processing.SpotDetector(
-        imaging_params=constants.params,
-    )
-
-    well_images = io_utils.get_image_paths(input_dir)
+    if watch:
+        # Wells are found as they appear in the input directory
+        assert not constants.RERUN, "Can't rerun wells in watch mode"
+        well_images = {}
+        watcher = watch_utils.WellImageWatcher(
+            input_dir=input_dir,
+            expected_wells=constants.EXPECTED_WELLS,
+            poll_interval=constants.WATCH_POLL_INTERVAL,
+            stable_time=constants.WATCH_STABLE_TIME,
+            timeout=constants.WATCH_TIMEOUT,
+        )
+    else:
+        well_images = io_utils.get_image_paths(input_dir)
     well_names = list(well_images)
     # If rerunning only a subset of wells
     if constants.RERUN:
         logger.info("Rerunning wells: {}".format(constants.RERUN_WELLS))
-        txt_parser.rerun_xl_od(
-            well_names=well_names,
-            well_xlsx_path=well_xlsx_path,
-            rerun_names=constants.RERUN_WELLS,
-            xlsx_writer=well_xlsx_writer,
-        )
+        assert set(constants.RERUN_WELLS).issubset(well_names), \
+            "All rerun wells can't be found in input directory"
+        # Runs from before per well files only have the xlsx workbook
+        stats_writer.import_xlsx()
+        stats_writer.remove_wells(constants.RERUN_WELLS)
         reporter.load_existing_reports()
         well_names = constants.RERUN_WELLS
         # remove debug images from old runs
@@ -79,62 +84,507 @@ def point_registration(input_dir, output_dir):
     else:
         reporter.create_new_reports()
 
+    if constants.params['spot_downsample'] > 1 and \
+            not constants.params['refine_registration']:
+        logger.warning("Spots are detected on images downsampled {} times and "
+                       "refine_registration is off, registration is only as "
+                       "accurate as the downsampled spots".format(
+                           constants.params['spot_downsample']))
+
+    # Fit background once per plate if illumination is stable across wells
+    constants.PLATE_BACKGROUND_PATH = None
+    if watch and constants.params['plate_background']:
+        logger.warning("Plate background needs all wells, "
+                       "fitting background per well in watch mode")
+    elif constants.params['plate_background']:
+        with run_timer.time_stage('plate_background'):
+            constants.PLATE_BACKGROUND_PATH = fit_plate_background(
+                input_dir=input_dir,
+                well_images=well_images,
+                nbr_workers=nbr_workers,
+            )
+
     # ================
     # loop over well images
     # ================
-    for well_name in well_names:
-        start_time = time.time()
-        im_path = well_images[well_name]
-        image = io_utils.read_gray_im(im_path)
-        logger.info("Extracting well: {}".format(well_name))
-        # Get max intensity
-        max_intensity = io_utils.get_max_intensity(image)
-        logger.debug("Image max intensity: {}".format(max_intensity))
-        # Crop image to well only
-        try:
-            well_center, well_radi, _ = image_parser.find_well_border(
-                image,
-                detmethod='region',
-                segmethod='otsu',
+    if watch:
+        well_batches = watcher.watch()
+    else:
+        well_batches = [[(well_name, well_images[well_name]) for well_name in well_names]]
+    reg_stats = []
+    well_timers = []
+    # Transforms and well geometries of registered wells for plate prior
+    reg_particles = []
+    well_geometries = []
+    # Start workers once for all wells of the run, or of the whole watch
+    executor = None
+    if nbr_workers is not None and nbr_workers > 1:
+        executor = parallel_utils.make_executor(nbr_workers)
+    try:
+        for well_args in well_batches:
+            if constants.params['plate_prior']:
+                well_results = register_wells_plate_prior(
+                    well_args=well_args,
+                    nbr_workers=nbr_workers,
+                    reg_particles=reg_particles,
+                    well_geometries=well_geometries,
+                    executor=executor,
+                )
+            else:
+                well_results = parallel_utils.map_wells(
+                    well_fn=register_well,
+                    well_args=well_args,
+                    nbr_workers=nbr_workers,
+                    executor=executor,
+                )
+            for (well_name, _), (spots_df, well_reg_stats, well_timer) in zip(well_args, well_results):
+                reg_stats.append(well_reg_stats)
+                well_timers.append(well_timer)
+                if spots_df is not None:
+                    with well_timer.time_stage('report'):
+                        # Write metrics for each spot in grid in current well
+                        stats_writer.write_well(well_name, spots_df)
+                        # Assign well OD, intensity, and background stats to plate
+                        reporter.assign_well_to_plate(well_name, spots_df)
+                run_timer.merge(well_timer)
+            if watch:
+                # Update plate reports so they can be inspected during the scan
+                with run_timer.time_stage('report'):
+                    reporter.write_reports()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # After running all wells, write plate reports
+    with run_timer.time_stage('report'):
+        reporter.write_reports()
+        if constants.WELL_STATS_XLSX:
+            stats_writer.export_xlsx()
+        # Write registration timing and residuals per well
+        reg_stats_df = pd.DataFrame(reg_stats)
+        reg_stats_df.to_csv(
+            os.path.join(constants.RUN_PATH, 'registration_stats.csv'),
+            index=False,
+        )
+    timing.write_stage_times(
+        stage_times_path=os.path.join(constants.RUN_PATH, constants.STAGE_TIMES_NAME),
+        run_timer=run_timer,
+        well_timers=well_timers,
+        wall_time=time.time() - start_time,
+    )
+
+
+def get_bg_estimator():
+    """
+    Create the background estimator used for all wells in the workflow.
+    Backgrounds are float32 like the normalized well crops.
+
+    :return BackgroundEstimator2D bg_estimator: Background estimator instance
+    """
+    return background_estimator.BackgroundEstimator2D(
+        block_size=128,
+        order=2,
+        normalize=False,
+        dtype=np.float32,
+    )
+
+
+def sample_well_background(im_path):
+    """
+    Read an image and sample block medians of its intensities, normalized
+    by max intensity like the well crops.
+
+    :param str im_path: Path to image
+    :return tuple im_shape: Image shape
+    :return np.array sample_coords: Block center coordinates
+    :return np.array sample_values: Block median intensities
+    """
+    image = io_utils.read_gray_im(im_path, mmap=True)
+    max_intensity = io_utils.get_max_intensity(image)
+    image = image.astype(np.float32)
+    image /= max_intensity
+    sample_coords, sample_values = get_bg_estimator().sample_block_medians(
+        im=image,
+    )
+    return image.shape, sample_coords, sample_values
+
+
+def fit_plate_background(input_dir, well_images, nbr_workers=1):
+    """
+    Fit a background model for the whole plate, either from a reference
+    image given by the background_image parameter or from all well images.
+    The model is saved in the run directory so workers and reruns can load
+    it instead of refitting.
+
+    :param str input_dir: Input directory containing images
+    :param dict well_images: Well names and their image paths
+    :param int nbr_workers: Number of processes images are sampled in
+    :return str plate_bg_path: Path to saved plate background model
+    """
+    logger = logging.getLogger(constants.LOG_NAME)
+    plate_bg_path = os.path.join(
+        constants.RUN_PATH,
+        constants.PLATE_BACKGROUND_NAME,
+    )
+    if constants.RERUN and os.path.isfile(plate_bg_path):
+        logger.info("Using existing plate background {}".format(plate_bg_path))
+        return plate_bg_path
+
+    start_time = time.time()
+    if constants.params['background_image'] is not None:
+        im_paths = [
+            os.path.join(input_dir, constants.params['background_image']),
+        ]
+    else:
+        im_paths = list(well_images.values())
+    im_samples = list(parallel_utils.map_wells(
+        well_fn=sample_well_background,
+        well_args=[(im_path,) for im_path in im_paths],
+        nbr_workers=nbr_workers,
+    ))
+    im_shape, sample_coords, _ = im_samples[0]
+    for im_path, (sample_shape, _, _) in zip(im_paths, im_samples):
+        assert sample_shape == im_shape, \
+            "Plate background requires images of the same shape, " \
+            "{} has shape {} not {}".format(im_path, sample_shape, im_shape)
+    plate_background = get_bg_estimator().fit_plate_background(
+        sample_coords=sample_coords,
+        well_sample_values=[sample[2] for sample in im_samples],
+        im_shape=im_shape,
+    )
+    np.save(plate_bg_path, plate_background.astype(np.float32))
+    logger.info("Time to fit plate background from {} images: {:.3f} s".format(
+        len(im_paths),
+        time.time() - start_time,
+    ))
+    return plate_bg_path
+
+
+def get_plate_priors(reg_particles, well_geometries):
+    """
+    Compute priors for the next well from the wells finished so far.
+
+    :param list reg_particles: Transforms (x, y, angle, scale) of
+        registered wells
+    :param list well_geometries: Well center row, column and radius of
+        wells whose border was found
+    :return np.array particle_prior: Median transform, None if no well is
+        registered yet
+    :return tuple well_prior: Median well center [row, col] and radius,
+        None if no well border is found yet or wells aren't found on
+        downsampled images
+    """
+    particle_prior = None
+    if len(reg_particles) > 0:
+        particle_prior = np.median(reg_particles, axis=0)
+    well_prior = None
+    if len(well_geometries) > 0 and constants.params['well_downsample'] > 1:
+        well_row, well_col, well_radi = np.median(well_geometries, axis=0)
+        well_prior = ([well_row, well_col], well_radi)
+    return particle_prior, well_prior
+
+
+def register_wells_plate_prior(well_args,
+                               nbr_workers=1,
+                               reg_particles=None,
+                               well_geometries=None,
+                               executor=None):
+    """
+    Register wells with particles created around the median transform of
+    the wells registered so far on the plate, since array position, scale
+    and rotation are similar across wells.
+    To keep runs reproducible, the prior of the i-th well is computed from
+    the wells before index i - nbr_workers + 1 only, whatever order workers
+    finish in. The i-th well is submitted as soon as those wells are done,
+    so up to nbr_workers wells run at a time without a barrier between
+    groups of wells. Serial runs use all previous wells, so results depend
+    on the number of workers. The first nbr_workers wells are registered
+    using the broad prior.
+    If well borders are found on downsampled images, the median well
+    geometry is used as prior for the well border too.
+
+    :param list well_args: List of (well name, image path) tuples
+    :param int nbr_workers: Number of processes wells are distributed over
+    :param list reg_particles: Transforms of wells registered so far, e.g.
+        in earlier batches of a watched run. Appended to in place
+    :param list well_geometries: Well centers and radii of wells found so
+        far. Appended to in place
+    :param ProcessPoolExecutor executor: Pool to submit wells to, e.g.
+        shared by all batches of a watched run. If None and nbr_workers > 1,
+        a pool is created for this call
+    :return generator: (spots_df, reg_stats, well_timer) for each well,
+        in well_args order
+    """
+    logger = logging.getLogger(constants.LOG_NAME)
+    if reg_particles is None:
+        reg_particles = []
+    if well_geometries is None:
+        well_geometries = []
+    if executor is None and (nbr_workers is None or nbr_workers <= 1):
+        nbr_workers = 1
+    elif nbr_workers > 1:
+        logger.info(
+            "Plate priors are computed from wells {} or more positions "
+            "earlier, results differ from serial runs".format(nbr_workers),
+        )
+    # Number of transforms and well geometries after collecting j wells
+    prior_counts = [(len(reg_particles), len(well_geometries))]
+
+    def get_well_priors(well_idx):
+        nbr_particles, nbr_geometries = \
+            prior_counts[max(0, well_idx - nbr_workers + 1)]
+        particle_prior, well_prior = get_plate_priors(
+            reg_particles[:nbr_particles],
+            well_geometries[:nbr_geometries],
+        )
+        logger.debug("Plate prior particle: {}".format(particle_prior))
+        return particle_prior, well_prior
+
+    def add_result(reg_stats):
+        if reg_stats['registration_ok']:
+            reg_particles.append([reg_stats[name] for name in PARTICLE_NAMES])
+        if not np.isnan(reg_stats['well_radius']):
+            well_geometries.append([reg_stats[name] for name in WELL_NAMES])
+        prior_counts.append((len(reg_particles), len(well_geometries)))
+
+    if nbr_workers == 1:
+        for well_idx, args in enumerate(well_args):
+            well_result = register_well(*args, *get_well_priors(well_idx))
+            add_result(well_result[1])
+            yield well_result
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = parallel_utils.make_executor(nbr_workers)
+    try:
+        # Futures of running wells and their index in well_args
+        running = {}
+        finished = {}
+        submit_idx = 0
+        yield_idx = 0
+        while yield_idx < len(well_args):
+            # Submit wells whose prior wells have all been collected
+            while submit_idx < len(well_args) and \
+                    submit_idx - nbr_workers < yield_idx:
+                future = executor.submit(
+                    register_well,
+                    *well_args[submit_idx],
+                    *get_well_priors(submit_idx),
+                )
+                running[future] = submit_idx
+                submit_idx += 1
+            done, _ = concurrent.futures.wait(
+                running,
+                return_when=concurrent.futures.FIRST_COMPLETED,
             )
+            for future in done:
+                finished[running.pop(future)] = future.result()
+            # Collect in well order so priors and reports are deterministic
+            while yield_idx in finished:
+                well_result = finished.pop(yield_idx)
+                add_result(well_result[1])
+                yield well_result
+                yield_idx += 1
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def init_reg_stats(well_name):
+    """
+    Create registration statistics for a well with all values unset.
+
+    :param str well_name: Well name (e.g. 'B12')
+    :return dict reg_stats: Registration statistics
+    """
+    reg_stats = {'well_name': well_name}
+    for name in WELL_NAMES + PARTICLE_NAMES:
+        reg_stats[name] = np.nan
+    reg_stats.update({
+        'nbr_spots': 0,
+        'nbr_iterations': 0,
+        'nbr_particles': 0,
+        'registration_time': np.nan,
+        'refine_time': np.nan,
+        'residual_before': np.nan,
+        'residual_after': np.nan,
+        'registration_ok': False,
+    })
+    return reg_stats
+
+
+def register_well(well_name, im_path, particle_prior=None, well_prior=None):
+    """
+    Extract spot metrics for a single well: find the well border, detect
+    spots, register the spot grid using particle filtering, estimate
+    background and compute spot intensities.
+    Debug plots are written to the run directory if in debug mode.
+
+    :param str well_name: Well name (e.g. 'B12')
+    :param str im_path: Path to well image
+    :param np.array particle_prior: Optional mean particle (x, y, angle, scale)
+        to create particles around. Registration falls back to the broad
+        prior if it fails
+    :param tuple well_prior: Optional well center [row, col] and radius of
+        previous wells, used to find the well border if well_downsample > 1.
+        Falls back to segmenting the well if the border isn't found near it
+    :return pd.DataFrame spots_df: Metrics for all spots in the well grid,
+        None if registration failed
+    :return dict reg_stats: Registration transform parameters, number of
+        iterations and particles, timing and residuals in pixels before and
+        after refinement
+    :return StageTimer well_timer: Times of processing stages in the well
+    """
+    logger = logging.getLogger(constants.LOG_NAME)
+    well_timer = timing.StageTimer(well_name)
+    nbr_outliers = constants.params['nbr_outliers']
+    adaptive = constants.params['adaptive_particles']
+    refine = constants.params['refine_registration']
+    reg_stats = init_reg_stats(well_name)
+    # Get grid rows and columns from params
+    nbr_grid_rows = constants.params['rows']
+    nbr_grid_cols = constants.params['columns']
+    fiducials_idx = constants.FIDUCIALS_IDX
+
+    # Initialize background estimator
+    bg_estimator = get_bg_estimator()
+    # Create spot detector instance, detecting coarse to fine if downsampling
+    spot_detector = img_processing.SpotDetector(
+        imaging_params=constants.params,
+        downsample=constants.params['spot_downsample'],
+    )
+
+    # Uncompressed TIFFs are memory mapped, pixels are read when accessed.
+    # This only avoids reading the full image if well_downsample > 1, the full
+    # resolution find_well_border thresholds every pixel
+    with well_timer.time_stage('read'):
+        image = io_utils.read_gray_im(im_path, mmap=True)
+    logger.info("Extracting well: {}".format(well_name))
+    # Load plate background model, memory mapped since only crops are used
+    plate_background = None
+    if constants.PLATE_BACKGROUND_PATH is not None:
+        plate_background = np.load(
+            constants.PLATE_BACKGROUND_PATH,
+            mmap_mode='r',
+        )
+        if plate_background.shape != image.shape:
+            logger.warning("Plate background shape doesn't match {}, "
+                           "fitting well background".format(well_name))
+            plate_background = None
+    bg_well = plate_background
+    # Crop image to well only
+    with well_timer.time_stage('well_border'):
+        try:
+            if constants.params['well_downsample'] > 1:
+                well_center, well_radi, _ = image_parser.find_well_border_fast(
+                    image,
+                    downsample=constants.params['well_downsample'],
+                    well_prior=well_prior,
+                )
+            else:
+                well_center, well_radi, _ = image_parser.find_well_border(
+                    image,
+                    detmethod='region',
+                    segmethod='otsu',
+                )
+            for name, value in zip(WELL_NAMES, well_center + [well_radi]):
+                reg_stats[name] = value
             im_well, _ = img_processing.crop_image_at_center(
                 im=image,
                 center=well_center,
                 height=2 * well_radi,
                 width=2 * well_radi,
             )
+            if plate_background is not None:
+                bg_well, _ = img_processing.crop_image_at_center(
+                    im=plate_background,
+                    center=well_center,
+                    height=2 * well_radi,
+                    width=2 * well_radi,
+                )
         except IndexError:
             logging.warning("Couldn't find well in {}".format(well_name))
             im_well = image
+        # Only keep the well in memory, not the full image
+        im_well = io_utils.materialize_roi(im_well)
+        del image
+    # Get max intensity from the well, so a mapped image isn't read in full
+    max_intensity = io_utils.get_max_intensity(im_well)
+    logger.debug("Image max intensity: {}".format(max_intensity))
 
-        # Find spot center coordinates
+    # Find spot center coordinates
+    with well_timer.time_stage('spot_detection'):
         spot_coords = spot_detector.get_spot_coords(
             im=im_well,
             max_intensity=max_intensity,
         )
-        if spot_coords.shape[0] < constants.MIN_NBR_SPOTS:
-            logging.warning("Not enough spots detected in {},"
-                            "continuing.".format(well_name))
-            continue
+    reg_stats['nbr_spots'] = spot_coords.shape[0]
+    if spot_coords.shape[0] < constants.MIN_NBR_SPOTS:
+        logging.warning("Not enough spots detected in {},"
+                        "continuing.".format(well_name))
+        return None, reg_stats, well_timer
+    with well_timer.time_stage('registration'):
+        reg_start_time = time.time()
         # Create particle filter registration instance
         register_inst = registration.ParticleFilter(
             spot_coords=spot_coords,
             im_shape=im_well.shape,
             fiducials_idx=fiducials_idx,
+            random_seed=constants.RANDOM_SEED,
+            particle_prior=particle_prior,
         )
-        register_inst.particle_filter()
+        register_inst.particle_filter(adaptive=adaptive)
+        if particle_prior is not None and not register_inst.registration_ok:
+            logger.warning("Registration with plate prior failed for {}, "
+                           "repeat with broad prior".format(well_name))
+            register_inst = registration.ParticleFilter(
+                spot_coords=spot_coords,
+                im_shape=im_well.shape,
+                fiducials_idx=fiducials_idx,
+                random_seed=constants.RANDOM_SEED,
+            )
+            register_inst.particle_filter(adaptive=adaptive)
         if not register_inst.registration_ok:
             logger.warning("Registration failed for {}, "
                            "repeat with outlier removal".format(well_name))
-            register_inst.particle_filter(nbr_outliers=nbr_outliers)
+            # In adaptive mode, continue from the converged particles
+            register_inst.particle_filter(
+                nbr_outliers=nbr_outliers,
+                adaptive=adaptive,
+                reuse_particles=adaptive,
+            )
+        reg_stats['registration_time'] = time.time() - reg_start_time
+        reg_stats['nbr_iterations'] = register_inst.nbr_iterations
+        reg_stats['nbr_particles'] = register_inst.converged_particles.shape[0]
+        if refine and spot_detector.downsample > 1:
+            # Refine spot centers at full resolution around registered grid
+            # and refine the registration to match them
+            fine_coords = spot_detector.refine_spot_coords(
+                im=im_well,
+                coords=register_inst.compute_registered_coords(),
+                max_intensity=max_intensity,
+            )
+            if fine_coords.shape[0] >= constants.MIN_NBR_SPOTS:
+                spot_coords = fine_coords
+                register_inst.spot_coords = spot_coords
+        reg_stats['residual_before'], _, _ = register_inst.compute_residual()
+        if refine:
+            # Polish particle filter estimate with closed form fits
+            refine_start_time = time.time()
+            reg_stats['residual_after'] = register_inst.refine_registration()
+            reg_stats['refine_time'] = time.time() - refine_start_time
+        for name, value in zip(PARTICLE_NAMES, register_inst.particle):
+            reg_stats[name] = value
         # Transform grid coordinates
         registered_coords = register_inst.compute_registered_coords()
         # Check that registered coordinates are inside well
         registration_ok = register_inst.check_reg_coords()
-        if not registration_ok:
-            logger.warning("Final registration failed,"
-                           "will not write OD for {}".format(well_name))
-            if constants.DEBUG:
+    if not registration_ok:
+        logger.warning("Final registration failed,"
+                       "will not write OD for {}".format(well_name))
+        if constants.DEBUG:
+            with well_timer.time_stage('debug_plots'):
                 debug_plots.plot_registration(
                     im_well,
                     spot_coords,
@@ -143,38 +593,46 @@ def point_registration(input_dir, output_dir):
                     os.path.join(constants.RUN_PATH, well_name + '_failed'),
                     max_intensity=max_intensity,
                 )
-            continue
+        return None, reg_stats, well_timer
+    reg_stats['registration_ok'] = True
 
+    with well_timer.time_stage('background'):
         # Crop image
         im_crop, crop_coords = img_processing.crop_image_from_coords(
             im=im_well,
             coords=registered_coords,
         )
-        im_crop = im_crop / max_intensity
+        # Normalize in float32 to keep working set small
+        im_crop = im_crop.astype(np.float32)
+        im_crop /= max_intensity
         # Estimate background
-        background = bg_estimator.get_background(im_crop)
-        # Find spots near grid locations and compute properties
-        spots_df, spot_props = array_gen.get_spot_intensity(
+        if plate_background is not None:
+            bg_crop, _ = img_processing.crop_image_from_coords(
+                im=bg_well,
+                coords=registered_coords,
+            )
+            background = bg_estimator.get_background_from_model(im_crop, bg_crop)
+        else:
+            background = bg_estimator.get_background(im_crop)
+    # Find spots near grid locations and compute properties
+    with well_timer.time_stage('spot_intensity'):
+        spots_df, spot_table = array_gen.get_spot_intensity(
             coords=crop_coords,
             im=im_crop,
             background=background,
+            store_rois=constants.DEBUG,
         )
-        # Write metrics for each spot in grid in current well
-        spots_df.to_excel(well_xlsx_writer, sheet_name=well_name)
-        # Assign well OD, intensity, and background stats to plate
-        reporter.assign_well_to_plate(well_name, spots_df)
-
-        time_msg = "Time to extract OD in {}: {:.3f} s".format(
-            well_name,
-            time.time() - start_time,
-        )
-        print(time_msg)
-        logger.info(time_msg)
 
-        # ==================================
-        # SAVE FOR DEBUGGING
-        if constants.DEBUG:
-            start_time = time.time()
+    time_msg = "Time to extract OD in {}: {:.3f} s".format(
+        well_name,
+        well_timer.get_total(),
+    )
+    logger.info(time_msg)
+
+    # ==================================
+    # SAVE FOR DEBUGGING
+    if constants.DEBUG:
+        with well_timer.time_stage('debug_plots'):
             # Save spot and background intensities
             output_name = os.path.join(constants.RUN_PATH, well_name)
             # Save OD plots, composite spots and registration
@@ -185,7 +643,7 @@ def point_registration(input_dir, output_dir):
                 output_name=output_name,
             )
             debug_plots.save_composite_spots(
-                spot_props=spot_props,
+                spot_table=spot_table,
                 output_name=output_name,
                 image=im_crop,
             )
@@ -202,10 +660,5 @@ def point_registration(input_dir, output_dir):
                 output_name=output_name,
                 max_intensity=max_intensity,
             )
-            logger.debug("Time to save debug images: {:.3f} s".format(
-                time.time() - start_time),
-            )
 
-    # After running all wells, write plate reports
-    well_xlsx_writer.close()
-    reporter.write_reports()
+    return spots_df, reg_stats, well_timer
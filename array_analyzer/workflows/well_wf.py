@@ -3,7 +3,10 @@ import array_analyzer.extract.img_processing as processing
 import array_analyzer.extract.constants as constants
 from array_analyzer.extract.metadata import MetaData
 import array_analyzer.utils.io_utils as io_utils
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.utils.timing as timing
 
+import logging
 import time
 import skimage.io as io
 import pandas as pd
@@ -13,7 +16,7 @@ import re
 import numpy as np
 
 
-def well_analysis(input_dir, output_dir, method='segmentation'):
+def well_analysis(input_dir, output_dir, method='segmentation', nbr_workers=1):
     """
     Workflow that pulls all images scanned on a multi-well plate in a standard ELISA format (one antigen per well)
     It loops over the images in the input_folder (for images acquired using Micro-Manager ONLY).
@@ -23,9 +26,12 @@ def well_analysis(input_dir, output_dir, method='segmentation'):
     :param input_dir: str path to experiment directory
     :param output_dir: str output path to write report and diagnostic images
     :param method: str 'segmentation' or 'crop'.  Methods to estimate the boundaries of the well
+    :param nbr_workers: int number of processes images are distributed over (default 1)
     :return:
     """
     start = time.time()
+    logger = logging.getLogger(constants.LOG_NAME)
+    run_timer = timing.StageTimer('run')
 
     # metadata isn't used for the well format
     MetaData(input_dir, output_dir)
@@ -42,33 +48,93 @@ def well_analysis(input_dir, output_dir, method='segmentation'):
     # get well directories
     well_images = io_utils.get_image_paths(input_dir)
 
-    int_well = []
-    for well_name, im_path in well_images.items():
-        # read image
-        image = io_utils.read_gray_im(im_path)
-        print(well_name)
+    well_args = [(well_name, im_path, method) for well_name, im_path in well_images.items()]
+    well_results = list(parallel_utils.map_wells(
+        well_fn=well_intensity,
+        well_args=well_args,
+        nbr_workers=nbr_workers,
+    ))
+    int_well = [int_well_ for int_well_, _ in well_results]
+    well_timers = [well_timer for _, well_timer in well_results]
+    for well_timer in well_timers:
+        run_timer.merge(well_timer)
 
-        # measure intensity
-        if method == 'segmentation':
-            # segment well using otsu thresholding
+    df_int = pd.DataFrame(
+        np.reshape(int_well, (8, 12)),
+        index=list(string.ascii_uppercase[:8]),
+        columns=range(1, 13),
+    )
+    plate_info.update({'intensity': df_int})
+
+    # compute optical density
+    sample_info = plate_info['sample']
+    blanks = np.any(np.dstack((
+        sample_info == 'Blank',
+        sample_info == 'blank',
+        sample_info == 'BLANK')), axis=2)
+    if blanks.any():
+        # blank intensity is averaged over all blank wells
+        int_blank = np.mean(df_int.to_numpy()[blanks])
+        df_od = np.log10(int_blank / df_int)
+        plate_info.update({'od': df_od})
+
+    # save analysis results
+    with run_timer.time_stage('report'):
+        for k, v in plate_info.items():
+            v.to_excel(xlwriter_int, sheet_name=k)
+        xlwriter_int.close()
+
+    stop = time.time()
+    logger.info("Time to process plate: {:.3f} s".format(stop - start))
+    timing.write_stage_times(
+        stage_times_path=os.path.join(constants.RUN_PATH, constants.STAGE_TIMES_NAME),
+        run_timer=run_timer,
+        well_timers=well_timers,
+        wall_time=stop - start,
+    )
+
+
+def well_intensity(well_name, im_path, method='segmentation'):
+    """
+    Measure the median intensity of a single well image.
+
+    :param well_name: str well name (e.g. 'B12')
+    :param im_path: str path to well image
+    :param method: str 'segmentation' or 'crop'.  Methods to estimate the boundaries of the well
+    :return: float median intensity of the well
+    :return: StageTimer times of processing stages in the well
+    """
+    logger = logging.getLogger(constants.LOG_NAME)
+    well_timer = timing.StageTimer(well_name)
+    # read image
+    with well_timer.time_stage('read'):
+        image = io_utils.read_gray_im(im_path, mmap=True)
+    logger.info("Measuring well intensity in {}".format(well_name))
+
+    # measure intensity
+    if method == 'segmentation':
+        # segment well using otsu thresholding
+        with well_timer.time_stage('well_border'):
             well_mask = image_parser.get_well_mask(image, segmethod='otsu')
+        with well_timer.time_stage('spot_intensity'):
             int_well_ = image_parser.get_well_intensity(image, well_mask)
 
-        elif method == 'crop':
-            # get intensity at square crop in the middle of the image
+    elif method == 'crop':
+        # get intensity at square crop in the middle of the image
+        with well_timer.time_stage('well_border'):
             img_size = image.shape
             radius = np.floor(0.1 * np.min(img_size)).astype('int')
             cx = np.floor(img_size[1]/2).astype('int')
             cy = np.floor(img_size[0]/2).astype('int')
             im_crop = processing.crop_image(image, cx, cy, radius, border_=0)
-
             well_mask = np.ones_like(im_crop, dtype='bool')
-            int_well_ = image_parser.get_well_intensity(im_crop, well_mask)
 
-        int_well.append(int_well_)
+        with well_timer.time_stage('spot_intensity'):
+            int_well_ = image_parser.get_well_intensity(im_crop, well_mask)
 
-        # SAVE FOR DEBUGGING
-        if constants.DEBUG:
+    # SAVE FOR DEBUGGING
+    if constants.DEBUG:
+        with well_timer.time_stage('debug_plots'):
             output_name = os.path.join(constants.RUN_PATH, well_name)
 
             # Save mask of the well, cropped grayscale image, cropped spot segmentation.
@@ -87,29 +153,4 @@ def well_analysis(input_dir, output_dir, method='segmentation'):
             io.imsave(output_name + "_masked_image.png",
                       (img_/256).astype('uint8'))
 
-    df_int = pd.DataFrame(
-        np.reshape(int_well, (8, 12)),
-        index=list(string.ascii_uppercase[:8]),
-        columns=range(1, 13),
-    )
-    plate_info.update({'intensity': df_int})
-
-    # compute optical density
-    sample_info = plate_info['sample']
-    blanks = np.any(np.dstack((
-        sample_info == 'Blank',
-        sample_info == 'blank',
-        sample_info == 'BLANK')), axis=2)
-    if blanks.any():
-        # blank intensity is averaged over all blank wells
-        int_blank = np.mean(df_int.to_numpy()[blanks])
-        df_od = np.log10(int_blank / df_int)
-        plate_info.update({'od': df_od})
-
-    # save analysis results
-    for k, v in plate_info.items():
-        v.to_excel(xlwriter_int, sheet_name=k)
-    xlwriter_int.close()
-
-    stop = time.time()
-    print(f"\ttime to process={stop - start}")
+    return int_well_, well_timer
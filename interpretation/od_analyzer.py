@@ -7,6 +7,20 @@ from interpretation.plotting import roc_plot_grid, standard_curve_plot
 from interpretation.report_reader import slice_df, normalize_od, read_output_batch
 import array_analyzer.extract.constants as constants
 
+# Master report columns used for normalization, aggregation and plots
+REPORT_COLS = ['antigen',
+               'antigen type',
+               'serum ID',
+               'well_id',
+               'plate ID',
+               'sample type',
+               'serum type',
+               'serum dilution',
+               'pipeline',
+               'secondary ID',
+               'secondary dilution',
+               'OD']
+
 
 def read_config(input_dir):
     """
@@ -57,7 +71,7 @@ def read_config(input_dir):
                 scn_scn_df = pd.read_excel(config_file, sheet_name='scienion output dirs', comment='#')
     return ntl_dirs_df, scn_scn_df, plot_setting_df, roc_param_df, cat_param_df, fit_param_df
 
-def analyze_od(input_dir, output_dir, load_report):
+def analyze_od(input_dir, output_dir, load_report, nbr_workers=1):
     """
     Perform analysis on pysero or scienion OD outputs specified in the config files.
     Save the combined table as 'master report' in the output directory.
@@ -65,18 +79,35 @@ def analyze_od(input_dir, output_dir, load_report):
     :param str output_dir: Output directory
     :param bool load_report: If True, load the saved 'master report' in the output directory
     from the previous run. Load from the master report is much faster.
+    :param int nbr_workers: Number of processes plates that aren't cached
+    are read in (default 1, no multiprocessing)
     """
     os.makedirs(output_dir, exist_ok=True)
     ntl_dirs_df, scn_scn_df, plot_setting_df, roc_param_df, cat_param_df, fit_param_df =\
         read_config(input_dir)
-    stitched_pysero_df = read_output_batch(output_dir, ntl_dirs_df, scn_scn_df, load_report)
+    split_cols = plot_setting_df['split plots by']
+    # only load the master report columns needed for analysis
+    report_cols = REPORT_COLS.copy()
+    extra_cols = [split_cols] + [param_df['hue'] for param_df in
+                                 [roc_param_df, cat_param_df, fit_param_df]
+                                 if not param_df.empty]
+    for col in extra_cols:
+        if col is not None and col not in report_cols:
+            report_cols.append(col)
+    stitched_pysero_df = read_output_batch(
+        output_dir,
+        ntl_dirs_df,
+        scn_scn_df,
+        load_report,
+        columns=report_cols,
+        nbr_workers=nbr_workers,
+    )
     # fix metadata error
     # stitched_pysero_df.loc[stitched_pysero_df['antigen'] == 'xIgG Fc', 'antigen type'] = 'Positive'
     test_df = stitched_pysero_df.loc[(stitched_pysero_df['antigen'] == 'xIgG Fc') &
                                      (stitched_pysero_df['antigen type'] == 'Diagnostic')]
     if plot_setting_df['antigens to plot'] == 'all':
         plot_setting_df['antigens to plot'] = stitched_pysero_df['antigen'].unique()
-    split_cols = plot_setting_df['split plots by']
     split_vals = [None]
     if split_cols is not None:
         split_vals = stitched_pysero_df[split_cols].unique()
@@ -93,7 +124,7 @@ def analyze_od(input_dir, output_dir, load_report):
     if aggregate is not None:
         df_norm = df_norm.groupby(['antigen', 'antigen type', 'serum ID', 'well_id', 'plate ID', 'sample type',
                                  'serum type', 'serum dilution', 'pipeline', 'secondary ID',
-                                 'secondary dilution'])['OD'].mean().reset_index()
+                                 'secondary dilution'], observed=True)['OD'].mean().reset_index()
         suffix = '_'.join([suffix, aggregate])
 
     for split_val in split_vals:
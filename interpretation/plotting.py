@@ -265,7 +265,7 @@ def get_roc_df(df, ci=None):
     roc_df = roc_df.groupby(['antigen',
                              'secondary ID',
                              'secondary dilution',
-                             'pipeline']).apply(lambda x: roc_from_df(x, ci))
+                             'pipeline'], observed=True).apply(lambda x: roc_from_df(x, ci))
     # roc_df = roc_df.reset_index()
     roc_df = roc_df.apply(pd.Series.explode).astype(float).reset_index()
     roc_df.dropna(inplace=True)
@@ -422,7 +422,7 @@ def joint_plot(df_ori,
     g = sns.JointGrid(x_col, y_col, df,
                 xlim=xlim, ylim=ylim)
     hue_vals = []
-    for hue_val, hue_df in df.groupby(hue):
+    for hue_val, hue_df in df.groupby(hue, observed=True):
         hue_vals.append(hue_val)
         sns.kdeplot(hue_df[x_col], ax=g.ax_marg_x, legend=False, bw=bw)
         sns.kdeplot(hue_df[y_col], ax=g.ax_marg_y, vertical=True, legend=False, bw=bw)
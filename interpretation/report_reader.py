@@ -1,17 +1,48 @@
+import hashlib
+import importlib.util
+import json
+import operator
 import os
 import numpy as np
 import pandas as pd
 
-
-def antigen2D_to_df1D(xlsx_path, sheet, data_col):
+import array_analyzer.load.report as report
+import array_analyzer.utils.parallel_utils as parallel_utils
+
+# Master report file name without extension
+MASTER_REPORT_NAME = 'master_report'
+# Directory in output directory where parsed plates are cached
+PLATE_CACHE_DIR = 'plate_cache'
+# Master report formats in order of preference when loading
+MASTER_REPORT_FORMATS = ['parquet', 'feather', 'csv']
+# String columns of the master report that are stored as categoricals
+CATEGORICAL_COLS = ['antigen',
+                    'antigen type',
+                    'well_id',
+                    'plate ID',
+                    'serum ID',
+                    'serum type',
+                    'sample type',
+                    'secondary ID',
+                    'pipeline']
+# Operators of row filters, same as in pyarrow filters
+FILTER_OPS = {'==': operator.eq,
+              '=': operator.eq,
+              '!=': operator.ne,
+              '<': operator.lt,
+              '<=': operator.le,
+              '>': operator.gt,
+              '>=': operator.ge}
+
+
+def unstack_antigen2D(df, data_col):
     """
-    Convert old 2D output format (per antigen) to 1D dataframe
-    :param str xlsx_path: path to the xlsx file
-    :param str sheet: sheet name to load
+    Linearize 2D table of antigen grid values (old output format)
+    :param dataframe df: table with antigen grid rows as index and
+        antigen grid columns as columns
     :param str data_col: new column name of the linearized values
     :return dataframe df: linearized dataframe
     """
-    df = pd.read_excel(xlsx_path, sheet_name=sheet, index_col=0)
     df = df.unstack().reset_index(name=data_col)  # linearize the table
     df.rename(columns={'level_1': 'antigen_row', 'level_0': 'antigen_col'}, inplace=True)
     df[['antigen_row', 'antigen_col']] = df[['antigen_row', 'antigen_col']].applymap(int)
@@ -20,15 +51,14 @@ def antigen2D_to_df1D(xlsx_path, sheet, data_col):
     return df
 
 
-def well2D_to_df1D(xlsx_path, sheet, data_col):
+def unstack_well2D(df, data_col):
     """
-    Convert new 2D output format (per well) to 1D dataframe
-    :param str xlsx_path: path to the xlsx file
-    :param str sheet: sheet name to load
+    Linearize 2D table of plate values (new output format)
+    :param dataframe df: table with plate rows as index and plate columns
+        as columns
     :param str data_col: new column name of the linearized values
     :return dataframe df: linearized dataframe
     """
-    df = pd.read_excel(xlsx_path, sheet_name=sheet, index_col=0)
     df = df.unstack().reset_index(name=data_col)  # unpivot (linearize) the table
     df.rename(columns={'level_1': 'row_id', 'level_0': 'col_id'}, inplace=True)
     df['well_id'] = df.row_id + df.col_id.map(str)
@@ -36,6 +66,30 @@ def well2D_to_df1D(xlsx_path, sheet, data_col):
     return df
 
 
+def antigen2D_to_df1D(xlsx_path, sheet, data_col):
+    """
+    Convert old 2D output format (per antigen) to 1D dataframe
+    :param str xlsx_path: path to the xlsx file
+    :param str sheet: sheet name to load
+    :param str data_col: new column name of the linearized values
+    :return dataframe df: linearized dataframe
+    """
+    df = pd.read_excel(xlsx_path, sheet_name=sheet, index_col=0)
+    return unstack_antigen2D(df, data_col)
+
+
+def well2D_to_df1D(xlsx_path, sheet, data_col):
+    """
+    Convert new 2D output format (per well) to 1D dataframe
+    :param str xlsx_path: path to the xlsx file
+    :param str sheet: sheet name to load
+    :param str data_col: new column name of the linearized values
+    :return dataframe df: linearized dataframe
+    """
+    df = pd.read_excel(xlsx_path, sheet_name=sheet, index_col=0)
+    return unstack_well2D(df, data_col)
+
+
 def read_plate_info(metadata_xlsx):
     """read plate info from the metadata"""
     print('Reading the plate info...')
@@ -48,10 +102,11 @@ def read_plate_info(metadata_xlsx):
                    'sample type']
     plate_info_df = pd.DataFrame()
     # get sheet names that are available in metadata
-    sheet_names = list(set(metadata_xlsx.sheet_names).intersection(sheet_names))
+    sheet_names = [s for s in sheet_names if s in metadata_xlsx.sheet_names]
+    # read all plate info sheets in one pass
+    sheets = pd.read_excel(metadata_xlsx, sheet_name=sheet_names, index_col=0)
     for sheet_name in sheet_names:
-        sheet_df = pd.read_excel(metadata_xlsx, sheet_name=sheet_name, index_col=0)
-        sheet_df = sheet_df.unstack().reset_index(name=sheet_name)  # unpivot (linearize) the table
+        sheet_df = sheets[sheet_name].unstack().reset_index(name=sheet_name)  # unpivot (linearize) the table
         sheet_df.rename(columns={'level_1': 'row_id', 'level_0': 'col_id'}, inplace=True)
         if plate_info_df.empty:
             plate_info_df = sheet_df
@@ -77,15 +132,17 @@ def read_plate_info(metadata_xlsx):
 def read_antigen_info(metadata_path):
     """read antigen info from the metadata"""
     print('Reading antigen information...')
-    antigen_df = antigen2D_to_df1D(xlsx_path=metadata_path, sheet='antigen_array', data_col='antigen')
-    antigen_type_df = antigen2D_to_df1D(xlsx_path=metadata_path, sheet='antigen_type', data_col='antigen type')
+    sheets = pd.read_excel(metadata_path, sheet_name=['antigen_array', 'antigen_type'], index_col=0)
+    antigen_df = unstack_antigen2D(sheets['antigen_array'], data_col='antigen')
+    antigen_type_df = unstack_antigen2D(sheets['antigen_type'], data_col='antigen type')
     antigen_df = pd.merge(antigen_df, antigen_type_df, how='left', on=['antigen_row', 'antigen_col'])
     return antigen_df
 
 
 def read_pysero_output(file_path, antigen_df, file_type='od'):
     """
-    read and re-format pysero spot fitting output
+    read and re-format pysero spot fitting output. All antigen sheets are
+    read in one pass and concatenated once
     :param str file_path: path to the pysero output xlsx file
     :param dataframe antigen_df:
     :param str file_type: output file type. 'od', 'int', or 'bg'
@@ -93,21 +150,46 @@ def read_pysero_output(file_path, antigen_df, file_type='od'):
     """
     print('Reading {}...'.format(file_type))
     data_col = {'od': 'OD', 'int': 'intensity', 'bg': 'background'}
-    data_df = pd.DataFrame()
+    antigens = list(zip(antigen_df['antigen_row'],
+                        antigen_df['antigen_col'],
+                        antigen_df['antigen']))
+    if len(antigens) == 0:
+        return pd.DataFrame()
 
     with pd.ExcelFile(file_path) as file:
-        sheet_names = file.sheet_names
-        for _, row in antigen_df.iterrows():
-            if sheet_names[0][0].isnumeric(): # new format
-                sheet_name = '{}_{}_{}'.format(row['antigen_row'], row['antigen_col'], row['antigen'])
-            else:
-                sheet_name = '{}_{}_{}_{}'.format(file_type, row['antigen_row'], row['antigen_col'], row['antigen'])
-            data_1_antiten_df = well2D_to_df1D(xlsx_path=file, sheet=sheet_name, data_col=data_col[file_type])
-            data_1_antiten_df['antigen_row'] = row['antigen_row']
-            data_1_antiten_df['antigen_col'] = row['antigen_col']
-            data_1_antiten_df['antigen'] = row['antigen']
-            data_df = data_df.append(data_1_antiten_df, ignore_index=True)
-    return data_df
+        if file.sheet_names[0][0].isnumeric():  # new format
+            sheet_names = ['{}_{}_{}'.format(*antigen) for antigen in antigens]
+        else:
+            sheet_names = ['{}_{}_{}_{}'.format(file_type, *antigen) for antigen in antigens]
+        sheets = pd.read_excel(file, sheet_name=sheet_names, index_col=0)
+    df_list = []
+    for sheet_name, (antigen_row, antigen_col, antigen) in zip(sheet_names, antigens):
+        data_1_antigen_df = unstack_well2D(sheets[sheet_name], data_col=data_col[file_type])
+        data_1_antigen_df['antigen_row'] = antigen_row
+        data_1_antigen_df['antigen_col'] = antigen_col
+        data_1_antigen_df['antigen'] = antigen
+        df_list.append(data_1_antigen_df)
+    return pd.concat(df_list, ignore_index=True)
+
+
+def read_pysero_long_report(report_path, antigen_df):
+    """
+    read long format pysero plate report and split it into OD, intensity
+    and background dataframes, same as read_pysero_output
+    :param str report_path: path to plate report (csv, parquet or h5)
+    :param dataframe antigen_df: antigens in the order of output rows
+    :return dataframe OD_df: linearized OD dataframe
+    :return dataframe int_df: linearized intensity dataframe
+    :return dataframe bg_df: linearized background dataframe
+    """
+    print('Reading {}...'.format(report_path))
+    report_df = report.read_long_report(report_path)
+    report_df.rename(columns={'grid_row': 'antigen_row', 'grid_col': 'antigen_col'}, inplace=True)
+    report_df = pd.merge(antigen_df[['antigen_row', 'antigen_col']],
+                         report_df,
+                         how='inner', on=['antigen_row', 'antigen_col'])
+    return [report_df[['well_id', data_col, 'antigen_row', 'antigen_col', 'antigen']]
+            for data_col in ['OD', 'intensity', 'background']]
 
 
 def read_scn_output(file_path, plate_info_df):
@@ -118,12 +200,14 @@ def read_scn_output(file_path, plate_info_df):
     :return dataframe: scienion OD dataframe
     """
     # Read analysis output from Scienion
-    scienion_df = pd.DataFrame()
+    # read all well sheets in one pass
+    well_ids = list(plate_info_df['well_id'])
     with pd.ExcelFile(file_path) as scienion_xlsx:
-        for well_id in plate_info_df['well_id']:
-            OD_1_antiten_df = pd.read_excel(scienion_xlsx, sheet_name=well_id)
-            OD_1_antiten_df['well_id'] = well_id
-            scienion_df = scienion_df.append(OD_1_antiten_df, ignore_index=True)
+        sheets = pd.read_excel(scienion_xlsx, sheet_name=well_ids)
+    scienion_df = pd.concat(
+        [sheets[well_id].assign(well_id=well_id) for well_id in well_ids],
+        ignore_index=True,
+    )
     # parse spot ids
     spot_id_df = scienion_df['ID'].str.extract(r'spot-(\d)-(\d)')
     spot_id_df = spot_id_df.astype(int) - 1  # index starting from 0
@@ -155,6 +239,21 @@ def slice_df(df, slice_action, column, keys):
         df = df[~df[column].isin(keys)]
     else:
         raise ValueError('slice action has to be "keep" or "drop", not "{}"'.format(slice_action))
+    return remove_unused_categories(df)
+
+
+def remove_unused_categories(df):
+    """
+    Remove categories that no longer occur in categorical columns, e.g. after
+    slicing, so that plot hues and groups only contain remaining values
+    :param dataframe df: dataframe to clean up
+    :return dataframe df: dataframe with only observed categories
+    """
+    cat_cols = df.select_dtypes('category').columns
+    if len(cat_cols) > 0:
+        df = df.copy()
+        for col in cat_cols:
+            df[col] = df[col].cat.remove_unused_categories()
     return df
 
 
@@ -193,7 +292,7 @@ def normalize_od(df, norm_antigen=None, group='plate'):
                    (df['sample type'] == sample_type), 'OD'] = \
                 norm_antigen_df['OD'] / norm_antigen_df['OD'].mean()
     norm_fn = normalize_od_helper(norm_antigen)
-    df = df.groupby(groupby_cols).apply(norm_fn)
+    df = df.groupby(groupby_cols, observed=True).apply(norm_fn)
     return df
 
 
@@ -219,86 +318,431 @@ def offset_od(df, norm_antigen=None, group='plate'):
     else:
         ValueError('normalization group has to be plate or well, not {}'.format(group))
     norm_fn = offset_od_helper(norm_antigen)
-    df = df.groupby(groupby_cols).apply(norm_fn)
+    df = df.groupby(groupby_cols, observed=True).apply(norm_fn)
     return df
 
 
-def read_scn_output_batch(scn_dirs_df):
+def get_file_fingerprint(file_path):
+    """
+    Fingerprint of a file that changes when the file is modified
+    :param str file_path: path to file
+    :return list fingerprint: absolute path, modification time in ns and size
+    """
+    file_stat = os.stat(file_path)
+    return [os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size]
+
+
+def get_plate_key(file_paths, plate_config):
+    """
+    Cache key of a plate, which changes if any of its files or its settings
+    in the analysis config change
+    :param list file_paths: paths to output and metadata files of the plate
+    :param dict plate_config: settings of the plate in the analysis config
+    :return str plate_key: hash of file fingerprints and plate settings
+    """
+    fingerprint = {
+        'config': plate_config,
+        'files': [get_file_fingerprint(path) for path in file_paths],
+    }
+    fingerprint = json.dumps(fingerprint, sort_keys=True, default=str)
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def get_cached_plate_path(cache_dir, plate_key):
+    """
+    :param str cache_dir: plate cache directory
+    :param str plate_key: cache key of plate
+    :return str cache_path: path to cached plate if it exists, otherwise None
+    """
+    for file_format in MASTER_REPORT_FORMATS:
+        cache_path = os.path.join(cache_dir, '.'.join([plate_key, file_format]))
+        if os.path.isfile(cache_path):
+            return cache_path
+    return None
+
+
+def read_plates_cached(read_fn, plate_args, plate_keys, cache_dir=None, nbr_workers=1):
+    """
+    Load plates from cache if they were parsed before with the same cache
+    key, otherwise parse them, in parallel if nbr_workers > 1, and add them
+    to the cache
+    :param function read_fn: picklable function returning a plate dataframe
+    :param list plate_args: argument tuples of read_fn, one per plate
+    :param list plate_keys: cache keys of plates
+    :param str cache_dir: plate cache directory. If None, don't use the cache
+    :param int nbr_workers: number of processes plates are parsed in
+    :return list plate_dfs: plate dataframes with categorical string columns,
+        in plate_args order
     """
-    batch read scienion outputs
+    plate_dfs = [None] * len(plate_args)
+    if cache_dir is not None:
+        for idx, plate_key in enumerate(plate_keys):
+            cache_path = get_cached_plate_path(cache_dir, plate_key)
+            if cache_path is not None:
+                print('Load cached plate {}...'.format(plate_key))
+                plate_dfs[idx] = read_report_file(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+    read_idxs = [idx for idx, plate_df in enumerate(plate_dfs) if plate_df is None]
+    plate_results = parallel_utils.map_wells(
+        well_fn=read_fn,
+        well_args=[plate_args[idx] for idx in read_idxs],
+        nbr_workers=nbr_workers,
+    )
+    file_format = get_master_report_format()
+    for idx, plate_df in zip(read_idxs, plate_results):
+        plate_df = to_categorical(plate_df.reset_index(drop=True))
+        if cache_dir is not None:
+            write_report_file(
+                plate_df,
+                os.path.join(cache_dir, '.'.join([plate_keys[idx], file_format])),
+                file_format,
+            )
+        plate_dfs[idx] = plate_df
+    return plate_dfs
+
+
+def prune_plate_cache(cache_dir, plate_keys):
+    """
+    Remove cached plates that are no longer in the analysis config or
+    whose files have changed
+    :param str cache_dir: plate cache directory
+    :param list plate_keys: cache keys of current plates
+    """
+    if cache_dir is None or not os.path.isdir(cache_dir):
+        return
+    for file_name in os.listdir(cache_dir):
+        plate_key, ext = os.path.splitext(file_name)
+        if ext[1:] in MASTER_REPORT_FORMATS and plate_key not in plate_keys:
+            os.remove(os.path.join(cache_dir, file_name))
+
+
+def read_scn_plate(scn_dir, scn_path, plate_id):
+    """
+    read scienion output of one plate and join it with plate and antigen info
+    :param str scn_dir: directory of scienion output and metadata
+    :param str scn_path: path to scienion output xlsx file
+    :param str plate_id: plate ID
+    :return dataframe scn_df: scienion OD dataframe of the plate
+    """
+    metadata_path = os.path.join(scn_dir, 'pysero_output_data_metadata.xlsx')
+    with pd.ExcelFile(metadata_path) as meta_file:
+        antigen_df = read_antigen_info(meta_file)
+        plate_info_df = read_plate_info(meta_file)
+    plate_info_df['plate ID'] = plate_id
+    scn_df = read_scn_output(scn_path, plate_info_df)
+    # Join Scienion data with plateInfo
+    scn_df = pd.merge(scn_df,
+                      antigen_df,
+                      how='left', on=['antigen_row', 'antigen_col'])
+    scn_df = pd.merge(scn_df,
+                      plate_info_df,
+                      how='right', on=['well_id'])
+    return scn_df
+
+
+def read_scn_output_batch(scn_dirs_df, cache_dir=None, nbr_workers=1):
+    """
+    batch read scienion outputs. Plates whose files haven't changed since
+    they were last read are loaded from the cache, the others are read
+    in parallel
     :param dataframe scn_dirs_df: dataframe loaded from the analysis config
     containing directories of scienion output xlsx file, assuming the file name always
     ends with '_analysis.xlsx'
+    :param str cache_dir: plate cache directory. If None, read all plates
+    :param int nbr_workers: number of processes plates are read in
     :return dataframe scn_df: combined scienion OD dataframe from multiple outputs
+    :return list plate_keys: cache keys of plates
     """
-    scn_df = pd.DataFrame()
+    plate_args = []
+    plate_keys = []
     for scn_dir, plate_id, in zip(scn_dirs_df['directory'], scn_dirs_df['plate ID']):
         metadata_path = os.path.join(scn_dir, 'pysero_output_data_metadata.xlsx')
-        with pd.ExcelFile(metadata_path) as meta_file:
-            antigen_df = read_antigen_info(meta_file)
-            plate_info_df = read_plate_info(meta_file)
-        plate_info_df['plate ID'] = plate_id
         scn_fname = [f for f in os.listdir(scn_dir) if '_analysis.xlsx' in f]
         scn_path = os.path.join(scn_dir, scn_fname[0])
-        scn_df_tmp = read_scn_output(scn_path, plate_info_df)
-        # Join Scienion data with plateInfo
-        scn_df_tmp = pd.merge(scn_df_tmp,
-                          antigen_df,
-                          how='left', on=['antigen_row', 'antigen_col'])
-        scn_df_tmp = pd.merge(scn_df_tmp,
-                          plate_info_df,
-                          how='right', on=['well_id'])
-        scn_df = scn_df.append(scn_df_tmp, ignore_index=True)
+        plate_key = get_plate_key(
+            file_paths=[metadata_path, scn_path],
+            plate_config={'pipeline': 'scienion', 'plate ID': plate_id},
+        )
+        plate_keys.append(plate_key)
+        plate_args.append((scn_dir, scn_path, plate_id))
+    df_list = read_plates_cached(
+        read_fn=read_scn_plate,
+        plate_args=plate_args,
+        plate_keys=plate_keys,
+        cache_dir=cache_dir,
+        nbr_workers=nbr_workers,
+    )
+    scn_df = pd.concat(df_list, ignore_index=True)
     scn_df['pipeline'] = 'scienion'
     scn_df.dropna(subset=['OD'], inplace=True)
-    return scn_df
+    return scn_df, plate_keys
 
 
-def read_pysero_output_batch(ntl_dirs_df):
+def read_pysero_plate(data_folder, slice_action, well_id, plate_id):
     """
-    batch read pysero outputs
-    :param dataframe ntl_dirs_df: dataframe loaded from the analysis config
-    containing directories of pysero output xlsx file
-    :return dataframe scn_df: combined pysero OD dataframe from multiple outputs
+    read pysero outputs of one plate and join them with plate and antigen info
+    :param str data_folder: directory of pysero output and metadata
+    :param str slice_action: 'keep' or 'drop' wells in well_id, or None
+    :param list well_id: wells to keep or drop
+    :param str plate_id: plate ID
+    :return dataframe pysero_df: pysero OD dataframe of the plate
     """
-    pysero_df = pd.DataFrame()
-    for data_folder, slice_action, well_id, plate_id in \
-            zip(ntl_dirs_df['directory'], ntl_dirs_df['well action'],
-                ntl_dirs_df['well ID'], ntl_dirs_df['plate ID']):
-        print('Load {}...'.format(data_folder))
-        metadata_path = os.path.join(data_folder, 'pysero_output_data_metadata.xlsx')
+    print('Load {}...'.format(data_folder))
+    metadata_path = os.path.join(data_folder, 'pysero_output_data_metadata.xlsx')
+
+    with pd.ExcelFile(metadata_path) as meta_file:
+        antigen_df = read_antigen_info(meta_file)
+        plate_info_df = read_plate_info(meta_file)
+    plate_info_df['plate ID'] = plate_id
+    # read long format plate report if there is one, otherwise workbooks
+    long_path = report.find_long_report(data_folder)
+    if long_path is not None:
+        OD_df, int_df, bg_df = read_pysero_long_report(long_path, antigen_df)
+    else:
         OD_path = os.path.join(data_folder, 'median_ODs.xlsx')
         int_path = os.path.join(data_folder, 'median_intensities.xlsx')
         bg_path = os.path.join(data_folder, 'median_backgrounds.xlsx')
-
-        with pd.ExcelFile(metadata_path) as meta_file:
-            antigen_df = read_antigen_info(meta_file)
-            plate_info_df = read_plate_info(meta_file)
-        plate_info_df['plate ID'] = plate_id
         OD_df = read_pysero_output(OD_path, antigen_df, file_type='od')
         int_df = read_pysero_output(int_path, antigen_df, file_type='int')
         bg_df = read_pysero_output(bg_path, antigen_df, file_type='bg')
-        OD_df = pd.merge(OD_df,
-                         antigen_df[['antigen_row', 'antigen_col', 'antigen type']],
-                         how='left', on=['antigen_row', 'antigen_col'])
-        OD_df = pd.merge(OD_df,
-                         plate_info_df,
-                         how='right', on=['well_id'])
-        pysero_df_tmp = pd.merge(OD_df,
-                                 int_df,
-                                 how='left', on=['antigen_row', 'antigen_col', 'well_id'])
-        pysero_df_tmp = pd.merge(pysero_df_tmp,
-                                 bg_df,
-                                 how='left', on=['antigen_row', 'antigen_col', 'well_id'])
-        pysero_df_tmp['pipeline'] = 'nautilus'
-        pysero_df_tmp.replace([np.inf, -np.inf], np.nan, inplace=True)
-        pysero_df_tmp.dropna(subset=['OD'], inplace=True)
-        pysero_df_tmp = slice_df(pysero_df_tmp, slice_action, 'well_id', well_id)
-        pysero_df = pysero_df.append(pysero_df_tmp, ignore_index=True)
+    OD_df = pd.merge(OD_df,
+                     antigen_df[['antigen_row', 'antigen_col', 'antigen type']],
+                     how='left', on=['antigen_row', 'antigen_col'])
+    OD_df = pd.merge(OD_df,
+                     plate_info_df,
+                     how='right', on=['well_id'])
+    pysero_df = pd.merge(OD_df,
+                         int_df,
+                         how='left', on=['antigen_row', 'antigen_col', 'well_id'])
+    pysero_df = pd.merge(pysero_df,
+                         bg_df,
+                         how='left', on=['antigen_row', 'antigen_col', 'well_id'])
+    pysero_df['pipeline'] = 'nautilus'
+    pysero_df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    pysero_df.dropna(subset=['OD'], inplace=True)
+    # long reports only have assigned wells, the others are NaN after merging
+    pysero_df = pysero_df.astype({'antigen_row': int, 'antigen_col': int})
+    pysero_df = slice_df(pysero_df, slice_action, 'well_id', well_id)
     return pysero_df
 
 
-def read_output_batch(output_dir, ntl_dirs_df, scn_dirs_df, load_report):
+def read_pysero_output_batch(ntl_dirs_df, cache_dir=None, nbr_workers=1):
+    """
+    batch read pysero outputs, from the long format plate report if there is
+    one, otherwise from the OD, intensity and background workbooks.
+    Plates whose files and config settings haven't changed since they were
+    last read are loaded from the cache, the others are read in parallel
+    :param dataframe ntl_dirs_df: dataframe loaded from the analysis config
+    containing directories of pysero output xlsx file
+    :param str cache_dir: plate cache directory. If None, read all plates
+    :param int nbr_workers: number of processes plates are read in
+    :return dataframe pysero_df: combined pysero OD dataframe from multiple outputs
+    :return list plate_keys: cache keys of plates
+    """
+    plate_args = []
+    plate_keys = []
+    for data_folder, slice_action, well_id, plate_id in \
+            zip(ntl_dirs_df['directory'], ntl_dirs_df['well action'],
+                ntl_dirs_df['well ID'], ntl_dirs_df['plate ID']):
+        file_paths = [os.path.join(data_folder, 'pysero_output_data_metadata.xlsx')]
+        long_path = report.find_long_report(data_folder)
+        if long_path is not None:
+            file_paths.append(long_path)
+        else:
+            file_paths += [os.path.join(data_folder, f) for f in
+                           ['median_ODs.xlsx', 'median_intensities.xlsx', 'median_backgrounds.xlsx']]
+        plate_key = get_plate_key(
+            file_paths=file_paths,
+            plate_config={'pipeline': 'nautilus',
+                          'plate ID': plate_id,
+                          'well action': slice_action,
+                          'well ID': well_id},
+        )
+        plate_keys.append(plate_key)
+        plate_args.append((data_folder, slice_action, well_id, plate_id))
+    df_list = read_plates_cached(
+        read_fn=read_pysero_plate,
+        plate_args=plate_args,
+        plate_keys=plate_keys,
+        cache_dir=cache_dir,
+        nbr_workers=nbr_workers,
+    )
+    pysero_df = pd.concat(df_list, ignore_index=True)
+    return pysero_df, plate_keys
+
+
+def get_master_report_format():
+    """
+    Get the preferred master report format given installed packages.
+    Parquet and Feather are typed and columnar and require pyarrow
+    (or fastparquet for Parquet), otherwise fall back to csv.
+    :return str file_format: 'parquet' or 'csv'
+    """
+    for engine in ['pyarrow', 'fastparquet']:
+        if importlib.util.find_spec(engine) is not None:
+            return 'parquet'
+    return 'csv'
+
+
+def to_categorical(df):
+    """
+    Convert string columns of the master report to categoricals.
+    Values are converted to strings (except missing values) so that
+    columns with mixed types, e.g. numeric serum IDs, can be stored in
+    typed formats.
+    :param dataframe df: master report
+    :return dataframe df: master report with categorical columns
+    """
+    for col in CATEGORICAL_COLS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            # convert a copy, astype(str) can write to unpickled object arrays
+            values = df[col].to_numpy(dtype=object, copy=True)
+            is_value = ~pd.isna(values)
+            values[is_value] = values[is_value].astype(str)
+            df[col] = pd.Categorical(values)
+    return df
+
+
+def filter_df(df, filters):
+    """
+    Keep rows of dataframe that match all filters
+    :param dataframe df: dataframe to filter
+    :param list filters: (column, operator, value) tuples, where operator is
+        one of '==', '!=', '<', '<=', '>', '>=', 'in' or 'not in'.
+        Rows must match all filters.
+    :return dataframe df: filtered dataframe
+    """
+    if not filters:
+        return df
+    keep = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        if op == 'in':
+            keep &= df[column].isin(value).to_numpy()
+        elif op == 'not in':
+            keep &= ~df[column].isin(value).to_numpy()
+        elif op in FILTER_OPS:
+            keep &= FILTER_OPS[op](df[column], value).to_numpy()
+        else:
+            raise ValueError('filter operator "{}" is not supported'.format(op))
+    return df[keep].reset_index(drop=True)
+
+
+def get_master_report_path(output_dir, file_format):
+    """
+    :param str output_dir: directory of the master report
+    :param str file_format: 'parquet', 'feather' or 'csv'
+    :return str path: path to master report
+    """
+    return os.path.join(output_dir, '.'.join([MASTER_REPORT_NAME, file_format]))
+
+
+def write_report_file(df, report_path, file_format):
+    """
+    Write report dataframe, converting string columns to categoricals
+    :param dataframe df: report dataframe
+    :param str report_path: path to report file
+    :param str file_format: 'parquet', 'feather' or 'csv'
+    """
+    if file_format not in MASTER_REPORT_FORMATS:
+        raise ValueError('master report format has to be one of {}, not "{}"'.
+                         format(MASTER_REPORT_FORMATS, file_format))
+    df = to_categorical(df.reset_index(drop=True))
+    if file_format == 'parquet':
+        df.to_parquet(report_path, index=False)
+    elif file_format == 'feather':
+        df.to_feather(report_path)
+    else:
+        df.to_csv(report_path, index=False)
+
+
+def read_report_file(report_path, columns=None, filters=None):
+    """
+    Read report dataframe. Only the requested columns and the rows that
+    match the filters are loaded; Parquet reports push both down to the
+    reader so the rest is never read into memory.
+    :param str report_path: path to report file with extension
+        '.parquet', '.feather' or '.csv'
+    :param list columns: columns to load. If None, load all columns
+    :param list filters: (column, operator, value) tuples rows must match,
+        see filter_df
+    :return dataframe df: report with categorical string columns
+    """
+    read_cols = columns
+    if columns is not None and filters:
+        read_cols = list(columns) + \
+            [f[0] for f in filters if f[0] not in columns]
+    if report_path.endswith('.parquet'):
+        if filters:
+            df = pd.read_parquet(report_path, columns=read_cols, filters=filters)
+        else:
+            df = pd.read_parquet(report_path, columns=read_cols)
+    elif report_path.endswith('.feather'):
+        df = pd.read_feather(report_path, columns=read_cols)
+    else:
+        # csv reports from earlier versions have the index in the first column
+        header = pd.read_csv(report_path, nrows=0).columns
+        if read_cols is None:
+            read_cols = [col for col in header if col != 'Unnamed: 0']
+        df = pd.read_csv(
+            report_path,
+            usecols=read_cols,
+            dtype={col: str for col in CATEGORICAL_COLS if col in header},
+            float_precision='round_trip',
+        )
+    # Filters are applied again since fastparquet only filters row groups
+    df = filter_df(df, filters)
+    if columns is not None:
+        df = df[list(columns)]
+    return to_categorical(df)
+
+
+def write_master_report(df, output_dir, file_format=None):
+    """
+    Save master report with categorical string columns. Master reports
+    in other formats are removed so a stale report is never loaded.
+    :param dataframe df: master report
+    :param str output_dir: directory to save the master report
+    :param str file_format: 'parquet', 'feather' or 'csv'. If None, use
+        parquet if available, otherwise csv
+    :return str report_path: path to saved master report
+    """
+    if file_format is None:
+        file_format = get_master_report_format()
+    report_path = get_master_report_path(output_dir, file_format)
+    write_report_file(df, report_path, file_format)
+    for other_format in MASTER_REPORT_FORMATS:
+        other_path = get_master_report_path(output_dir, other_format)
+        if other_format != file_format and os.path.isfile(other_path):
+            os.remove(other_path)
+    return report_path
+
+
+def read_master_report(output_dir, columns=None, filters=None):
+    """
+    Load master report saved in the output directory, see read_report_file
+    :param str output_dir: directory of the master report
+    :param list columns: columns to load. If None, load all columns
+    :param list filters: (column, operator, value) tuples rows must match,
+        see filter_df
+    :return dataframe df: master report with categorical string columns
+    """
+    report_paths = [get_master_report_path(output_dir, file_format)
+                    for file_format in MASTER_REPORT_FORMATS]
+    report_paths = [path for path in report_paths if os.path.isfile(path)]
+    if len(report_paths) == 0:
+        raise IOError("master report not found in {}, aborting".format(output_dir))
+    print('Loading {}...'.format(report_paths[0]))
+    return read_report_file(report_paths[0], columns, filters)
+
+
+def read_output_batch(output_dir,
+                      ntl_dirs_df,
+                      scn_dirs_df,
+                      load_report,
+                      columns=None,
+                      filters=None,
+                      use_cache=True,
+                      nbr_workers=1):
     """
     batch read pysero and scienion outputs
     :param output_dir: directory to save the master report
@@ -307,16 +751,32 @@ def read_output_batch(output_dir, ntl_dirs_df, scn_dirs_df, load_report):
     :param dataframe scn_dirs_df: dataframe loaded from the analysis config
     containing directories of scienion output xlsx file, assuming the file name always
     ends with '_analysis.xlsx'
+    :param bool load_report: If True, load the saved master report instead
+    of reading the outputs
+    :param list columns: columns of the master report to return. If None,
+    return all columns
+    :param list filters: (column, operator, value) tuples rows of the master
+    report must match, see filter_df
+    :param bool use_cache: If True, only read plates that are new or whose
+    files or config settings changed since the last run, and load the other
+    plates from the plate cache in the output directory
+    :param int nbr_workers: number of processes plates are read in
     :return dataframe stitched_pysero_df: combined pysero and scienion OD dataframe from multiple outputs
     """
     if not load_report:
         df_list = []
         scn_df = pd.DataFrame()
+        pysero_df = pd.DataFrame()
+        scn_keys = pysero_keys = []
+        cache_dir = None
+        if use_cache:
+            cache_dir = os.path.join(output_dir, PLATE_CACHE_DIR)
         if not scn_dirs_df.empty:
-            scn_df = read_scn_output_batch(scn_dirs_df)
+            scn_df, scn_keys = read_scn_output_batch(scn_dirs_df, cache_dir, nbr_workers)
 
         if not ntl_dirs_df.empty:
-           pysero_df = read_pysero_output_batch(ntl_dirs_df)
+           pysero_df, pysero_keys = read_pysero_output_batch(ntl_dirs_df, cache_dir, nbr_workers)
+        prune_plate_cache(cache_dir, scn_keys + pysero_keys)
 
         df_list.append(pysero_df)
         df_list.append(scn_df)
@@ -327,7 +787,11 @@ def read_output_batch(output_dir, ntl_dirs_df, scn_dirs_df, load_report):
         stitched_pysero_df = stitched_pysero_df[(stitched_pysero_df['antigen'] != 'xkappa-biotin') |
                                 (stitched_pysero_df['antigen type'] == 'Fiducial')]
         stitched_pysero_df['serum dilution'] = stitched_pysero_df['serum dilution'].round(7)
-        stitched_pysero_df.to_csv(os.path.join(output_dir, 'master_report.csv'))
+        stitched_pysero_df = to_categorical(stitched_pysero_df.reset_index(drop=True))
+        write_master_report(stitched_pysero_df, output_dir)
+        stitched_pysero_df = filter_df(stitched_pysero_df, filters)
+        if columns is not None:
+            stitched_pysero_df = stitched_pysero_df[list(columns)]
     else:
-        stitched_pysero_df = pd.read_csv(os.path.join(output_dir, 'master_report.csv'), index_col=0, low_memory=False)
-    return stitched_pysero_df
\ No newline at end of file
+        stitched_pysero_df = read_master_report(output_dir, columns, filters)
+    return stitched_pysero_df
@@ -1,4 +1,5 @@
 import argparse
+import cProfile
 import logging
 import os
 
@@ -78,6 +79,82 @@ def parse_args():
              "Assumed to be in the same directory as images. "
              "Default: 'pysero_output_data_metadata.xlsx'"
     )
+    parser.add_argument(
+        '-n', '--workers',
+        type=int,
+        default=1,
+        help="Number of processes wells are distributed over during OD "
+             "extraction, or plates are read in during OD analysis. "
+             "Default: 1",
+    )
+    parser.add_argument(
+        '-s', '--seed',
+        type=int,
+        default=None,
+        help="Random seed for registration, set for reproducible runs. "
+             "Default: None",
+    )
+    parser.add_argument(
+        '-f', '--stats_format',
+        type=str,
+        choices=['csv', 'parquet'],
+        default='csv',
+        help="Format of spot metrics files written for each well as soon as "
+             "it's processed. Parquet requires pyarrow. Default: csv",
+    )
+    parser.add_argument(
+        '--no_xlsx',
+        dest='stats_xlsx',
+        action='store_false',
+        help="Don't export spot metrics of all wells to stats_per_well.xlsx "
+             "at the end of the run. Default: False",
+    )
+    parser.set_defaults(stats_xlsx=True)
+    parser.add_argument(
+        '--report_formats',
+        type=str,
+        nargs='+',
+        choices=['xlsx', 'csv', 'parquet', 'hdf5'],
+        default=['xlsx', 'csv'],
+        help="Formats of plate reports: 'xlsx' for OD, intensity and "
+             "background workbooks with a sheet per antigen, 'csv', 'parquet' "
+             "or 'hdf5' for one long format table. Default: xlsx csv",
+    )
+    parser.set_defaults(profile=False)
+    parser.add_argument(
+        '-p', '--profile',
+        dest='profile',
+        action='store_true',
+        help="Profile the run with cProfile and write stats to pysero.prof "
+             "in the run directory. Only the main process is profiled, "
+             "stage times of all wells are always written to "
+             "stage_times.json. Default: False",
+    )
+    parser.set_defaults(watch=False)
+    parser.add_argument(
+        '--watch',
+        dest='watch',
+        action='store_true',
+        help="Watch the input directory while the plate is being scanned "
+             "and extract ODs of each well as soon as its image is "
+             "complete. Plate reports are updated as wells are done. "
+             "Only for the array_fit workflow. Default: False",
+    )
+    parser.add_argument(
+        '--expected_wells',
+        type=str,
+        nargs='+',
+        default=None,
+        help="Well names a watched run waits for before it's finalized. "
+             "Default: all wells of a 96 well plate",
+    )
+    parser.add_argument(
+        '--watch_timeout',
+        type=float,
+        default=600,
+        help="Finalize a watched run if no new well image has appeared "
+             "for this many seconds. Default: 600",
+    )
     parser.set_defaults(load_report=False)
     parser.add_argument(
         '-l', '--load_report',
@@ -90,7 +167,7 @@ def parse_args():
     return parser.parse_args()
 
 
-def extract_od(input_dir, output_dir, workflow):
+def extract_od(input_dir, output_dir, workflow, nbr_workers=1, watch=False):
     """
     For each image in input directory, run either interpolation
     or registration of fiducials (default) workflow.
@@ -102,29 +179,40 @@ def extract_od(input_dir, output_dir, workflow):
         <plate>_<method> format:
             <plate> describes the printing style of the antigen (array or ELISA)
             <method> describes the spot segmentation and extraction approach
+    :param int nbr_workers: Number of processes to distribute wells over
+    :param bool watch: Process wells as their images appear in the input
+        directory, only for the 'array_fit' workflow
     """
+    if watch and workflow != 'array_fit':
+        raise ValueError("Watch mode is only supported for the array_fit "
+                         "workflow, not {}".format(workflow))
 
     if workflow == 'array_interp':
         interpolation_wf.interp(
             input_dir,
             output_dir,
+            nbr_workers=nbr_workers,
         )
     elif workflow == 'array_fit':
         registration_wf.point_registration(
             input_dir,
             output_dir,
+            nbr_workers=nbr_workers,
+            watch=watch,
         )
     elif workflow == 'well_segmentation':
         well_wf.well_analysis(
             input_dir,
             output_dir,
             method='segmentation',
+            nbr_workers=nbr_workers,
         )
     elif workflow == 'well_crop':
         well_wf.well_analysis(
             input_dir,
             output_dir,
             method='crop',
+            nbr_workers=nbr_workers,
         )
 
 
@@ -146,6 +234,14 @@ def run_pysero(args):
     constants.DEBUG = args.debug
     constants.RERUN = args.rerun
     constants.LOAD_REPORT = args.load_report
+    constants.RANDOM_SEED = args.seed
+    constants.WELL_STATS_FORMAT = args.stats_format
+    constants.WELL_STATS_XLSX = args.stats_xlsx
+    constants.REPORT_FORMATS = args.report_formats
+    constants.PROFILE = args.profile
+    constants.WATCH = args.watch
+    constants.EXPECTED_WELLS = args.expected_wells
+    constants.WATCH_TIMEOUT = args.watch_timeout
 
     constants.RUN_PATH = io_utils.make_run_dir(
         input_dir=input_dir,
@@ -165,19 +261,31 @@ def run_pysero(args):
     logger.info("output dir: {}".format(output_dir))
     logger.info("run dir: {}".format(constants.RUN_PATH))
 
+    profiler = None
+    if constants.PROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
     if args.extract_od:
         logging.info("Extract OD workflow: {}".format(args.workflow))
         extract_od(
             input_dir=input_dir,
             output_dir=output_dir,
             workflow=args.workflow,
+            nbr_workers=args.workers,
+            watch=constants.WATCH,
         )
     elif args.analyze_od:
         od_analyzer.analyze_od(
             input_dir=input_dir,
             output_dir=output_dir,
             load_report=args.load_report,
+            nbr_workers=args.workers,
         )
+    if profiler is not None:
+        profiler.disable()
+        profile_path = os.path.join(constants.RUN_PATH, constants.PROFILE_NAME)
+        profiler.dump_stats(profile_path)
+        logger.info("Profile stats written to {}".format(profile_path))
 
 
 if __name__ == '__main__':
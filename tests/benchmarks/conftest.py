@@ -0,0 +1,83 @@
+import collections
+import cv2 as cv
+import datetime
+import json
+import numpy as np
+import platform
+import pytest
+import subprocess
+import time
+
+
+def get_commit():
+    """
+    :return str commit: Hash of checked out git commit, None if unknown
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode().strip()
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request):
+    """
+    Collects benchmark results of the session and writes them to json,
+    together with the commit and versions they were measured with, so
+    results can be compared across commits.
+
+    :return dict results: Benchmark names and their timing
+    """
+    results = collections.OrderedDict()
+    yield results
+    if len(results) == 0:
+        return
+    json_path = request.config.getoption('--benchmark_json')
+    benchmark_run = {
+        'commit': get_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv.__version__,
+        'machine': platform.machine(),
+        'benchmarks': results,
+    }
+    with open(json_path, 'w') as json_file:
+        json.dump(benchmark_run, json_file, indent=2)
+
+
+@pytest.fixture
+def run_benchmark(request, benchmark_results):
+    """
+    Returns function timing repeated calls of a function and storing the
+    times under the name of the test.
+    """
+    def run_benchmark(fn, nbr_repeats=5, nbr_items=1, warmup=True):
+        """
+        :param function fn: Function without arguments to time
+        :param int nbr_repeats: Number of timed calls
+        :param int nbr_items: Number of items (e.g. wells) processed per call
+        :param bool warmup: Make an untimed call first
+        :return result: Return value of the last call
+        """
+        if warmup:
+            fn()
+        times = []
+        for _ in range(nbr_repeats):
+            start_time = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start_time)
+        benchmark_results[request.node.name] = {
+            'nbr_repeats': nbr_repeats,
+            'min': float(np.min(times)),
+            'median': float(np.median(times)),
+            'mean': float(np.mean(times)),
+            'max': float(np.max(times)),
+            'items_per_s': nbr_items / float(np.median(times)),
+        }
+        return result
+    return run_benchmark
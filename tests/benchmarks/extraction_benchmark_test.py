@@ -0,0 +1,216 @@
+import copy
+import cv2 as cv
+import numpy as np
+import os
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.extract.image_parser as image_parser
+import array_analyzer.extract.img_processing as img_processing
+import array_analyzer.extract.metadata as metadata
+import array_analyzer.transform.array_generation as array_gen
+import array_analyzer.transform.point_registration as registration
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.workflows.registration_workflow as registration_wf
+
+pytestmark = pytest.mark.benchmark
+
+# Number of well images in synthetic_plate_dir
+NBR_WELLS = 8
+
+
+def set_constants(input_dir, output_dir):
+    """
+    Populate constants from the synthetic plate metadata, as in a run.
+
+    :param str input_dir: Directory with synthetic plate
+    :param str output_dir: Run directory
+    """
+    constants.METADATA_FILE = 'pysero_output_data_metadata.xlsx'
+    constants.RUN_PATH = str(output_dir)
+    constants.DEBUG = False
+    constants.RERUN = False
+    constants.RANDOM_SEED = 42
+    constants.WELL_STATS_XLSX = False
+    constants.REPORT_FORMATS = ['csv']
+    metadata.MetaData(str(input_dir), str(output_dir))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def restore_constants():
+    """
+    Restore constants set from synthetic metadata after the benchmarks,
+    so they don't leak into tests run in the same session.
+    """
+    constants_state = copy.deepcopy(parallel_utils.get_constants_state())
+    yield
+    for name, value in constants_state.items():
+        setattr(constants, name, value)
+
+
+@pytest.fixture(scope="module")
+def registered_well(synthetic_plate_dir, synthetic_well, tmpdir_factory):
+    """
+    Run the array_fit steps on the synthetic well once, so each hot path
+    can be benchmarked on the inputs it gets in a run.
+
+    :return dict well_data: Inputs and outputs of array_fit steps
+    """
+    set_constants(synthetic_plate_dir, tmpdir_factory.mktemp("benchmark_run"))
+    im, _ = synthetic_well
+    well_center, well_radi, _ = image_parser.find_well_border(
+        im,
+        detmethod='region',
+        segmethod='otsu',
+    )
+    im_well, _ = img_processing.crop_image_at_center(
+        im=im,
+        center=well_center,
+        height=2 * well_radi,
+        width=2 * well_radi,
+    )
+    spot_detector = img_processing.SpotDetector(imaging_params=constants.params)
+    spot_coords = spot_detector.get_spot_coords(im=im_well, max_intensity=255)
+    register_inst = registration.ParticleFilter(
+        spot_coords=spot_coords,
+        im_shape=im_well.shape,
+        fiducials_idx=constants.FIDUCIALS_IDX,
+        random_seed=constants.RANDOM_SEED,
+    )
+    register_inst.particle_filter()
+    registered_coords = register_inst.compute_registered_coords()
+    im_crop, crop_coords = img_processing.crop_image_from_coords(
+        im=im_well,
+        coords=registered_coords,
+    )
+    im_crop = im_crop / 255
+    background = registration_wf.get_bg_estimator().get_background(im_crop)
+    return {
+        'im': im,
+        'im_well': im_well,
+        'spot_coords': spot_coords,
+        'im_crop': im_crop,
+        'crop_coords': crop_coords,
+        'background': background,
+    }
+
+
+def test_find_well_border(registered_well, run_benchmark):
+    well_center, well_radi, _ = run_benchmark(
+        lambda: image_parser.find_well_border(
+            registered_well['im'],
+            detmethod='region',
+            segmethod='otsu',
+        ),
+    )
+    assert well_radi > 0
+
+
+def test_find_well_border_fast(registered_well, run_benchmark):
+    well_center, well_radi, _ = run_benchmark(
+        lambda: image_parser.find_well_border_fast(
+            registered_well['im'],
+            downsample=8,
+        ),
+    )
+    assert well_radi > 0
+
+
+def test_get_spot_coords(registered_well, run_benchmark):
+    spot_detector = img_processing.SpotDetector(imaging_params=constants.params)
+    spot_coords = run_benchmark(
+        lambda: spot_detector.get_spot_coords(
+            im=registered_well['im_well'],
+            max_intensity=255,
+        ),
+    )
+    assert spot_coords.shape[0] >= constants.MIN_NBR_SPOTS
+
+
+@pytest.mark.parametrize('sigma', [1, 2, 3, 4, 5])
+def test_filter_log(sigma, run_benchmark):
+    # Spot widths giving LoG filters of size 6 * sigma + 1
+    spot_detector = img_processing.SpotDetector(imaging_params={
+        'spot_width': 4 * sigma * .0049,
+        'pixel_size': .0049,
+        'rows': 6,
+        'columns': 6,
+    })
+    assert spot_detector.sigma_gauss == sigma
+    im = np.random.RandomState(0).rand(2048, 2048).astype(np.float32)
+    im_copy = np.empty_like(im)
+    dst = np.empty_like(im)
+
+    def filter_log():
+        np.copyto(im_copy, im)
+        return spot_detector.filter_log(im_copy, dst=dst)
+
+    run_benchmark(filter_log)
+
+
+@pytest.mark.parametrize('sigma', [1, 2, 3, 4, 5])
+def test_filter_log_2d(sigma, run_benchmark):
+    spot_detector = img_processing.SpotDetector(imaging_params={
+        'spot_width': 4 * sigma * .0049,
+        'pixel_size': .0049,
+        'rows': 6,
+        'columns': 6,
+    })
+    im = np.random.RandomState(0).rand(2048, 2048).astype(np.float32)
+    im_copy = np.empty_like(im)
+    dst = np.empty_like(im)
+
+    def filter_log_2d():
+        np.copyto(im_copy, im)
+        return cv.filter2D(im_copy, -1, spot_detector.log_filter_float32, dst=dst)
+
+    run_benchmark(filter_log_2d)
+
+
+def test_particle_filter(registered_well, run_benchmark):
+    def register():
+        register_inst = registration.ParticleFilter(
+            spot_coords=registered_well['spot_coords'],
+            im_shape=registered_well['im_well'].shape,
+            fiducials_idx=constants.FIDUCIALS_IDX,
+            random_seed=constants.RANDOM_SEED,
+        )
+        register_inst.particle_filter()
+        return register_inst
+    register_inst = run_benchmark(register)
+    assert register_inst.registration_ok
+
+
+def test_get_background(registered_well, run_benchmark):
+    bg_estimator = registration_wf.get_bg_estimator()
+    background = run_benchmark(
+        lambda: bg_estimator.get_background(registered_well['im_crop']),
+    )
+    assert background.shape == registered_well['im_crop'].shape
+
+
+def test_get_spot_intensity(registered_well, run_benchmark):
+    spots_df, _ = run_benchmark(
+        lambda: array_gen.get_spot_intensity(
+            coords=registered_well['crop_coords'],
+            im=registered_well['im_crop'],
+            background=registered_well['background'],
+        ),
+    )
+    assert spots_df.shape[0] == constants.params['rows'] * constants.params['columns']
+
+
+def test_point_registration_throughput(synthetic_plate_dir, tmpdir_factory, run_benchmark):
+    output_dir = tmpdir_factory.mktemp("benchmark_workflow")
+    set_constants(synthetic_plate_dir, output_dir)
+    run_benchmark(
+        lambda: registration_wf.point_registration(
+            str(synthetic_plate_dir),
+            str(output_dir),
+        ),
+        nbr_repeats=1,
+        nbr_items=NBR_WELLS,
+        warmup=False,
+    )
+    assert os.path.isfile(os.path.join(output_dir, 'plate_report.csv'))
+    assert os.path.isfile(os.path.join(output_dir, constants.STAGE_TIMES_NAME))
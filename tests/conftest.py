@@ -174,3 +174,140 @@ def micromanager_dir(tmpdir_factory):
         sub_dir.mkdir()
         cv.imwrite(os.path.join(sub_dir, 'micromanager_name.tif'), im)
     return input_dir
+
+
+# Imaging and array parameters of synthetic wells, matching create_good_xlsx
+SYNTHETIC_PARAMS = {'rows': 6,
+                    'columns': 6,
+                    'v_pitch': 0.4,
+                    'h_pitch': 0.4,
+                    'spot_width': 0.2,
+                    'pixel_size': 0.0049}
+# Fiducial positions in synthetic spot grids
+SYNTHETIC_FIDUCIALS = [(0, 0), (0, 5), (1, 0), (5, 0), (5, 5)]
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--benchmark',
+        action='store_true',
+        default=False,
+        help="Run benchmarks of extraction hot paths",
+    )
+    parser.addoption(
+        '--benchmark_json',
+        type=str,
+        default='benchmark_results.json',
+        help="Path to json file benchmark results are written to",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'benchmark: benchmark, only run with --benchmark',
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip_benchmark = pytest.mark.skip(reason="Benchmarks require --benchmark")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+def make_well_image(im_size=1400,
+                    well_radius=600,
+                    grid_offset=(15, -10),
+                    noise_std=3.,
+                    gradient=.1,
+                    random_seed=0):
+    """
+    Create a synthetic 8 bit well image with a bright circular well on a
+    dark background, a grid of spots given by SYNTHETIC_PARAMS, a horizontal
+    illumination gradient and Gaussian noise. Spot intensities vary over
+    the grid and the well center is randomly shifted.
+
+    :param int im_size: Image height and width in pixels
+    :param int well_radius: Well radius in pixels
+    :param tuple grid_offset: Offset (row, col) of the spot grid center from
+        the well center in pixels
+    :param float noise_std: Standard deviation of noise
+    :param float gradient: Relative increase in intensity from left to right
+    :param int random_seed: Seed for well position and noise
+    :return np.array im: Synthetic uint8 image
+    :return np.array spot_coords: Spot centers (row, col) in grid order
+    """
+    random_state = np.random.RandomState(random_seed)
+    spot_dist = SYNTHETIC_PARAMS['v_pitch'] / SYNTHETIC_PARAMS['pixel_size']
+    spot_radius = int(SYNTHETIC_PARAMS['spot_width'] / SYNTHETIC_PARAMS['pixel_size'] / 2)
+    nbr_rows = SYNTHETIC_PARAMS['rows']
+    nbr_cols = SYNTHETIC_PARAMS['columns']
+    im = np.full((im_size, im_size), 20, np.float64)
+    center_row, center_col = im_size / 2 + random_state.randn(2) * 10
+    rows, cols = np.ogrid[:im_size, :im_size]
+    im[(rows - center_row) ** 2 + (cols - center_col) ** 2 < well_radius ** 2] = 200
+    im *= 1 + gradient * cols / im_size
+    spot_coords = np.zeros((nbr_rows * nbr_cols, 2), np.float32)
+    for grid_row in range(nbr_rows):
+        for grid_col in range(nbr_cols):
+            spot_row = center_row + (grid_row - (nbr_rows - 1) / 2) * spot_dist + grid_offset[0]
+            spot_col = center_col + (grid_col - (nbr_cols - 1) / 2) * spot_dist + grid_offset[1]
+            spot_coords[grid_row * nbr_cols + grid_col] = [spot_row, spot_col]
+            cv.circle(
+                im,
+                (int(spot_col), int(spot_row)),
+                spot_radius,
+                80 + 10 * ((grid_row + grid_col) % 5),
+                -1,
+            )
+    im += random_state.randn(im_size, im_size) * noise_std
+    im = np.clip(im, 0, 255).astype(np.uint8)
+    return im, spot_coords
+
+
+@pytest.fixture(scope="session")
+def synthetic_well():
+    """
+    Creates a synthetic well image with a spot grid, noise and an
+    illumination gradient.
+
+    :return np.array im: Synthetic uint8 image
+    :return np.array spot_coords: Spot centers (row, col) in grid order
+    """
+    return make_well_image()
+
+
+@pytest.fixture(scope="session")
+def synthetic_plate_dir(tmpdir_factory):
+    """
+    Creates a directory with xlsx metadata and synthetic images of eight
+    wells, A1 to A8, for running extraction workflows.
+
+    :param tmpdir_factory: PyTest factory for temporary directories
+    :return input_dir: Temporary directory with metadata and well images
+    """
+    input_dir = tmpdir_factory.mktemp("synthetic_plate")
+    params_df = pd.DataFrame({
+        'Parameter': list(SYNTHETIC_PARAMS),
+        'Value': [str(value) for value in SYNTHETIC_PARAMS.values()],
+    })
+    nbr_rows = SYNTHETIC_PARAMS['rows']
+    nbr_cols = SYNTHETIC_PARAMS['columns']
+    fiducials_df = pd.DataFrame(np.full((nbr_rows, nbr_cols), '', dtype=object))
+    antigens_df = pd.DataFrame(np.full((nbr_rows, nbr_cols), '', dtype=object))
+    for grid_row in range(nbr_rows):
+        for grid_col in range(nbr_cols):
+            antigens_df.iat[grid_row, grid_col] = 'antigen_{}_{}'.format(grid_row, grid_col)
+    for grid_row, grid_col in SYNTHETIC_FIDUCIALS:
+        fiducials_df.iat[grid_row, grid_col] = 'Fiducial'
+    with pd.ExcelWriter(os.path.join(input_dir, 'pysero_output_data_metadata.xlsx')) as writer:
+        params_df.to_excel(writer, sheet_name='imaging_and_array_parameters', index=False)
+        fiducials_df.to_excel(writer, sheet_name='antigen_type')
+        antigens_df.to_excel(writer, sheet_name='antigen_array')
+    for well_idx in range(8):
+        im, _ = make_well_image(random_seed=well_idx)
+        cv.imwrite(os.path.join(input_dir, 'A{}.png'.format(well_idx + 1)), im)
+    return input_dir
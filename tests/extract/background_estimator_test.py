@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+import array_analyzer.extract.background_estimator as background_estimator
+
+
+@pytest.fixture
+def bg_estimator():
+    return background_estimator.BackgroundEstimator2D(
+        block_size=16,
+        order=2,
+        normalize=False,
+    )
+
+
+def test_sample_block_medians(bg_estimator):
+    np.random.seed(42)
+    # Incomplete blocks at the bottom and right edges are ignored
+    im = np.random.rand(70, 100)
+    sample_coords, sample_values = bg_estimator.sample_block_medians(im)
+    assert sample_coords.shape == (24, 2)
+    assert sample_values.shape == (24,)
+    idx = 0
+    for y in range(6):
+        for x in range(4):
+            np.testing.assert_array_equal(
+                sample_coords[idx],
+                [x * 16 + 7.5, y * 16 + 7.5],
+            )
+            assert sample_values[idx] == np.median(
+                im[x * 16:(x + 1) * 16, y * 16:(y + 1) * 16],
+            )
+            idx += 1
+
+
+def test_sample_block_medians_large_block(bg_estimator):
+    with pytest.raises(AssertionError):
+        bg_estimator.sample_block_medians(np.zeros((16, 100)))
+
+
+def test_get_background(bg_estimator):
+    # A second order polynomial surface is recovered from block medians
+    rows, cols = np.meshgrid(
+        np.arange(64),
+        np.arange(96),
+        indexing='ij',
+    )
+    im = 1 + .001 * rows + .002 * cols - 1e-5 * rows * cols
+    background = bg_estimator.get_background(im)
+    assert background.shape == im.shape
+    np.testing.assert_allclose(background, im, atol=1e-3)
+
+
+def test_get_monomial_bases():
+    row_basis, col_basis = background_estimator.get_monomial_bases(
+        (3, 4),
+        2,
+    )
+    np.testing.assert_array_equal(
+        row_basis,
+        [[1, 0, 0], [1, 1, 1], [1, 2, 4]],
+    )
+    assert col_basis.shape == (4, 3)
+    np.testing.assert_array_equal(col_basis[:, 2], [0, 1, 4, 9])
+    assert not row_basis.flags.writeable
+    # Bases are cached per shape and order
+    row_basis2, _ = background_estimator.get_monomial_bases((3, 4), 2)
+    assert row_basis2 is row_basis
+
+
+def test_fit_polynomial_surface_2d(bg_estimator):
+    sample_coords = np.array(
+        [[0, 0], [0, 10], [10, 0], [10, 10], [5, 5], [2, 8], [8, 1]],
+    ).astype(np.float64)
+    sample_values = 2 + .5 * sample_coords[:, 0] - .1 * sample_coords[:, 1] ** 2
+    poly_surface = bg_estimator.fit_polynomial_surface_2d(
+        sample_coords,
+        sample_values,
+        (12, 15),
+    )
+    assert poly_surface.shape == (12, 15)
+    assert poly_surface.dtype == np.float64
+    rows, cols = np.meshgrid(np.arange(12), np.arange(15), indexing='ij')
+    np.testing.assert_allclose(
+        poly_surface,
+        2 + .5 * rows - .1 * cols ** 2,
+        atol=1e-8,
+    )
+
+
+def test_get_background_float32():
+    bg_estimator = background_estimator.BackgroundEstimator2D(
+        block_size=16,
+        order=2,
+        normalize=True,
+        dtype=np.float32,
+    )
+    rows, cols = np.meshgrid(np.arange(64), np.arange(96), indexing='ij')
+    im = 1 + .001 * rows + .002 * cols
+    background = bg_estimator.get_background(im)
+    assert background.dtype == np.float32
+    np.testing.assert_allclose(background, im / np.mean(im), atol=1e-3)
+
+
+def test_fit_plate_background(bg_estimator):
+    rows, cols = np.meshgrid(np.arange(64), np.arange(96), indexing='ij')
+    illumination = 1 + .001 * rows + .002 * cols
+    well_sample_values = []
+    for well_idx in range(3):
+        im = illumination.copy()
+        # Debris in one block per image is removed by median across images
+        im[well_idx * 16:(well_idx + 1) * 16, :16] = 5
+        sample_coords, sample_values = bg_estimator.sample_block_medians(im)
+        well_sample_values.append(sample_values)
+    plate_background = bg_estimator.fit_plate_background(
+        sample_coords=sample_coords,
+        well_sample_values=well_sample_values,
+        im_shape=illumination.shape,
+    )
+    np.testing.assert_allclose(plate_background, illumination, atol=1e-3)
+
+
+def test_get_background_from_model(bg_estimator):
+    rows, cols = np.meshgrid(np.arange(64), np.arange(96), indexing='ij')
+    background_model = 1 + .001 * rows + .002 * cols
+    im = .5 * background_model + .1
+    background = bg_estimator.get_background_from_model(im, background_model)
+    np.testing.assert_allclose(background, im, atol=1e-8)
+
+
+def test_get_background_from_model_shape(bg_estimator):
+    with pytest.raises(AssertionError):
+        bg_estimator.get_background_from_model(
+            np.zeros((64, 96)),
+            np.zeros((64, 64)),
+        )
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import array_analyzer.extract.image_parser as image_parser
+
+
+@pytest.fixture(scope="module")
+def well_circle(synthetic_well):
+    """
+    True well center and radius of the synthetic well image.
+    The spot grid is offset by (15, -10) pixels from the well center.
+    """
+    im, spot_coords = synthetic_well
+    center = np.mean(spot_coords, axis=0) - [15, -10]
+    return im, center, 600
+
+
+def test_fit_circle():
+    angles = np.linspace(0, 2 * np.pi, 100, endpoint=False)
+    coords = np.stack([
+        50 + 20 * np.sin(angles),
+        30 + 20 * np.cos(angles),
+    ], axis=1)
+    # Add outliers
+    coords[:5] += 10
+    cy, cx, radius = image_parser.fit_circle(coords)
+    assert cy == pytest.approx(50, abs=1e-6)
+    assert cx == pytest.approx(30, abs=1e-6)
+    assert radius == pytest.approx(20, abs=1e-6)
+
+
+@pytest.mark.parametrize('downsample', [1, 4, 8])
+def test_find_well_border_fast(well_circle, downsample):
+    im, center, radius = well_circle
+    well_center, well_radi, well_mask = image_parser.find_well_border_fast(
+        im,
+        downsample=downsample,
+    )
+    assert np.linalg.norm(np.subtract(well_center, center)) < 1
+    assert well_radi == int(radius / np.sqrt(2))
+    assert well_mask.shape == im.shape
+    assert well_mask.dtype == bool
+    assert well_mask.sum() == pytest.approx(np.pi * radius ** 2, rel=.01)
+
+
+def test_find_well_border_fast_prior(well_circle):
+    im, center, radius = well_circle
+    well_prior = (center + [10, -5], int(radius / np.sqrt(2)) + 5)
+    well_center, well_radi, _ = image_parser.find_well_border_fast(
+        im,
+        well_prior=well_prior,
+    )
+    assert np.linalg.norm(np.subtract(well_center, center)) < 1
+    assert well_radi == int(radius / np.sqrt(2))
+
+
+def test_find_well_border_fast_bad_prior(well_circle):
+    im, center, radius = well_circle
+    # Prior far from the well falls back to segmentation
+    well_prior = ([300, 300], 200)
+    well_center, well_radi, _ = image_parser.find_well_border_fast(
+        im,
+        well_prior=well_prior,
+    )
+    assert np.linalg.norm(np.subtract(well_center, center)) < 1
+    assert well_radi == int(radius / np.sqrt(2))
+
+
+def test_find_well_border_fast_no_well():
+    im = np.random.RandomState(0).randint(0, 10, (400, 400)).astype(np.uint8)
+    with pytest.raises(IndexError):
+        image_parser.find_well_border_fast(im)
@@ -0,0 +1,178 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+import array_analyzer.extract.img_processing as img_processing
+
+
+@pytest.fixture
+def spot_detector():
+    imaging_params = {
+        'spot_width': 0.2,
+        'pixel_size': 0.0049,
+        'rows': 6,
+        'columns': 6,
+    }
+    return img_processing.SpotDetector(imaging_params=imaging_params)
+
+
+def test_separable_log_kernels(spot_detector):
+    log_filter = np.zeros_like(spot_detector.log_filter)
+    for row_kernel, col_kernel in spot_detector.log_kernels:
+        log_filter += np.outer(row_kernel, col_kernel)
+    np.testing.assert_allclose(log_filter, spot_detector.log_filter, atol=1e-6)
+
+
+def test_filter_log_separable():
+    imaging_params = {
+        'spot_width': 0.05,
+        'pixel_size': 0.0049,
+        'rows': 6,
+        'columns': 6,
+    }
+    spot_detector = img_processing.SpotDetector(imaging_params=imaging_params)
+    min_size, max_size = img_processing.SEPARABLE_LOG_SIZES
+    assert min_size <= spot_detector.log_filter.shape[0] <= max_size
+    im = np.random.RandomState(0).rand(50, 60).astype(np.float32)
+    expected = cv.filter2D(im.astype(np.float64), -1, spot_detector.log_filter)
+    im_filtered = spot_detector.filter_log(im.copy(), dst=np.empty_like(im))
+    np.testing.assert_allclose(im_filtered, expected, atol=1e-5)
+
+
+def test_get_spot_coords(spot_detector, synthetic_well):
+    im, spot_coords = synthetic_well
+    detected_coords = spot_detector.get_spot_coords(im)
+    assert detected_coords.shape == (36, 2)
+    # Each spot is detected close to its center
+    dists = np.linalg.norm(
+        spot_coords[:, np.newaxis, :] - detected_coords[np.newaxis, :, :],
+        axis=2,
+    )
+    assert np.all(dists.min(axis=1) < 2)
+    # Scratch buffers are reused for images of the same shape
+    scratch_float = spot_detector.scratch_float
+    spot_detector.get_spot_coords(im)
+    assert spot_detector.scratch_float is scratch_float
+
+
+def test_get_spot_coords_margin(spot_detector, synthetic_well):
+    im, spot_coords = synthetic_well
+    # Crop so the first grid column is close to the left border
+    col_start = int(spot_coords[:, 1].min()) - 50
+    im_crop = im[:, col_start:]
+    detected_coords = spot_detector.get_spot_coords(im_crop, margin=60)
+    assert detected_coords.shape == (30, 2)
+    assert np.all(detected_coords[:, 1] > 60)
+    assert np.all(detected_coords[:, 0] < im_crop.shape[0] - 60)
+
+
+def test_get_spot_coords_downsample(synthetic_well):
+    im, spot_coords = synthetic_well
+    imaging_params = {
+        'spot_width': 0.2,
+        'pixel_size': 0.0049,
+        'rows': 6,
+        'columns': 6,
+    }
+    spot_detector = img_processing.SpotDetector(
+        imaging_params=imaging_params,
+        downsample=4,
+    )
+    assert spot_detector.sigma_gauss == 3
+    detected_coords = spot_detector.get_spot_coords(im)
+    assert detected_coords.shape == (36, 2)
+    # Coordinates are in full resolution
+    dists = np.linalg.norm(
+        spot_coords[:, np.newaxis, :] - detected_coords[np.newaxis, :, :],
+        axis=2,
+    )
+    assert np.all(dists.min(axis=1) < 4)
+
+
+def test_refine_spot_coords(spot_detector, synthetic_well):
+    im, spot_coords = synthetic_well
+    # Spots must be detected before they're refined
+    with pytest.raises(AssertionError):
+        spot_detector.refine_spot_coords(im, spot_coords)
+    spot_detector.get_spot_coords(im)
+    # Shift approximate coordinates by a few pixels
+    coarse_coords = spot_coords + np.random.RandomState(0).uniform(-4, 4, spot_coords.shape)
+    # Coordinates with windows outside the image are dropped
+    coarse_coords = np.vstack([coarse_coords, [[5, 5]]])
+    # Grid positions next to the spots without a spot are dropped
+    spot_dist = spot_coords[1, 1] - spot_coords[0, 1]
+    empty_coords = [spot_coords[0] - [spot_dist, 0], spot_coords[0] - [0, spot_dist]]
+    coarse_coords = np.vstack([coarse_coords, empty_coords])
+    refined_coords = spot_detector.refine_spot_coords(im, coarse_coords)
+    assert refined_coords.shape == (36, 2)
+    assert np.all(np.linalg.norm(refined_coords - spot_coords, axis=1) < 2)
+
+
+def test_get_disk_kernel():
+    kernel = img_processing.get_disk_kernel(3)
+    assert kernel.dtype == np.uint8
+    assert kernel.shape == (7, 7)
+    assert not kernel.flags.writeable
+    assert img_processing.get_disk_kernel(3) is kernel
+
+
+@pytest.mark.parametrize('get_lcc', [True, False])
+def test_spot_segmenter(get_lcc):
+    random_state = np.random.RandomState(0)
+    spot_segmenter = img_processing.SpotSegmenter(
+        disk_size=3,
+        thr_percent=75,
+        get_lcc=get_lcc,
+    )
+    for idx in range(20):
+        roi = .6 + .3 * random_state.rand(40, 50).astype(np.float32)
+        center = tuple(random_state.randint(5, 45, 2).tolist())
+        radius = random_state.randint(6, 15)
+        cv.circle(roi, center, radius, .2, -1)
+        if idx % 2 == 0:
+            # Ring shaped spot with bright center
+            cv.circle(roi, center, radius - 3, .9, -1)
+        # Small dark spot
+        cv.circle(roi, (3, 3), 5, .1, -1)
+        spots = spot_segmenter.segment(roi)
+        expected_spots = img_processing.thresh_and_binarize(
+            roi,
+            method='bright_spots',
+            disk_size=3,
+            thr_percent=75,
+            get_lcc=get_lcc,
+        )
+        assert spots.dtype == bool
+        np.testing.assert_array_equal(spots, expected_spots > 0)
+    # Buffers are allocated once for ROI shape
+    assert list(spot_segmenter.buffers) == [(40, 50)]
+
+
+def test_spot_segmenter_batch():
+    np.random.seed(1)
+    rows, cols = np.meshgrid(np.arange(30), np.arange(30), indexing='ij')
+    rois = np.empty((20, 30, 30))
+    for idx in range(20):
+        center = np.random.uniform(5, 25, 2)
+        rois[idx] = 1 - .5 * np.exp(
+            -((rows - center[0]) ** 2 + (cols - center[1]) ** 2) / 30,
+        )
+        rois[idx] += .2 * np.random.rand(30, 30)
+    # Noise only ROIs have several components
+    rois[::5] = np.random.rand(4, 30, 30)
+    rois /= rois.max()
+    spots = img_processing.SpotSegmenter(
+        disk_size=3,
+        thr_percent=75,
+        get_lcc=True,
+    ).segment_batch(rois)
+    assert spots.shape == rois.shape
+    for idx in range(20):
+        expected_spots = img_processing.thresh_and_binarize(
+            rois[idx],
+            method='bright_spots',
+            disk_size=3,
+            thr_percent=75,
+            get_lcc=True,
+        )
+        np.testing.assert_array_equal(spots[idx], expected_spots > 0)
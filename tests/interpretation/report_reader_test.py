@@ -0,0 +1,222 @@
+import numpy as np
+import os
+import pickle
+import pandas as pd
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.load.report as report
+import interpretation.report_reader as report_reader
+
+
+def make_master_df():
+    return pd.DataFrame({
+        'antigen': ['SARS CoV2 N', 'SARS CoV2 N', 'xIgG Fc', 'xIgG Fc'],
+        'antigen type': ['Diagnostic', 'Diagnostic', 'Positive', 'Positive'],
+        'well_id': ['A1', 'A2', 'A1', 'A2'],
+        'serum ID': [1234, 'pos-1', 1234, 'pos-1'],
+        'pipeline': 'nautilus',
+        'serum dilution': [5e-5, 1e-4, 5e-5, 1e-4],
+        'OD': [.1, .5, 1.2, np.nan],
+    })
+
+
+def test_to_categorical():
+    df = report_reader.to_categorical(make_master_df())
+    for col in ['antigen', 'antigen type', 'well_id', 'serum ID', 'pipeline']:
+        assert isinstance(df[col].dtype, pd.CategoricalDtype)
+    # Mixed types are converted to strings
+    assert list(df['serum ID'].cat.categories) == ['1234', 'pos-1']
+    assert df['OD'].dtype == np.float64
+
+
+def test_to_categorical_unpickled():
+    # Dataframes returned by worker processes are unpickled
+    df = pickle.loads(pickle.dumps(make_master_df(), protocol=5))
+    df.loc[1, 'antigen type'] = np.nan
+    df = report_reader.to_categorical(df)
+    assert df['antigen type'].isna().sum() == 1
+    assert list(df['antigen type'].cat.categories) == ['Diagnostic', 'Positive']
+
+
+def test_filter_df():
+    df = make_master_df()
+    df_filt = report_reader.filter_df(
+        df,
+        [('antigen', '==', 'xIgG Fc'), ('well_id', 'in', ['A1', 'B1'])],
+    )
+    assert df_filt.shape[0] == 1
+    assert df_filt.loc[0, 'OD'] == 1.2
+    df_filt = report_reader.filter_df(df, [('serum dilution', '>', 6e-5)])
+    assert list(df_filt['well_id']) == ['A2', 'A2']
+    df_filt = report_reader.filter_df(df, [('well_id', 'not in', ['A1'])])
+    assert list(df_filt['well_id']) == ['A2', 'A2']
+
+
+def test_filter_df_bad_op():
+    with pytest.raises(ValueError):
+        report_reader.filter_df(make_master_df(), [('OD', '~', 1)])
+
+
+def test_write_read_master_report(tmpdir_factory):
+    output_dir = str(tmpdir_factory.mktemp("output_dir"))
+    df = make_master_df()
+    report_path = report_reader.write_master_report(df, output_dir, 'csv')
+    assert report_path == os.path.join(output_dir, 'master_report.csv')
+    df_read = report_reader.read_master_report(output_dir)
+    pd.testing.assert_frame_equal(df_read, report_reader.to_categorical(df))
+    # Load a subset of columns and rows
+    df_read = report_reader.read_master_report(
+        output_dir,
+        columns=['well_id', 'OD'],
+        filters=[('antigen', '==', 'SARS CoV2 N')],
+    )
+    assert list(df_read.columns) == ['well_id', 'OD']
+    assert list(df_read['OD']) == [.1, .5]
+    assert list(df_read['well_id'].cat.categories) == ['A1', 'A2']
+
+
+def test_read_master_report_old_csv(tmpdir_factory):
+    output_dir = str(tmpdir_factory.mktemp("output_dir"))
+    df = make_master_df()
+    # Earlier versions saved the index
+    df.to_csv(os.path.join(output_dir, 'master_report.csv'))
+    df_read = report_reader.read_master_report(output_dir)
+    assert list(df_read.columns) == list(df.columns)
+    assert isinstance(df_read['antigen'].dtype, pd.CategoricalDtype)
+
+
+def test_write_master_report_removes_stale(tmpdir_factory):
+    output_dir = str(tmpdir_factory.mktemp("output_dir"))
+    stale_path = os.path.join(output_dir, 'master_report.feather')
+    open(stale_path, 'w').close()
+    report_reader.write_master_report(make_master_df(), output_dir, 'csv')
+    assert not os.path.isfile(stale_path)
+
+
+def test_read_master_report_missing(tmpdir_factory):
+    output_dir = str(tmpdir_factory.mktemp("output_dir"))
+    with pytest.raises(IOError):
+        report_reader.read_master_report(output_dir)
+
+
+def test_slice_df_removes_categories():
+    df = report_reader.to_categorical(make_master_df())
+    df_slice = report_reader.slice_df(df, 'keep', 'antigen', ['xIgG Fc'])
+    assert list(df_slice['antigen'].cat.categories) == ['xIgG Fc']
+    assert list(df_slice['antigen type'].cat.categories) == ['Positive']
+
+
+def test_get_plate_key(tmpdir_factory):
+    plate_dir = tmpdir_factory.mktemp("plate_dir")
+    od_path = str(plate_dir.join('median_ODs.xlsx'))
+    with open(od_path, 'w') as f:
+        f.write('od')
+    plate_config = {'plate ID': 'plate_1', 'well ID': np.nan}
+    plate_key = report_reader.get_plate_key([od_path], plate_config)
+    assert plate_key == report_reader.get_plate_key([od_path], plate_config)
+    # Key changes with config
+    assert plate_key != report_reader.get_plate_key(
+        [od_path],
+        {'plate ID': 'plate_2', 'well ID': np.nan},
+    )
+    # Key changes when file is modified
+    with open(od_path, 'a') as f:
+        f.write('more od')
+    assert plate_key != report_reader.get_plate_key([od_path], plate_config)
+
+
+def read_plate(plate_id, nbr_reads):
+    nbr_reads.append(plate_id)
+    df = make_master_df()
+    df['plate ID'] = plate_id
+    return df
+
+
+def test_read_plates_cached(tmpdir_factory):
+    cache_dir = str(tmpdir_factory.mktemp("output_dir").join('plate_cache'))
+    nbr_reads = []
+    plate_dfs = report_reader.read_plates_cached(
+        read_fn=read_plate,
+        plate_args=[('plate_1', nbr_reads), ('plate_2', nbr_reads)],
+        plate_keys=['abc', 'def'],
+        cache_dir=cache_dir,
+    )
+    assert nbr_reads == ['plate_1', 'plate_2']
+    assert isinstance(plate_dfs[0]['well_id'].dtype, pd.CategoricalDtype)
+    assert list(plate_dfs[1]['plate ID'].unique()) == ['plate_2']
+    # Only the new plate is read, in plate order
+    cached_dfs = report_reader.read_plates_cached(
+        read_fn=read_plate,
+        plate_args=[('plate_3', nbr_reads), ('plate_1', nbr_reads)],
+        plate_keys=['ghi', 'abc'],
+        cache_dir=cache_dir,
+    )
+    assert nbr_reads == ['plate_1', 'plate_2', 'plate_3']
+    assert list(cached_dfs[0]['plate ID'].unique()) == ['plate_3']
+    pd.testing.assert_frame_equal(cached_dfs[1], plate_dfs[0])
+    # No cache dir reads every time
+    report_reader.read_plates_cached(
+        read_fn=read_plate,
+        plate_args=[('plate_1', nbr_reads)],
+        plate_keys=['abc'],
+    )
+    assert nbr_reads[-1] == 'plate_1'
+
+
+def test_prune_plate_cache(tmpdir_factory):
+    cache_dir = str(tmpdir_factory.mktemp("plate_cache"))
+    report_reader.read_plates_cached(
+        read_fn=read_plate,
+        plate_args=[('plate_1', []), ('plate_2', [])],
+        plate_keys=['abc', 'def'],
+        cache_dir=cache_dir,
+    )
+    report_reader.prune_plate_cache(cache_dir, ['def'])
+    cache_files = os.listdir(cache_dir)
+    assert len(cache_files) == 1
+    assert cache_files[0].startswith('def.')
+
+
+def test_read_pysero_long_report(tmpdir_factory):
+    output_dir = str(tmpdir_factory.mktemp("output_dir"))
+    constants.RUN_PATH = output_dir
+    antigen_array = np.empty(shape=(2, 3), dtype='U100')
+    antigen_array[0, 0] = 'antigen_0_0'
+    antigen_array[1, 2] = 'antigen_1_2'
+    constants.ANTIGEN_ARRAY = antigen_array
+    reporter = report.ReportWriter()
+    reporter.create_new_reports()
+    spots_df = pd.DataFrame({
+        'grid_row': [0, 1],
+        'grid_col': [0, 2],
+        'intensity_median': [1., .1],
+        'bg_median': [.5, .2],
+        'od_norm': [.75, .3],
+    })
+    reporter.assign_well_to_plate('C11', spots_df)
+    spots_df['od_norm'] = [.5, .25]
+    reporter.assign_well_to_plate('A7', spots_df)
+    reporter.write_reports(['xlsx', 'csv'])
+    antigen_df = pd.DataFrame({
+        'antigen_row': [0, 1],
+        'antigen_col': [0, 2],
+        'antigen': ['antigen_0_0', 'antigen_1_2'],
+    })
+    long_dfs = report_reader.read_pysero_long_report(
+        report.find_long_report(output_dir),
+        antigen_df,
+    )
+    xlsx_paths = [reporter.od_path, reporter.int_path, reporter.bg_path]
+    for long_df, xlsx_path, file_type in zip(long_dfs, xlsx_paths, ['od', 'int', 'bg']):
+        xlsx_df = report_reader.read_pysero_output(xlsx_path, antigen_df, file_type)
+        # Workbooks have all wells of the plate, long reports assigned wells
+        xlsx_df = xlsx_df.dropna()
+        sort_cols = ['antigen_row', 'antigen_col', 'well_id']
+        long_df = long_df.sort_values(sort_cols).reset_index(drop=True)
+        xlsx_df = xlsx_df.sort_values(sort_cols).reset_index(drop=True)
+        pd.testing.assert_frame_equal(
+            long_df,
+            xlsx_df[list(long_df)],
+            check_dtype=False,
+        )
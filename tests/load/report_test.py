@@ -311,3 +311,67 @@ def test_write_reports(tmpdir_factory):
     assert report_od['1_2_antigen_1_2'].at['D', '4'] == .3
     assert report_od['0_0_antigen_0_0'].at['A', '7'] == .75
     assert report_od['1_2_antigen_1_2'].at['A', '7'] == 10.
+
+
+def test_report_arrays(report_test):
+    reporter = report.ReportWriter()
+    reporter.create_new_reports()
+    assert reporter.od_array.shape == (2, 8, 12)
+    assert np.all(np.isnan(reporter.od_array))
+    spots_df = pd.DataFrame({
+        'grid_row': [1, 0],
+        'grid_col': [2, 0],
+        'intensity_median': [.1, 1.],
+        'bg_median': [.2, .5],
+        'od_norm': [.3, .75],
+    })
+    reporter.assign_well_to_plate('H12', spots_df)
+    np.testing.assert_array_equal(reporter.od_array[:, 7, 11], [.75, .3])
+    np.testing.assert_array_equal(reporter.int_array[:, 7, 11], [1., .1])
+    np.testing.assert_array_equal(reporter.bg_array[:, 7, 11], [.5, .2])
+    # Convert to plate dataframes and back
+    report_od = reporter.report_od
+    assert report_od['1_2_antigen_1_2'].at['H', '12'] == .3
+    np.testing.assert_array_equal(
+        reporter.report_to_array(report_od),
+        reporter.od_array,
+    )
+
+
+def test_long_report(report_test):
+    reporter = report.ReportWriter()
+    reporter.create_new_reports()
+    spots_df = pd.DataFrame({
+        'grid_row': [0, 1],
+        'grid_col': [0, 2],
+        'intensity_median': [1., .1],
+        'bg_median': [.5, .2],
+        'od_norm': [.75, .3],
+    })
+    reporter.assign_well_to_plate('C11', spots_df)
+    reporter.assign_well_to_plate('A7', spots_df)
+    report_df = reporter.get_long_report()
+    assert list(report_df) == report.LONG_REPORT_COLS
+    assert list(report_df['well_id']) == ['A7', 'C11', 'A7', 'C11']
+    assert list(report_df['antigen']) == ['antigen_0_0'] * 2 + ['antigen_1_2'] * 2
+    assert list(report_df['OD']) == [.75, .75, .3, .3]
+    # Write csv report only and load it in a rerun
+    reporter.write_reports(['csv'])
+    assert not os.path.isfile(reporter.od_path)
+    report_path = report.find_long_report(constants.RUN_PATH)
+    assert report_path == os.path.join(constants.RUN_PATH, 'plate_report.csv')
+    rerun_reporter = report.ReportWriter()
+    rerun_reporter.load_existing_reports()
+    np.testing.assert_array_equal(rerun_reporter.od_array, reporter.od_array)
+    np.testing.assert_array_equal(rerun_reporter.int_array, reporter.int_array)
+    np.testing.assert_array_equal(rerun_reporter.bg_array, reporter.bg_array)
+
+
+def test_write_reports_removes_stale_long_report(report_test):
+    reporter = report.ReportWriter()
+    reporter.create_new_reports()
+    reporter.write_reports(['csv'])
+    # Rerun in the same directory writing workbooks only
+    reporter.write_reports(['xlsx'])
+    assert os.path.isfile(reporter.od_path)
+    assert report.find_long_report(constants.RUN_PATH) is None
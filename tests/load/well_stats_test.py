@@ -0,0 +1,75 @@
+import os
+import pandas as pd
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.load.well_stats as well_stats
+
+
+@pytest.fixture
+def stats_writer(tmpdir_factory):
+    constants.RUN_PATH = str(tmpdir_factory.mktemp("run_dir"))
+    stats_writer = well_stats.WellStatsWriter(file_format='csv')
+    antigen_df = pd.DataFrame({
+        'antigen': ['0_0_antigen_0_0', '1_2_antigen_1_2'],
+        'grid_row': [0, 1],
+        'grid_col': [0, 2],
+    })
+    stats_writer.write_antigens(antigen_df)
+    return stats_writer
+
+
+def make_spots_df(value):
+    return pd.DataFrame({
+        'grid_row': [0, 0, 1],
+        'grid_col': [0, 1, 0],
+        'od_norm': [value, .5, 1. / 3],
+    })
+
+
+def test_write_well(stats_writer):
+    spots_df = make_spots_df(.25)
+    stats_writer.write_well('B12', spots_df)
+    assert os.path.isfile(
+        os.path.join(constants.RUN_PATH, 'stats_per_well', 'B12.csv'),
+    )
+    # No temporary files are left
+    assert sorted(os.listdir(stats_writer.stats_dir)) == ['B12.csv', 'antigens.csv']
+    pd.testing.assert_frame_equal(stats_writer.read_df('B12'), spots_df)
+
+
+def test_get_well_names(stats_writer):
+    for well_name in ['B12', 'A2', 'B1', 'A10']:
+        stats_writer.write_well(well_name, make_spots_df(0))
+    assert stats_writer.get_well_names() == ['A2', 'A10', 'B1', 'B12']
+
+
+def test_remove_wells(stats_writer):
+    for well_name in ['A1', 'A2']:
+        stats_writer.write_well(well_name, make_spots_df(0))
+    stats_writer.remove_wells(['A2', 'C3'])
+    assert stats_writer.get_well_names() == ['A1']
+
+
+def test_export_import_xlsx(stats_writer):
+    stats_writer.write_well('A10', make_spots_df(.1))
+    stats_writer.write_well('A2', make_spots_df(.2))
+    stats_writer.export_xlsx()
+    sheets = pd.read_excel(stats_writer.xlsx_path, sheet_name=None, index_col=0)
+    assert list(sheets.keys()) == ['antigens', 'A2', 'A10']
+    assert sheets['A10']['od_norm'][0] == .1
+    # Import from workbook into empty run
+    constants.RUN_PATH = os.path.dirname(stats_writer.stats_dir)
+    stats_writer.remove_wells(['A2', 'A10'])
+    stats_writer.import_xlsx()
+    assert stats_writer.get_well_names() == ['A2', 'A10']
+    pd.testing.assert_frame_equal(
+        stats_writer.read_df('A2'),
+        make_spots_df(.2),
+    )
+
+
+def test_invalid_format(tmpdir_factory):
+    constants.RUN_PATH = str(tmpdir_factory.mktemp("run_dir"))
+    with pytest.raises(AssertionError):
+        well_stats.WellStatsWriter(file_format='xlsx')
@@ -20,6 +20,87 @@ def test_parse_args():
         assert parsed_args.output == 'output_dir_name'
         assert parsed_args.debug is True
         assert parsed_args.workflow == 'array_fit'
+        assert parsed_args.workers == 1
+        assert parsed_args.seed is None
+        assert parsed_args.stats_format == 'csv'
+        assert parsed_args.stats_xlsx is True
+        assert parsed_args.report_formats == ['xlsx', 'csv']
+        assert parsed_args.profile is False
+        assert parsed_args.watch is False
+        assert parsed_args.expected_wells is None
+
+
+def test_parse_args_workers():
+    with patch('argparse._sys.argv',
+               ['python',
+                '-e',
+                '--input', 'input_dir_name',
+                '--output', 'output_dir_name',
+                '--workers', '4',
+                '--seed', '42']):
+        parsed_args = pysero.parse_args()
+        assert parsed_args.workers == 4
+        assert parsed_args.seed == 42
+
+
+def test_parse_args_stats():
+    with patch('argparse._sys.argv',
+               ['python',
+                '-e',
+                '--input', 'input_dir_name',
+                '--output', 'output_dir_name',
+                '--stats_format', 'parquet',
+                '--no_xlsx']):
+        parsed_args = pysero.parse_args()
+        assert parsed_args.stats_format == 'parquet'
+        assert parsed_args.stats_xlsx is False
+
+
+def test_parse_args_report_formats():
+    with patch('argparse._sys.argv',
+               ['python',
+                '-e',
+                '--input', 'input_dir_name',
+                '--output', 'output_dir_name',
+                '--report_formats', 'parquet']):
+        parsed_args = pysero.parse_args()
+        assert parsed_args.report_formats == ['parquet']
+
+
+def test_parse_args_profile():
+    with patch('argparse._sys.argv',
+               ['python',
+                '-e',
+                '--input', 'input_dir_name',
+                '--output', 'output_dir_name',
+                '--profile']):
+        parsed_args = pysero.parse_args()
+        assert parsed_args.profile is True
+
+
+def test_parse_args_watch():
+    with patch('argparse._sys.argv',
+               ['python',
+                '-e',
+                '--input', 'input_dir_name',
+                '--output', 'output_dir_name',
+                '--watch',
+                '--expected_wells', 'A1', 'A2',
+                '--watch_timeout', '30']):
+        parsed_args = pysero.parse_args()
+        assert parsed_args.watch is True
+        assert parsed_args.expected_wells == ['A1', 'A2']
+        assert parsed_args.watch_timeout == 30
+
+
+def test_extract_od_watch_workflow():
+    with pytest.raises(ValueError):
+        pysero.extract_od(
+            input_dir='input_dir_name',
+            output_dir='output_dir_name',
+            workflow='array_interp',
+            watch=True,
+        )
 
 
 def test_parse_args_invalid_method():
@@ -57,6 +138,15 @@ def test_run_pysero_analyze(tmpdir_factory):
     args.analyze_od = True
     args.rerun = False
     args.load_report = True
+    args.workers = 1
+    args.seed = None
+    args.stats_format = 'csv'
+    args.stats_xlsx = True
+    args.report_formats = ['xlsx', 'csv']
+    args.profile = False
+    args.watch = False
+    args.expected_wells = None
+    args.watch_timeout = 600
     with pytest.raises(OSError):
         pysero.run_pysero(args)
     # Check that run path is created and log file is written
@@ -0,0 +1,88 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.transform.array_generation as array_gen
+import array_analyzer.utils.spot_table as spot_tab
+
+
+@pytest.fixture
+def spot_grid():
+    constants.params['rows'] = 3
+    constants.params['columns'] = 4
+    constants.params['spot_width'] = .1
+    constants.params['pixel_size'] = .005
+    np.random.seed(0)
+    im = .8 * np.ones((150, 200))
+    coords = []
+    for row in range(3):
+        for col in range(4):
+            coord = [30 + row * 45 + np.random.rand(),
+                     30 + col * 45 + np.random.rand()]
+            coords.append(coord)
+            # Leave one spot empty so it uses the disk mask
+            if row != 1 or col != 2:
+                cv.circle(im, (int(coord[1]), int(coord[0])), 6, .3, -1)
+    coords = np.array(coords)
+    # Move last spot close to image border so its ROI is truncated
+    coords[-1, :] = [140.3, 188.6]
+    cv.circle(im, (188, 140), 6, .3, -1)
+    im += .05 * np.random.rand(*im.shape)
+    background = .8 * np.ones_like(im)
+    return coords, im, background
+
+
+def test_get_spot_intensity(spot_grid):
+    coords, im, background = spot_grid
+    spots_df, spot_table = array_gen.get_spot_intensity(
+        coords=coords,
+        im=im,
+        background=background,
+        store_rois=True,
+    )
+    assert list(spots_df.columns) == constants.SPOT_DF_COLS
+    assert spots_df.shape == (12, len(constants.SPOT_DF_COLS))
+    assert len(spot_table) == 12
+    # Compare with processing spots one by one
+    spot_size = 2 * int(0.3 * .1 / .005) + 1
+    single_table = spot_tab.SpotTable(nbr_rows=3, nbr_cols=4)
+    for count in range(12):
+        roi = array_gen.get_single_spot_props(
+            spot_table=single_table,
+            idx=count,
+            coord=coords[count],
+            im=im,
+            background=background,
+            spot_size=spot_size,
+            disk_size=int(np.rint(spot_size / 2.5)),
+        )
+        image, _, mask = spot_table.get_roi(count)
+        np.testing.assert_array_equal(mask, roi[2] > 0)
+        np.testing.assert_array_equal(image, roi[0])
+    for col_name in constants.SPOT_DF_COLS:
+        np.testing.assert_allclose(
+            spots_df[col_name],
+            single_table[col_name],
+            rtol=1e-10,
+        )
+    # Spot without signal has OD close to zero
+    assert abs(spots_df.loc[6, 'od_norm']) < .05
+    assert spots_df.loc[0, 'od_norm'] > .3
+
+
+def test_get_spot_intensity_border(spot_grid):
+    coords, im, background = spot_grid
+    # Spot at image corner has truncated ROIs and no detectable mask
+    coords[0, :] = [2.2, 3.7]
+    spots_df, spot_table = array_gen.get_spot_intensity(
+        coords=coords,
+        im=im,
+        background=background,
+        store_rois=True,
+    )
+    assert spots_df.loc[0, 'centroid_row'] == 2.2
+    assert spots_df.loc[0, 'bbox_row_min'] == 0
+    image, background, mask = spot_table.get_roi(0)
+    assert image.shape == mask.shape
+    assert not np.isnan(spot_table['od_norm'][0])
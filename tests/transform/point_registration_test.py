@@ -1,3 +1,4 @@
+import cv2 as cv
 import numpy as np
 import pytest
 
@@ -18,6 +19,7 @@ def register_inst():
     }
     constants.SPOT_DIST_PIX = 10
     constants.NBR_PARTICLES = 100
+    constants.NBR_PARTICLES_MIN = 25
     constants.STDS = [1, 1, 1, 1]
 
     register_inst = registration.ParticleFilter(
@@ -63,6 +65,21 @@ def test_get_translation_matrix(register_inst):
     assert t_matrix[0, 1] == 2
 
 
+def test_transform_fiducials(register_inst):
+    particles = np.array([[20, 50, 90, 2],
+                          [0, 0, 0, 1],
+                          [-3.5, 7.2, 12.3, .95]])
+    trans_coords = register_inst.transform_fiducials(particles)
+    assert trans_coords.shape == (3, 3, 2)
+    for p, particle in enumerate(particles):
+        t_matrix = register_inst.get_translation_matrix(particle)
+        expected_coords = cv.transform(
+            np.array([register_inst.fiducial_coords]),
+            t_matrix,
+        )[0]
+        np.testing.assert_array_almost_equal(trans_coords[p], expected_coords)
+
+
 def test_particle_filter(register_inst):
     register_inst.particle_filter(max_iter=5)
     assert 3.5 < register_inst.registered_dist < 4
@@ -128,3 +145,142 @@ def test_check_reg_coords_already_false(register_inst):
     register_inst.registration_ok = False
     reg_ok = register_inst.check_reg_coords()
     assert reg_ok is False
+
+
+def test_particle_filter_iterations(register_inst):
+    register_inst.particle_filter(max_iter=5)
+    assert 1 <= register_inst.nbr_iterations <= 5
+    assert register_inst.converged_particles.shape == (100, 4)
+
+
+def test_particle_filter_adaptive(register_inst):
+    register_inst.particle_filter(max_iter=10, adaptive=True)
+    assert register_inst.registration_ok
+    # Easy fit, no need to add particles
+    assert register_inst.converged_particles.shape == (25, 4)
+
+
+def test_get_particle_spread(register_inst):
+    particles = np.zeros((20, 4))
+    dists = np.arange(20, dtype=np.float64)
+    # Best particles agree, worse ones are shifted by a spot distance
+    particles[10:, 0] = 10
+    assert register_inst.get_particle_spread(particles, dists) == 0
+    # Best particles are shifted by a spot distance from each other
+    particles[1, 1] = 10
+    assert register_inst.get_particle_spread(particles, dists) == .5
+
+
+def test_particle_filter_adaptive_grow(monkeypatch):
+    monkeypatch.setattr(constants, 'params', {'rows': 2, 'columns': 3})
+    monkeypatch.setattr(constants, 'SPOT_DIST_PIX', 10)
+    monkeypatch.setattr(constants, 'NBR_PARTICLES', 400)
+    monkeypatch.setattr(constants, 'NBR_PARTICLES_MIN', 100)
+    monkeypatch.setattr(constants, 'STDS', [20, 20, 0, 0])
+    # Spots on a lattice larger than the grid, fiducials fit at many shifts
+    spot_coords = np.array(
+        [[row, col] for row in range(0, 60, 10) for col in range(10, 100, 10)],
+    ).astype(np.float32)
+    register_inst = registration.ParticleFilter(
+        spot_coords=spot_coords,
+        im_shape=(50, 100),
+        fiducials_idx=[1, 3, 5],
+        random_seed=0,
+    )
+    register_inst.particle_filter(max_iter=30, adaptive=True)
+    # Ambiguous fit, particles grow to max number
+    assert register_inst.converged_particles.shape == (400, 4)
+    assert register_inst.registration_ok
+
+
+def test_particle_filter_reuse_particles(register_inst):
+    register_inst.particle_filter(max_iter=10)
+    register_inst.particle_filter(
+        max_iter=10,
+        nbr_outliers=5,
+        reuse_particles=True,
+    )
+    assert register_inst.registration_ok
+    assert 0 < register_inst.registered_dist < .5
+    assert register_inst.converged_particles.shape == (100, 4)
+
+
+def test_particle_prior():
+    constants.params = {
+        'rows': 2,
+        'columns': 3,
+    }
+    constants.SPOT_DIST_PIX = 10
+    constants.PRIOR_STDS = [.1, .1, .1, .01]
+    constants.NBR_PARTICLES_PRIOR = 50
+    register_inst = registration.ParticleFilter(
+        spot_coords=np.array([[20, 40], [20, 60], [30, 60]]).astype(np.float32),
+        im_shape=(50, 100),
+        fiducials_idx=[0, 2, 5],
+        random_seed=42,
+        particle_prior=np.array([5, -5, 1, 1.1]),
+    )
+    assert register_inst.particles.shape == (50, 4)
+    particle_means = np.mean(register_inst.particles, 0)
+    np.testing.assert_allclose(particle_means, [5, -5, 1, 1.1], atol=.1)
+    register_inst.particle_filter(max_iter=5)
+    assert register_inst.particle.shape == (4,)
+
+
+def test_fit_similarity_transform():
+    source = np.array([[0, 0], [10, 0], [0, 20], [15, 5]]).astype(np.float64)
+    t_matrix = registration.ParticleFilter.get_translation_matrix(
+        [3, -2, 10, 1.2],
+    )
+    target = registration.transform_coords(source, t_matrix)
+    fit_matrix = registration.fit_similarity_transform(source, target)
+    np.testing.assert_allclose(fit_matrix, t_matrix, atol=1e-10)
+
+
+def test_transform_coords():
+    coords = np.array([[1, 2], [3, 4], [5, 7]]).astype(np.float64)
+    t_matrix = registration.ParticleFilter.get_translation_matrix(
+        [5, 3, 30, .9],
+    )
+    trans_coords = registration.transform_coords(coords, t_matrix)
+    cv_coords = cv.transform(np.array([coords]), t_matrix)[0]
+    np.testing.assert_allclose(trans_coords, cv_coords, atol=1e-10)
+
+
+def test_icp():
+    source = np.array(
+        [[row, col] for row in range(0, 50, 10) for col in range(0, 60, 10)],
+    ).astype(np.float64)
+    t_matrix = registration.ParticleFilter.get_translation_matrix(
+        [2, -3, 2, 1.05],
+    )
+    # Targets are transformed source points in random order and an outlier
+    target = registration.transform_coords(source, t_matrix)
+    target = np.random.RandomState(0).permutation(target)
+    target = np.vstack([target, [[200, 200]]])
+    fit_matrix, residual = registration.icp(source, target)
+    assert residual < 1e-6
+    np.testing.assert_allclose(fit_matrix, t_matrix, atol=1e-6)
+
+
+def test_refine_registration(register_inst):
+    # Spots are fiducials transformed by a small shift, rotation and scale
+    t_matrix = register_inst.get_translation_matrix([2, -1, 1, 1.02])
+    register_inst.spot_coords = registration.transform_coords(
+        register_inst.fiducial_coords,
+        t_matrix,
+    )
+    register_inst.particle = np.array([0, 0, 0, 1.])
+    register_inst.t_matrix = register_inst.get_translation_matrix(
+        register_inst.particle,
+    )
+    residual_before, _, _ = register_inst.compute_residual()
+    residual_after = register_inst.refine_registration()
+    assert residual_after < residual_before
+    assert residual_after < 1e-6
+    np.testing.assert_allclose(register_inst.t_matrix, t_matrix, atol=1e-6)
+    np.testing.assert_allclose(
+        register_inst.particle,
+        [2, -1, 1, 1.02],
+        atol=1e-6,
+    )
@@ -11,6 +11,43 @@ def test_read_gray_im(image_dir):
     assert im_shape[1] == 10
 
 
+def test_read_gray_im_mmap(tmpdir_factory):
+    tifffile = pytest.importorskip('tifffile')
+    input_dir = tmpdir_factory.mktemp("tif_dir")
+    im = np.arange(50, dtype=np.uint16).reshape(5, 10)
+    im_path = os.path.join(input_dir, 'A1.tif')
+    tifffile.imwrite(im_path, im)
+    im_mmap = io_utils.read_gray_im(im_path, mmap=True)
+    assert isinstance(im_mmap, np.memmap)
+    np.testing.assert_array_equal(im_mmap, im)
+    # Crops of mapped image can be copied to memory
+    im_roi = io_utils.materialize_roi(im_mmap[1:3, 2:5])
+    assert not isinstance(im_roi, np.memmap)
+    np.testing.assert_array_equal(im_roi, im[1:3, 2:5])
+    # Without mmap, image is read into memory
+    im_read = io_utils.read_gray_im(im_path)
+    assert not isinstance(im_read, np.memmap)
+    np.testing.assert_array_equal(im_read, im)
+
+
+def test_read_gray_im_mmap_compressed(tmpdir_factory):
+    tifffile = pytest.importorskip('tifffile')
+    input_dir = tmpdir_factory.mktemp("tif_dir")
+    im = np.arange(50, dtype=np.uint16).reshape(5, 10)
+    im_path = os.path.join(input_dir, 'A1.tif')
+    tifffile.imwrite(im_path, im, compression='zlib')
+    # Compressed images can't be mapped and are read with OpenCV
+    im_read = io_utils.read_gray_im(im_path, mmap=True)
+    assert not isinstance(im_read, np.memmap)
+    np.testing.assert_array_equal(im_read, im)
+
+
+def test_read_gray_im_mmap_png(image_dir):
+    im = io_utils.read_gray_im(os.path.join(image_dir, 'A1.png'), mmap=True)
+    assert not isinstance(im, np.memmap)
+    assert im.shape == (5, 10)
+
+
 def test_no_im(image_dir):
     with pytest.raises(IOError):
         io_utils.read_gray_im(os.path.join(image_dir, 'no_im.png'))
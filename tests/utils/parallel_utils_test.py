@@ -0,0 +1,50 @@
+import array_analyzer.extract.constants as constants
+import array_analyzer.utils.parallel_utils as parallel_utils
+
+
+def square_well(well_name, value):
+    return well_name, value ** 2, constants.RANDOM_SEED
+
+
+def test_get_constants_state():
+    constants.RANDOM_SEED = 42
+    constants_state = parallel_utils.get_constants_state()
+    assert constants_state['RANDOM_SEED'] == 42
+    assert constants_state['LOG_NAME'] == constants.LOG_NAME
+    assert '__name__' not in constants_state
+
+
+def test_map_wells_serial():
+    constants.RANDOM_SEED = 3
+    well_args = [('A1', 1), ('A2', 2), ('B12', 3)]
+    results = list(parallel_utils.map_wells(square_well, well_args))
+    assert results == [('A1', 1, 3), ('A2', 4, 3), ('B12', 9, 3)]
+
+
+def test_map_wells_workers():
+    constants.RANDOM_SEED = 5
+    well_args = [('A{}'.format(i), i) for i in range(10)]
+    results = list(parallel_utils.map_wells(
+        square_well,
+        well_args,
+        nbr_workers=3,
+    ))
+    # Results are in input order and workers see main process constants
+    for i, result in enumerate(results):
+        assert result == ('A{}'.format(i), i ** 2, 5)
+
+
+def test_map_wells_executor():
+    constants.RANDOM_SEED = 7
+    executor = parallel_utils.make_executor(2)
+    # The same pool is reused for several calls
+    for batch_start in [0, 3]:
+        well_args = [('A{}'.format(i), i) for i in range(batch_start, batch_start + 3)]
+        results = list(parallel_utils.map_wells(
+            square_well,
+            well_args,
+            executor=executor,
+        ))
+        for i, result in zip(range(batch_start, batch_start + 3), results):
+            assert result == ('A{}'.format(i), i ** 2, 7)
+    executor.shutdown()
@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.utils.spot_table as spot_tab
+
+
+@pytest.fixture
+def spot_and_mask():
+    im_size = 51
+    sigma = 10
+    mu = 25
+    row, col = np.meshgrid(
+        np.linspace(0, im_size, im_size),
+        np.linspace(0, im_size, im_size),
+    )
+    im_spot = np.exp(-((row - mu) / sigma) ** 2 / 2 - ((col - mu) / sigma) ** 2 / 2)
+    # Invert for dark spot
+    im_spot = 1. - im_spot
+    mask_spot = (im_spot < .5).astype(np.uint8)
+    return im_spot, mask_spot
+
+
+def test_spot_table_init():
+    spot_table = spot_tab.SpotTable(nbr_rows=2, nbr_cols=3)
+    assert len(spot_table) == 6
+    np.testing.assert_array_equal(spot_table['grid_row'], [0, 0, 0, 1, 1, 1])
+    np.testing.assert_array_equal(spot_table['grid_col'], [0, 1, 2, 0, 1, 2])
+    assert np.all(np.isnan(spot_table['od_norm']))
+    assert spot_table['bbox_row_min'].dtype == np.int64
+    assert spot_table.roi_offsets is None
+
+
+def test_make_mask():
+    mask = spot_tab.make_mask(51)
+    assert mask.shape == (51, 51)
+    assert mask[0, 0] == 0
+    assert mask[25, 25] == 1
+
+
+def test_masked_stats():
+    ims = np.arange(18).reshape(2, 3, 3).astype(np.float64)
+    masks = np.zeros((2, 3, 3), dtype=bool)
+    masks[0, 0, :] = True
+    masks[1, :, 1] = True
+    means, medians = spot_tab.masked_stats(ims, masks)
+    np.testing.assert_array_equal(means, [1, 13])
+    np.testing.assert_array_equal(medians, [1, 13])
+
+
+def test_mask_bboxes(spot_and_mask):
+    _, mask_spot = spot_and_mask
+    centroids, bboxes = spot_tab.mask_bboxes(mask_spot[np.newaxis, ...])
+    assert 24 <= centroids[0, 0] <= 25
+    assert 24 <= centroids[0, 1] <= 25
+    np.testing.assert_array_equal(bboxes[0], [13, 13, 37, 37])
+
+
+def test_compute_stats(spot_and_mask):
+    im_spot, mask_spot = spot_and_mask
+    spot_table = spot_tab.SpotTable(nbr_rows=2, nbr_cols=3)
+    spot_table.compute_stats(
+        idxs=[4],
+        ims=im_spot[np.newaxis, ...],
+        backgrounds=np.zeros_like(im_spot)[np.newaxis, ...] + 0.5,
+        masks=mask_spot[np.newaxis, ...],
+    )
+    assert spot_table['intensity_median'][4] < 0.3
+    assert spot_table['bg_median'][4] == 0.5
+    assert spot_table['od_norm'][4] == np.log10(
+            0.5 / spot_table['intensity_median'][4],
+        )
+    assert np.isnan(spot_table['od_norm'][3])
+
+
+def test_compute_stats_zero_intensity():
+    spot_table = spot_tab.SpotTable(nbr_rows=1, nbr_cols=1)
+    spot_table.compute_stats(
+        idxs=[0],
+        ims=np.zeros((1, 3, 3)),
+        backgrounds=np.ones((1, 3, 3)),
+        masks=np.ones((1, 3, 3)),
+    )
+    assert spot_table['od_norm'][0] == 2.
+
+
+def test_generate_props_from_disk(spot_and_mask):
+    im_spot, _ = spot_and_mask
+    bg_spot = np.zeros_like(im_spot) + 0.5
+    spot_table = spot_tab.SpotTable(nbr_rows=1, nbr_cols=3)
+    bbox = [5, 10, 35, 45]
+    centroid = [25, 26]
+    rois = spot_table.generate_props_from_disk(
+        idxs=[2],
+        ims=im_spot[np.newaxis, ...],
+        backgrounds=bg_spot[np.newaxis, ...],
+        bboxes=np.array([bbox]),
+        centroids=np.array([centroid]),
+    )
+    assert spot_table['centroid_row'][2] == centroid[0]
+    assert spot_table['centroid_col'][2] == centroid[1]
+    assert spot_table['bbox_row_min'][2] == bbox[0]
+    assert spot_table['bbox_col_min'][2] == bbox[1]
+    assert spot_table['bbox_row_max'][2] == bbox[2]
+    assert spot_table['bbox_col_max'][2] == bbox[3]
+    assert spot_table['intensity_mean'][2] > 0
+    assert 0.8 < spot_table['intensity_median'][2] < 0.81
+    assert spot_table['bg_mean'][2] == 0.5
+    assert spot_table['bg_median'][2] == 0.5
+    # ROIs
+    image, background, mask = rois[0]
+    np.testing.assert_array_equal(image, im_spot)
+    np.testing.assert_array_equal(background, bg_spot)
+    np.testing.assert_array_equal(mask, spot_tab.make_mask(51))
+
+
+def test_generate_props_from_mask(spot_and_mask):
+    im_spot, mask_spot = spot_and_mask
+    spot_table = spot_tab.SpotTable(nbr_rows=3, nbr_cols=2)
+    bbox = [5, 10, 40, 45]
+    bg_spot = np.zeros_like(im_spot) + 1.
+    rois = spot_table.generate_props_from_mask(
+        idxs=[5],
+        ims=im_spot[np.newaxis, ...],
+        backgrounds=bg_spot[np.newaxis, ...],
+        masks=mask_spot[np.newaxis, ...],
+        bboxes=np.array([bbox]),
+    )
+    assert 29 <= spot_table['centroid_row'][5] <= 30
+    assert 34 <= spot_table['centroid_col'][5] <= 35
+    assert spot_table['bbox_row_min'][5] == 18
+    assert spot_table['bbox_col_min'][5] == 23
+    assert spot_table['bbox_row_max'][5] == 42
+    assert spot_table['bbox_col_max'][5] == 47
+    assert spot_table['intensity_mean'][5] == np.mean(im_spot[mask_spot > 0])
+    assert spot_table['intensity_median'][5] == np.median(im_spot[mask_spot > 0])
+    assert spot_table['bg_mean'][5] == 1.
+    assert spot_table['bg_median'][5] == 1.
+    assert spot_table['od_norm'][5] == np.log10(
+            1. / spot_table['intensity_median'][5],
+        )
+    # ROIs are cropped to mask bounding box
+    image, background, mask = rois[0]
+    np.testing.assert_array_equal(image, im_spot[13:37, 13:37])
+    np.testing.assert_array_equal(mask, mask_spot[13:37, 13:37])
+
+
+def test_pack_rois():
+    spot_table = spot_tab.SpotTable(nbr_rows=1, nbr_cols=2)
+    rois = [
+        (np.ones((2, 3)), np.zeros((2, 3)), np.eye(2, 3)),
+        (2 * np.ones((4, 4)), np.ones((4, 4)), np.ones((4, 4))),
+    ]
+    spot_table.pack_rois(rois)
+    np.testing.assert_array_equal(spot_table.roi_offsets, [0, 6, 22])
+    assert spot_table.roi_images.shape == (22,)
+    assert spot_table.roi_masks.dtype == bool
+    image, background, mask = spot_table.get_roi(1)
+    np.testing.assert_array_equal(image, rois[1][0])
+    np.testing.assert_array_equal(background, rois[1][1])
+    image, background, mask = spot_table.get_roi(0)
+    np.testing.assert_array_equal(mask, np.eye(2, 3) > 0)
+
+
+def test_get_roi_not_packed():
+    spot_table = spot_tab.SpotTable(nbr_rows=1, nbr_cols=2)
+    with pytest.raises(AssertionError):
+        spot_table.get_roi(0)
+
+
+def test_to_dataframe():
+    spot_table = spot_tab.SpotTable(nbr_rows=2, nbr_cols=2)
+    spots_df = spot_table.to_dataframe()
+    assert list(spots_df.columns) == constants.SPOT_DF_COLS
+    assert spots_df.shape == (4, len(constants.SPOT_DF_COLS))
+    assert spots_df['grid_col'].tolist() == [0, 1, 0, 1]
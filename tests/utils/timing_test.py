@@ -0,0 +1,74 @@
+import json
+import numpy as np
+import os
+import pickle
+import pytest
+
+import array_analyzer.utils.timing as timing
+
+
+def test_time_stage():
+    timer = timing.StageTimer('A1')
+    with timer.time_stage('read'):
+        pass
+    with timer.time_stage('registration'):
+        pass
+    with timer.time_stage('read'):
+        pass
+    assert list(timer.stage_times) == ['read', 'registration']
+    assert len(timer.stage_times['read']) == 2
+    assert all(t >= 0 for t in timer.stage_times['read'])
+
+
+def test_time_stage_exception():
+    timer = timing.StageTimer('A1')
+    with pytest.raises(ValueError):
+        with timer.time_stage('well_border'):
+            raise ValueError("No well")
+    assert len(timer.stage_times['well_border']) == 1
+
+
+def test_merge_pickled():
+    run_timer = timing.StageTimer('run')
+    run_timer.add_time('report', 1.)
+    well_timer = timing.StageTimer('B2')
+    well_timer.add_time('read', .5)
+    well_timer.add_time('report', .25)
+    # Well timers are returned from worker processes
+    run_timer.merge(pickle.loads(pickle.dumps(well_timer)))
+    assert run_timer.stage_times['report'] == [1., .25]
+    assert run_timer.stage_times['read'] == [.5]
+    assert run_timer.get_total() == 1.75
+
+
+def test_get_summary():
+    timer = timing.StageTimer('run')
+    for t in range(1, 101):
+        timer.add_time('spot_detection', float(t))
+    summary = timer.get_summary()['spot_detection']
+    assert summary['count'] == 100
+    assert summary['total'] == 5050.
+    assert summary['mean'] == 50.5
+    assert summary['p50'] == 50.5
+    np.testing.assert_almost_equal(summary['p95'], 95.05)
+
+
+def test_write_stage_times(tmpdir_factory):
+    output_dir = tmpdir_factory.mktemp("output_dir")
+    run_timer = timing.StageTimer('run')
+    well_timers = []
+    for well_name, read_time in zip(['A1', 'A2'], [1., 3.]):
+        well_timer = timing.StageTimer(well_name)
+        well_timer.add_time('read', read_time)
+        well_timers.append(well_timer)
+        run_timer.merge(well_timer)
+    stage_times_path = os.path.join(output_dir, 'stage_times.json')
+    timing.write_stage_times(stage_times_path, run_timer, well_timers, wall_time=5.)
+    with open(stage_times_path) as json_file:
+        stage_times = json.load(json_file)
+    assert stage_times['run']['wall_time'] == 5.
+    assert stage_times['run']['total'] == 4.
+    assert stage_times['run']['stages']['read']['count'] == 2
+    assert stage_times['run']['stages']['read']['p50'] == 2.
+    assert list(stage_times['wells']) == ['A1', 'A2']
+    assert stage_times['wells']['A2']['stages']['read']['total'] == 3.
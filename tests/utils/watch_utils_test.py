@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+import array_analyzer.utils.watch_utils as watch_utils
+
+
+def write_image(input_dir, well_name, nbr_bytes=10):
+    im_path = os.path.join(input_dir, well_name + '.png')
+    with open(im_path, 'wb') as im_file:
+        im_file.write(b'0' * nbr_bytes)
+    return im_path
+
+
+def test_get_plate_wells():
+    well_names = watch_utils.get_plate_wells()
+    assert len(well_names) == 96
+    assert well_names[:3] == ['A1', 'A2', 'A3']
+    assert well_names[-1] == 'H12'
+
+
+def test_poll(tmpdir):
+    a1_path = write_image(tmpdir, 'A1')
+    b2_path = write_image(tmpdir, 'B2')
+    # Well outside of plate isn't expected
+    write_image(tmpdir, 'P24')
+    watcher = watch_utils.WellImageWatcher(tmpdir, stable_time=0)
+    well_args = watcher.poll()
+    assert well_args == [('A1', a1_path), ('B2', b2_path)]
+    # Wells are only reported once
+    assert watcher.poll() == []
+    assert not watcher.is_complete()
+
+
+def test_poll_stable_time(tmpdir):
+    im_path = write_image(tmpdir, 'A1')
+    # Images being written are empty
+    write_image(tmpdir, 'A2', nbr_bytes=0)
+    watcher = watch_utils.WellImageWatcher(
+        tmpdir,
+        expected_wells=['A1', 'A2'],
+        stable_time=.1,
+    )
+    # Image must be unchanged for stable time
+    assert watcher.poll() == []
+    time.sleep(.15)
+    assert watcher.poll() == [('A1', im_path)]
+    assert watcher.done_wells == {'A1'}
+
+
+def test_watch(tmpdir):
+    write_image(tmpdir, 'A1')
+    write_image(tmpdir, 'A2')
+    watcher = watch_utils.WellImageWatcher(
+        tmpdir,
+        expected_wells=['A1', 'A2'],
+        poll_interval=.01,
+        stable_time=0,
+    )
+    well_batches = list(watcher.watch())
+    assert len(well_batches) == 1
+    assert [args[0] for args in well_batches[0]] == ['A1', 'A2']
+    assert watcher.is_complete()
+
+
+def test_watch_timeout(tmpdir):
+    write_image(tmpdir, 'A1')
+    watcher = watch_utils.WellImageWatcher(
+        tmpdir,
+        expected_wells=['A1', 'A2'],
+        poll_interval=.01,
+        stable_time=0,
+        timeout=.05,
+    )
+    well_batches = list(watcher.watch())
+    assert [[args[0] for args in batch] for batch in well_batches] == [['A1']]
+    assert not watcher.is_complete()
+
+
+def test_watch_slow_processing(tmpdir):
+    write_image(tmpdir, 'A1')
+    watcher = watch_utils.WellImageWatcher(
+        tmpdir,
+        expected_wells=['A1', 'A2'],
+        poll_interval=.01,
+        stable_time=.05,
+        timeout=.1,
+    )
+    well_names = []
+    for well_args in watcher.watch():
+        well_names.extend([args[0] for args in well_args])
+        if well_names == ['A1']:
+            # A2 is written while A1 is processed for longer than the timeout
+            write_image(tmpdir, 'A2')
+            time.sleep(.3)
+    assert well_names == ['A1', 'A2']
+    assert watcher.is_complete()
+
+
+
+def test_watch_image_being_written(tmpdir):
+    def write_slowly():
+        for nbr_bytes in range(1, 11):
+            write_image(tmpdir, 'A1', nbr_bytes=nbr_bytes)
+            time.sleep(.03)
+
+    watcher = watch_utils.WellImageWatcher(
+        tmpdir,
+        expected_wells=['A1'],
+        poll_interval=.01,
+        stable_time=.05,
+        timeout=.1,
+    )
+    writer = threading.Thread(target=write_slowly)
+    writer.start()
+    # Image keeps changing for longer than the timeout
+    well_batches = list(watcher.watch())
+    writer.join()
+    assert [[args[0] for args in batch] for batch in well_batches] == [['A1']]
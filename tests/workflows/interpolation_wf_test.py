@@ -0,0 +1,50 @@
+import copy
+import pandas as pd
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.extract.metadata as metadata
+import array_analyzer.utils.io_utils as io_utils
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.workflows.interpolation_wf as interpolation_wf
+
+
+@pytest.fixture
+def synthetic_run(synthetic_plate_dir, tmpdir_factory):
+    """
+    Set constants from the synthetic plate metadata as in a run, and
+    restore them afterwards.
+
+    :return list well_args: (well name, image path) of the first wells
+    """
+    constants_state = copy.deepcopy(parallel_utils.get_constants_state())
+    constants.RUN_PATH = str(tmpdir_factory.mktemp("interp_run"))
+    constants.DEBUG = False
+    constants.METADATA_FILE = 'pysero_output_data_metadata.xlsx'
+    metadata.MetaData(str(synthetic_plate_dir), constants.RUN_PATH)
+    # Find wells on downsampled images to keep the test fast
+    constants.params['well_downsample'] = 8
+    well_images = io_utils.get_image_paths(str(synthetic_plate_dir))
+    yield list(well_images.items())[:2]
+    for name, value in constants_state.items():
+        setattr(constants, name, value)
+
+
+def test_interp_well_parallel(synthetic_run):
+    serial_results = list(parallel_utils.map_wells(
+        well_fn=interpolation_wf.interp_well,
+        well_args=synthetic_run,
+    ))
+    parallel_results = list(parallel_utils.map_wells(
+        well_fn=interpolation_wf.interp_well,
+        well_args=synthetic_run,
+        nbr_workers=2,
+    ))
+    assert len(parallel_results) == len(synthetic_run)
+    for (serial_df, _), (parallel_df, well_timer) in zip(serial_results, parallel_results):
+        assert serial_df['od_norm'].notna().sum() == \
+            constants.params['rows'] * constants.params['columns']
+        pd.testing.assert_frame_equal(parallel_df, serial_df)
+    # Results are collected in well order
+    assert [well_timer.name for _, well_timer in parallel_results] == \
+        [well_name for well_name, _ in synthetic_run]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import time
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.workflows.registration_workflow as registration_wf
+
+
+def fake_register_well(well_name, im_path, particle_prior=None, well_prior=None):
+    """
+    Stand in for register_well returning the priors it was given, with a
+    transform and well geometry given by the well number. The second well
+    is slow so wells finish out of order.
+    """
+    reg_stats = registration_wf.init_reg_stats(well_name)
+    well_nbr = int(well_name[1:])
+    if well_nbr == 2:
+        time.sleep(.2)
+    reg_stats.update({'x': well_nbr, 'y': 0, 'angle': 0, 'scale': 1})
+    reg_stats.update({'well_row': well_nbr, 'well_col': 0, 'well_radius': 100})
+    reg_stats['registration_ok'] = True
+    return (particle_prior, well_prior), reg_stats, None
+
+
+@pytest.fixture
+def fake_registration(monkeypatch):
+    monkeypatch.setattr(registration_wf, 'register_well', fake_register_well)
+    monkeypatch.setitem(constants.params, 'well_downsample', 4)
+
+
+def test_get_plate_priors():
+    particle_prior, well_prior = registration_wf.get_plate_priors([], [])
+    assert particle_prior is None
+    assert well_prior is None
+    particle_prior, well_prior = registration_wf.get_plate_priors(
+        [[1, 2, 0, 1], [3, 4, 0, 1], [20, 6, 0, 1]],
+        [],
+    )
+    np.testing.assert_array_equal(particle_prior, [3, 4, 0, 1])
+
+
+def test_register_wells_plate_prior(fake_registration):
+    well_args = [('A{}'.format(i), 'A{}.png'.format(i)) for i in range(1, 5)]
+    reg_particles = []
+    results = list(registration_wf.register_wells_plate_prior(
+        well_args=well_args,
+        reg_particles=reg_particles,
+    ))
+    assert [result[1]['well_name'] for result in results] == ['A1', 'A2', 'A3', 'A4']
+    # First well has no prior, later wells the median of previous wells
+    assert results[0][0] == (None, None)
+    particle_prior, well_prior = results[3][0]
+    np.testing.assert_array_equal(particle_prior, [2, 0, 0, 1])
+    assert well_prior == ([2, 0], 100)
+    assert len(reg_particles) == 4
+
+
+def test_register_wells_plate_prior_executor(fake_registration):
+    well_args = [('A{}'.format(i), 'A{}.png'.format(i)) for i in range(1, 7)]
+    executor = parallel_utils.make_executor(2)
+    results = list(registration_wf.register_wells_plate_prior(
+        well_args=well_args,
+        nbr_workers=2,
+        executor=executor,
+    ))
+    executor.shutdown()
+    # Results are in well order
+    assert [result[1]['well_name'] for result in results] == \
+        ['A{}'.format(i) for i in range(1, 7)]
+    # Wells submitted while the first two run have no prior
+    assert results[0][0] == (None, None)
+    assert results[1][0] == (None, None)
+    # Later wells use the median of wells two or more positions earlier,
+    # however long each well takes
+    for well_idx, result in enumerate(results[2:], start=2):
+        particle_prior, well_prior = result[0]
+        expected_x = np.median(np.arange(1, well_idx))
+        np.testing.assert_array_equal(particle_prior, [expected_x, 0, 0, 1])
+        assert well_prior == ([expected_x, 0], 100)
@@ -0,0 +1,45 @@
+import copy
+import numpy as np
+import pytest
+
+import array_analyzer.extract.constants as constants
+import array_analyzer.utils.io_utils as io_utils
+import array_analyzer.utils.parallel_utils as parallel_utils
+import array_analyzer.workflows.well_wf as well_wf
+
+
+@pytest.fixture
+def well_args(synthetic_plate_dir, tmpdir_factory):
+    """
+    Set run constants and restore them afterwards.
+
+    :return list well_args: (well name, image path) of the first wells
+    """
+    constants_state = copy.deepcopy(parallel_utils.get_constants_state())
+    constants.RUN_PATH = str(tmpdir_factory.mktemp("well_run"))
+    constants.DEBUG = False
+    well_images = io_utils.get_image_paths(str(synthetic_plate_dir))
+    yield list(well_images.items())[:3]
+    for name, value in constants_state.items():
+        setattr(constants, name, value)
+
+
+@pytest.mark.parametrize('method', ['segmentation', 'crop'])
+def test_well_intensity_parallel(well_args, method):
+    well_args = [(well_name, im_path, method) for well_name, im_path in well_args]
+    serial_results = list(parallel_utils.map_wells(
+        well_fn=well_wf.well_intensity,
+        well_args=well_args,
+    ))
+    parallel_results = list(parallel_utils.map_wells(
+        well_fn=well_wf.well_intensity,
+        well_args=well_args,
+        nbr_workers=2,
+    ))
+    serial_intensities = [int_well for int_well, _ in serial_results]
+    parallel_intensities = [int_well for int_well, _ in parallel_results]
+    assert np.all(np.isfinite(serial_intensities))
+    assert parallel_intensities == serial_intensities
+    # Results are collected in well order
+    assert [well_timer.name for _, well_timer in parallel_results] == \
+        [args[0] for args in well_args]